@@ -0,0 +1,26 @@
+import jwt
+
+import config
+from common.auth_utils import ADMIN_TOKEN, bearer_token, verify_token
+
+# The /admin/* routes show upstream addresses, tenants and limits, so only
+# operators may read them: with a token of type "admin" signed with
+# ADMIN_SECRET_KEY, as printed by config-service's `flask admin-token`.
+
+
+def admin_denied(headers):
+    """None if the request carries an operator token, else (error message, status)."""
+    if not config.ADMIN_SECRET_KEY or config.ADMIN_SECRET_KEY == config.JWT_SECRET_KEY:
+        return "Admin API is disabled: CONFIG_ADMIN_SECRET_KEY is not set", 503
+    token = bearer_token(headers)
+    if token is None:
+        return "Token is missing!", 401
+    try:
+        claims = verify_token(token, config.ADMIN_SECRET_KEY)
+    except jwt.ExpiredSignatureError:
+        return "Token has expired!", 401
+    except jwt.InvalidTokenError:
+        return "Invalid token!", 401
+    if claims.get("type") != ADMIN_TOKEN or claims.get("role") != "admin":
+        return "Insufficient permissions", 403
+    return None
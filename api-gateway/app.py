@@ -1,7 +1,10 @@
 import requests
+import config
 from flask import Flask
 from werkzeug.exceptions import MethodNotAllowed, HTTPException
 from routes import gateway_bp
+from balancer import balancer
+from common.http_client import init_deadline
 from common.error_handlers import method_not_allowed_handler, http_exception_handler, unexpected_error_handler, \
     service_unavailable_handler, bad_request_handler
 
@@ -9,6 +12,12 @@ def create_app():
     """Factory function to create and configure the Flask app."""
     app = Flask(__name__)
 
+    # Honour a shorter deadline requested by the client
+    init_deadline(app)
+
+    # Load upstream instances and start health checking them
+    balancer.start()
+
     # Register the Blueprint
     app.register_blueprint(gateway_bp, url_prefix="/")
 
@@ -26,5 +35,11 @@ def register_error_handlers(app):
     app.register_error_handler(Exception, unexpected_error_handler)
 
 if __name__ == "__main__":
-    app = create_app()
-    app.run(host="0.0.0.0", port=5000)
+    if config.GATEWAY_MODE == "async":
+        # ASGI server for the async gateway (asgi.py)
+        import uvicorn
+        uvicorn.run("asgi:app", host="0.0.0.0", port=config.API_GATEWAY_PORT,
+                    workers=config.GATEWAY_WORKERS, backlog=4096)
+    else:
+        app = create_app()
+        app.run(host="0.0.0.0", port=config.API_GATEWAY_PORT)
@@ -0,0 +1,442 @@
+import contextlib
+import functools
+import http
+import logging
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import config
+from common.error_handlers import (
+    bad_request_body,
+    http_exception_body,
+    method_not_allowed_body,
+    service_unavailable_body,
+    gateway_timeout_body,
+    too_many_requests_body,
+    internal_error_body
+)
+from common.utils import validate_tenant_id
+from common.http_client import DEADLINE_HEADER, NO_COOKIES, http_client, request_budget
+from streaming import BodyTooLarge, forwardable_headers, declared_length, has_body, limited_async_body
+from balancer import balancer, NoAvailableEndpoint
+from breaker import breakers, CircuitOpen, FAILURE_STATUSES
+from http_cache import http_cache, CONDITIONAL_HEADERS
+from coalescing import AsyncSingleflight, Unshared, flight_key, bufferable
+from rate_limit import rate_limiter, client_id
+from concurrency import limiters, priority, Overloaded, OVERLOAD_STATUSES
+from batch import Batch, BatchError, parse_batch, run_async, sub_request_headers
+from admin import admin_denied
+
+# Async serving mode of the gateway (GATEWAY_MODE=async). It keeps the routing
+# contract, SERVICE_MAP, tenant validation and error bodies of the Flask app in
+# routes.py, but an in-flight upstream call only holds a coroutine, so one
+# worker can proxy tens of thousands of requests at once.
+
+logger = logging.getLogger("api-gateway")
+
+METHODS = ["GET", "POST", "PUT", "DELETE", "PATCH"]
+
+singleflight = AsyncSingleflight()
+
+
+async def gateway(request):
+    service = request.path_params["service"]
+    endpoint = request.path_params["endpoint"]
+    try:
+        tenant_id = validate_tenant_id(request.headers)
+    except ValueError as e:
+        logger.warning(f"Bad Request: {str(e)}")
+        return JSONResponse(bad_request_body(e), status_code=400)
+
+    logger.info(f"Tenant ID: {tenant_id} | Service: {service} | Endpoint: {endpoint} - Request received")
+
+    decision = await rate_limiter.check_async(tenant_id, client_id(request.headers, request.client.host if request.client else None))
+    if decision is not None and not decision.allowed:
+        logger.warning(f"Rate limited tenant: {tenant_id} | Service: {service} | Endpoint: {endpoint} - {str(decision)}")
+        return JSONResponse(too_many_requests_body(decision), status_code=429, headers=decision.headers())
+
+    try:
+        response = await handle_request(service, endpoint, tenant_id, request)
+        if decision is not None:
+            response.headers.update(decision.headers())
+        return response
+
+    except BodyTooLarge as e:
+        logger.warning(f"Rejected request to service: {service}, endpoint: {endpoint} - {str(e)}")
+        return JSONResponse(http_exception_body("Request Entity Too Large", 413, e), status_code=413)
+
+    except CircuitOpen as e:
+        logger.warning(f"Rejected request to service: {service}, endpoint: {endpoint} - {str(e)}")
+        return JSONResponse(service_unavailable_body(e), status_code=503, headers={"Retry-After": str(e.retry_after)})
+
+    except Overloaded as e:
+        logger.warning(f"Shed request to service: {service}, endpoint: {endpoint} - {str(e)}")
+        return JSONResponse(service_unavailable_body(e), status_code=503, headers={"Retry-After": str(e.retry_after)})
+
+    except NoAvailableEndpoint as e:
+        logger.error(f"No instance available for service: {service} - {str(e)}")
+        return JSONResponse(service_unavailable_body(e), status_code=503)
+
+    except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+        logger.error(f"Connection error while trying to reach service: {service}, endpoint: {endpoint} - {str(e)}")
+        return JSONResponse(service_unavailable_body(e), status_code=503)
+
+    except httpx.TimeoutException as e:
+        logger.warning(f"Request to service: {service}, endpoint: {endpoint} timed out - {str(e)}")
+        return JSONResponse(gateway_timeout_body(str(e) or "Upstream request timed out"), status_code=504)
+
+    except Exception as e:
+        logger.exception(f"Unexpected error occurred while processing request: {str(e)}")
+        return JSONResponse(internal_error_body(), status_code=500)
+
+
+async def batch(request):
+    """Run several gateway requests concurrently and stream their results as NDJSON (see batch.py)."""
+    try:
+        tenant_id = validate_tenant_id(request.headers)
+    except ValueError as e:
+        logger.warning(f"Bad Request: {str(e)}")
+        return JSONResponse(bad_request_body(e), status_code=400)
+    data = b""
+    async for chunk in request.stream():
+        data += chunk
+        # One byte over the limit is enough to tell the body is too large
+        if len(data) > config.BATCH_MAX_BODY_BYTES:
+            break
+    try:
+        items, timeout = parse_batch(data, balancer.services())
+    except BatchError as e:
+        logger.warning(f"Bad Request: {str(e)}")
+        return JSONResponse(bad_request_body(e), status_code=400)
+
+    # One deadline for the whole batch
+    budget = min(timeout or config.UPSTREAM_TIMEOUT, config.UPSTREAM_TIMEOUT)
+    if request_budget(request.headers) is not None:
+        budget = min(budget, request_budget(request.headers))
+    deadline = time.monotonic() + budget
+    logger.info(f"Tenant ID: {tenant_id} | Batch of {len(items)} requests received")
+
+    # Through the gateway's own app, so a sub-request is handled exactly like
+    # the same request sent on its own (and from the same client address)
+    peer = (request.client.host, request.client.port) if request.client else ("127.0.0.1", 0)
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=request.app, client=peer),
+        base_url="http://api-gateway",
+        timeout=None,
+    )
+    batch_headers = request.headers.items()
+
+    async def dispatch(sub_request, deadline):
+        method, path, query, headers, body = sub_request
+        response = await client.request(
+            method,
+            path,
+            params=query,
+            headers=sub_request_headers(tenant_id, batch_headers, headers, deadline - time.monotonic()),
+            json=body,
+        )
+        return response.status_code, response.headers.multi_items(), response.content
+
+    async def results():
+        try:
+            async for line in run_async(Batch(items, deadline), dispatch):
+                yield line
+        finally:
+            await client.aclose()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+async def health(request):
+    return PlainTextResponse("OK", status_code=200)
+
+
+def admin_required(endpoint):
+    """Only operators may call an /admin/* route (see admin.py)."""
+    @functools.wraps(endpoint)
+    async def decorated(request):
+        denied = admin_denied(request.headers)
+        if denied is not None:
+            message, status = denied
+            return JSONResponse({"error": message}, status_code=status)
+        return await endpoint(request)
+    return decorated
+
+
+@admin_required
+async def upstreams(request):
+    """Per-instance health, ejections, load and latency of every upstream service."""
+    return JSONResponse(balancer.stats(), status_code=200)
+
+
+@admin_required
+async def cache_stats(request):
+    """Hit rates, revalidations and memory use of the gateway response cache."""
+    return JSONResponse(http_cache.stats(), status_code=200)
+
+
+@admin_required
+async def coalescing_stats(request):
+    """How many requests shared another request's upstream call."""
+    return JSONResponse(singleflight.stats(), status_code=200)
+
+
+@admin_required
+async def rate_limits(request):
+    """Admitted and rejected requests, default limits and the tenant limit cache."""
+    return JSONResponse(rate_limiter.stats(), status_code=200)
+
+
+@admin_required
+async def concurrency(request):
+    """Adaptive concurrency limit, queue and shed requests per upstream service."""
+    return JSONResponse(limiters.stats(), status_code=200)
+
+
+@admin_required
+async def circuits(request):
+    """Circuit breaker state per upstream and the retry budget per upstream host."""
+    return JSONResponse({"circuits": breakers.stats(), "retry_budgets": http_client.retry_budget_stats()}, status_code=200)
+
+
+def raw_headers(headers):
+    return [(key.encode("latin-1"), value.encode("latin-1")) for key, value in headers]
+
+
+def from_cache(entry, client_request, label):
+    status, headers, body = entry.response(client_request.headers, label)
+    if status == 304:
+        http_cache.count("not_modified")
+    cached = Response(body, status_code=status)
+    cached.raw_headers = raw_headers(headers)
+    return cached
+
+
+async def handle_request(service, endpoint, tenant_id, client_request):
+    # Cacheable GETs are served from the gateway cache while the copy there is fresh
+    cache_key = http_cache.key(client_request.method, tenant_id, service, endpoint,
+                               client_request.query_params.multi_items(), client_request.headers)
+    entry = http_cache.lookup(cache_key, client_request.headers) if cache_key else None
+    if entry is not None and entry.fresh(client_request.headers):
+        http_cache.count("hits")
+        return from_cache(entry, client_request, "HIT")
+
+    headers = dict(forwardable_headers(client_request.headers, exclude=("host", "x-tenant-id", DEADLINE_HEADER.lower())))
+    headers["X-Tenant-ID"] = tenant_id
+    if cache_key:
+        # The gateway answers the client's conditional headers itself, and
+        # revalidates its own copy instead
+        headers = {name: value for name, value in headers.items() if name.lower() not in CONDITIONAL_HEADERS}
+        if entry is not None:
+            headers.update(entry.validators())
+
+    # The gateway starts the deadline; a client may only ask for a shorter one
+    budget = config.UPSTREAM_TIMEOUT
+    client_budget = request_budget(client_request.headers)
+    client_bound = client_budget is not None and client_budget < budget
+    if client_bound:
+        budget = client_budget
+    if budget <= 0:
+        raise httpx.TimeoutException("Deadline exceeded before calling upstream")
+    headers[DEADLINE_HEADER] = str(int(budget * 1000))
+
+    # Stream the request body upstream instead of buffering it
+    length = declared_length(client_request.headers)
+    content = limited_async_body(client_request.stream()) if has_body(client_request.headers, length) else None
+
+    call = functools.partial(proxy, service, endpoint, tenant_id, client_request, headers, content, budget, client_bound,
+                             cache_key, entry)
+
+    # Identical concurrent GETs on opted-in routes share one upstream call, on
+    # the gateway's own deadline: a client with a shorter one may wait for a
+    # call in flight (as long as its deadline allows) but never starts one
+    key = flight_key(client_request.method, tenant_id, service, endpoint,
+                     client_request.query_params.multi_items(), headers, content is not None)
+    if key is None:
+        outcome = await call(shared=False)
+    else:
+        try:
+            outcome, leader = await singleflight.do(key, lambda: call(shared=True), timeout=budget,
+                                                    lead=not client_bound)
+        except TimeoutError as e:
+            raise httpx.TimeoutException(str(e))
+        if outcome is None:
+            outcome = await call(shared=False)
+        elif isinstance(outcome, Unshared) and not leader:
+            # The leader's response could not be shared (e.g. too large); fetch our own
+            singleflight.unshared()
+            outcome = await call(shared=False)
+    return outcome.response if isinstance(outcome, Unshared) else outcome(client_request)
+
+
+async def proxy(service, endpoint, tenant_id, client_request, headers, content, budget, client_bound, cache_key, entry,
+                shared):
+    """
+    Make the upstream call for a request. Returns a function building the
+    response for any request sharing the call, or Unshared(response) when the
+    response can only be streamed to the request that made the call.
+    `client_bound` says the budget is the client's, shorter than the gateway's own.
+    """
+    # Fail fast while the upstream is known to be failing
+    ticket = breakers.acquire(service, tenant_id)
+    queued_at = time.monotonic()
+    try:
+        # Wait for a slot under the upstream's concurrency limit, or be shed
+        slot = await limiters.acquire_async(service, priority(client_request.method, service, endpoint),
+                                            queued_at + budget)
+    except BaseException:
+        breakers.release(ticket, 0, success=None)
+        raise
+    try:
+        instance = balancer.acquire(service)
+    except BaseException:
+        limiters.release(slot)
+        breakers.release(ticket, 0, success=None)
+        raise
+    url = f"{instance.url}/{endpoint}"
+    started = time.monotonic()
+    try:
+        logger.info(f"Making request to: {url}")
+        client = client_request.app.state.http_client
+        upstream_request = client.build_request(
+            method=client_request.method,
+            url=url,
+            headers=headers,
+            content=content,
+            params=client_request.query_params.multi_items(),
+            timeout=max(budget - (time.monotonic() - queued_at), 0.001),
+        )
+        response = await client.send(upstream_request, stream=True)
+    except httpx.TransportError as e:
+        if client_bound and isinstance(e, httpx.TimeoutException) and time.monotonic() - queued_at >= budget:
+            # The client's short deadline ran out: says nothing about the upstream
+            balancer.release(service, instance, time.monotonic() - started, success=None)
+            breakers.release(ticket, time.monotonic() - started, success=None)
+            limiters.release(slot)
+        else:
+            balancer.release(service, instance, time.monotonic() - started, success=False)
+            breakers.release(ticket, time.monotonic() - started, success=False)
+            limiters.release(slot, time.monotonic() - started, dropped=True)
+        raise
+    except BaseException:
+        # Not the instance's fault (e.g. the client body was too large)
+        balancer.release(service, instance, time.monotonic() - started, success=None)
+        breakers.release(ticket, time.monotonic() - started, success=None)
+        limiters.release(slot)
+        raise
+
+    # Latency is time to response headers; the instance stays busy until the body is sent
+    latency = time.monotonic() - started
+    logger.info(f"Received response: {response.status_code} from service: {service}, endpoint: {endpoint}")
+
+    async def finish():
+        await response.aclose()
+        balancer.release(service, instance, latency, success=response.status_code not in FAILURE_STATUSES)
+        breakers.release(ticket, latency, success=response.status_code not in FAILURE_STATUSES)
+        limiters.release(slot, latency, dropped=response.status_code in OVERLOAD_STATUSES)
+
+    async def read_body():
+        try:
+            return b"".join([chunk async for chunk in response.aiter_raw()])
+        finally:
+            await finish()
+
+    if cache_key:
+        if entry is not None and response.status_code == 304:
+            await finish()
+            http_cache.revalidated(entry, response.headers)
+            return lambda request: from_cache(entry, request, "REVALIDATED")
+        http_cache.count("misses")
+        if http_cache.storable(response.status_code, response.headers, client_request.headers):
+            stored = http_cache.store(cache_key, client_request.headers, response.status_code,
+                                      forwardable_headers(response.headers), await read_body(),
+                                      response.headers.get("Vary", ""))
+            return lambda request: from_cache(stored, request, "MISS")
+    elif client_request.method != "GET" and response.status_code < 400:
+        # A successful write makes cached copies of the URL stale
+        http_cache.invalidate(tenant_id, service, endpoint)
+
+    if shared and bufferable(response.headers):
+        status, response_headers, data = response.status_code, forwardable_headers(response.headers), await read_body()
+
+        def buffered(request):
+            shared_response = Response(data, status_code=status)
+            shared_response.raw_headers = raw_headers(response_headers)
+            return shared_response
+        return buffered
+
+    # Raw bytes, so Content-Encoding and Content-Length stay valid
+    streamed = StreamingResponse(
+        response.aiter_raw(config.STREAM_CHUNK_SIZE),
+        status_code=response.status_code,
+        background=BackgroundTask(finish),
+    )
+    # Set raw headers directly so repeated headers (Set-Cookie) are kept
+    streamed.raw_headers = raw_headers(forwardable_headers(response.headers))
+    return Unshared(streamed, discard=finish)
+
+
+async def http_exception_handler(request, exc):
+    if exc.status_code == 405:
+        return JSONResponse(method_not_allowed_body(), status_code=405)
+    name = http.HTTPStatus(exc.status_code).phrase
+    return JSONResponse(http_exception_body(name, exc.status_code, exc.detail), status_code=exc.status_code)
+
+
+async def unexpected_error_handler(request, exc):
+    logger.critical(f"Unexpected Error: {str(exc)}")
+    return JSONResponse(internal_error_body(), status_code=500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Load upstream instances and start health checking them
+    balancer.start()
+    # One pooled client per worker, shared by every in-flight request
+    app.state.http_client = httpx.AsyncClient(
+        timeout=config.UPSTREAM_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=config.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=config.UPSTREAM_MAX_KEEPALIVE,
+        ),
+    )
+    # Clients' cookies are forwarded in headers; never keep an upstream's for the next request
+    app.state.http_client.cookies.jar.set_policy(NO_COOKIES)
+    try:
+        yield
+    finally:
+        await app.state.http_client.aclose()
+
+
+def create_asgi_app():
+    """Factory function to create the ASGI gateway app."""
+    app = Starlette(
+        routes=[
+            Route("/health", health, methods=["GET"]),
+            Route("/batch", batch, methods=["POST"]),
+            Route("/admin/upstreams", upstreams, methods=["GET"]),
+            Route("/admin/circuits", circuits, methods=["GET"]),
+            Route("/admin/cache", cache_stats, methods=["GET"]),
+            Route("/admin/coalescing", coalescing_stats, methods=["GET"]),
+            Route("/admin/rate-limits", rate_limits, methods=["GET"]),
+            Route("/admin/concurrency", concurrency, methods=["GET"]),
+            Route("/{service}/{endpoint:path}", gateway, methods=METHODS),
+        ],
+        exception_handlers={
+            HTTPException: http_exception_handler,
+            Exception: unexpected_error_handler,
+        },
+        lifespan=lifespan,
+    )
+    # Match Flask: unknown paths are 404s, not redirects
+    app.router.redirect_slashes = False
+    return app
+
+
+app = create_asgi_app()
@@ -0,0 +1,270 @@
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit, urlunsplit
+
+import config
+from common.http_client import http_client
+
+logger = logging.getLogger("api-gateway")
+
+# Weight of the newest sample in the latency moving average
+EWMA_ALPHA = 0.2
+LATENCY_SAMPLES = 256
+
+
+class NoAvailableEndpoint(Exception):
+    """Raised when a service has no endpoints at all."""
+
+
+class Endpoint:
+    """One instance of an upstream service, with its load and health state."""
+
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ewma_latency = None
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.healthy = True
+        self.failed_checks = 0
+        self.ejected_until = 0
+        self.ejections = 0
+
+    def available(self, now):
+        return self.healthy and self.ejected_until <= now
+
+    def load(self):
+        # Outstanding requests first; latency breaks ties between equally busy instances
+        return self.outstanding, self.ewma_latency or 0
+
+    def stats(self, now):
+        samples = sorted(self.latencies)
+
+        def percentile(p):
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 1)
+
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "ejected": self.ejected_until > now,
+            "ejections": self.ejections,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_ms": {
+                "ewma": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+            },
+        }
+
+
+class LoadBalancer:
+    """
+    Client-side load balancing across the instances of each service.
+
+    Picks instances with power-of-two-choices on outstanding requests, and
+    only among instances that pass active health checks and have not been
+    ejected by passive outlier detection (consecutive failures). Endpoints
+    come from config.SERVICE_MAP, optionally overridden by SERVICE_MAP_FILE
+    and expanded through DNS; both are re-read in the background, keeping
+    the stats of instances that remain.
+    """
+
+    def __init__(self):
+        self._services = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._map_mtime = None
+
+    def start(self):
+        """Load the endpoints and start background discovery and health checks (once per process)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._background_loop, daemon=True)
+        self.reload()
+        self._thread.start()
+
+    # Discovery
+
+    def _service_map(self):
+        service_map = config.SERVICE_MAP
+        if config.SERVICE_MAP_FILE:
+            mtime = os.path.getmtime(config.SERVICE_MAP_FILE)
+            with open(config.SERVICE_MAP_FILE) as f:
+                service_map = json.load(f)
+            self._map_mtime = mtime
+        return {
+            service: [urls] if isinstance(urls, str) else list(urls)
+            for service, urls in service_map.items()
+        }
+
+    def _resolve(self, url):
+        """With DNS discovery, one endpoint per address the host name resolves to."""
+        if config.SERVICE_DISCOVERY != "dns":
+            return [url]
+        parts = urlsplit(url)
+        try:
+            infos = socket.getaddrinfo(parts.hostname, parts.port or 80, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            logger.warning(f"Could not resolve {parts.hostname}: {str(e)}")
+            return [url]
+        addresses = sorted({info[4][0] for info in infos})
+        return [
+            urlunsplit(parts._replace(netloc=f"{address}:{parts.port}" if parts.port else address))
+            for address in addresses
+        ]
+
+    def reload(self):
+        """Re-read the service map (and DNS), keeping the state of endpoints that did not change."""
+        try:
+            service_map = self._service_map()
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load service map, keeping the current one: {str(e)}")
+            return
+
+        resolved = {
+            service: [resolved_url for url in urls for resolved_url in self._resolve(url)]
+            for service, urls in service_map.items()
+        }
+        with self._lock:
+            services = {}
+            for service, urls in resolved.items():
+                current = self._services.get(service, {})
+                services[service] = {url: current.get(url) or Endpoint(url) for url in urls}
+            previous, self._services = self._services, services
+        if {s: set(e) for s, e in services.items()} != {s: set(e) for s, e in previous.items()}:
+            logger.info(f"Upstreams: {resolved}")
+
+    def _map_changed(self):
+        if not config.SERVICE_MAP_FILE:
+            return False
+        try:
+            return os.path.getmtime(config.SERVICE_MAP_FILE) != self._map_mtime
+        except OSError:
+            return False
+
+    def _background_loop(self):
+        last_discovery = time.monotonic()
+        while True:
+            time.sleep(config.HEALTH_CHECK_INTERVAL)
+            try:
+                if self._map_changed() or time.monotonic() - last_discovery >= config.DISCOVERY_INTERVAL:
+                    self.reload()
+                    last_discovery = time.monotonic()
+                self.check_health()
+            except Exception as e:
+                logger.exception(f"Upstream discovery/health check failed: {str(e)}")
+
+    # Active health checks
+
+    def check_health(self):
+        with self._lock:
+            endpoints = [endpoint for pool in self._services.values() for endpoint in pool.values()]
+        for endpoint in endpoints:
+            try:
+                response = http_client.get(f"{endpoint.url}/health", timeout=config.HEALTH_CHECK_TIMEOUT, retries=0)
+                ok = response.status_code == 200
+            except Exception:
+                ok = False
+            with self._lock:
+                if ok:
+                    if not endpoint.healthy:
+                        logger.info(f"Upstream {endpoint.url} is healthy again")
+                    endpoint.healthy, endpoint.failed_checks = True, 0
+                else:
+                    endpoint.failed_checks += 1
+                    if endpoint.healthy and endpoint.failed_checks >= config.HEALTH_CHECK_FAILURES:
+                        logger.warning(f"Upstream {endpoint.url} failed {endpoint.failed_checks} health checks")
+                        endpoint.healthy = False
+
+    # Balancing
+
+    def acquire(self, service, exclude=()):
+        """
+        Pick an instance of a service and count a request against it; pair
+        with release(). Instances in `exclude` (e.g. already tried) are only
+        picked when no other one is available.
+        """
+        now = time.monotonic()
+        with self._lock:
+            pool = self._services.get(service)
+            if pool is None:
+                raise ValueError(f"Service '{service}' not found in SERVICE_MAP")
+            if not pool:
+                raise NoAvailableEndpoint(f"Service '{service}' has no endpoints")
+            candidates = [endpoint for endpoint in pool.values() if endpoint.available(now)]
+            untried = [endpoint for endpoint in candidates if endpoint not in exclude]
+            if untried:
+                candidates = untried
+            if not candidates:
+                # Every instance looks bad; spreading load beats failing every request
+                candidates = list(pool.values())
+            if len(candidates) > 1:
+                first, second = random.sample(candidates, 2)
+                endpoint = first if first.load() <= second.load() else second
+            else:
+                endpoint = candidates[0]
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, service, endpoint, latency, success):
+        """
+        Record the outcome of a request; consecutive failures eject the instance
+        for a while. success=None (e.g. the client's own deadline ran out) only
+        frees the instance.
+        """
+        now = time.monotonic()
+        with self._lock:
+            endpoint.outstanding -= 1
+            if success is None:
+                return
+            endpoint.latencies.append(latency)
+            if endpoint.ewma_latency is None:
+                endpoint.ewma_latency = latency
+            else:
+                endpoint.ewma_latency += EWMA_ALPHA * (latency - endpoint.ewma_latency)
+
+            if success:
+                endpoint.consecutive_failures = 0
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= config.OUTLIER_CONSECUTIVE_FAILURES and endpoint.ejected_until <= now:
+                pool = self._services.get(service, {})
+                ejected = sum(1 for other in pool.values() if other.ejected_until > now)
+                # Never eject more than the configured share of a service's instances
+                if (ejected + 1) * 100 <= len(pool) * config.OUTLIER_MAX_EJECTION_PERCENT:
+                    endpoint.ejections += 1
+                    endpoint.ejected_until = now + config.OUTLIER_BASE_EJECTION_SECONDS * min(endpoint.ejections, 10)
+                    endpoint.consecutive_failures = 0
+                    logger.warning(f"Ejected upstream {endpoint.url} after repeated failures")
+
+    def services(self):
+        """Names of the services in the service map."""
+        with self._lock:
+            return set(self._services)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                service: [endpoint.stats(now) for endpoint in pool.values()]
+                for service, pool in self._services.items()
+            }
+
+
+balancer = LoadBalancer()
@@ -0,0 +1,322 @@
+import asyncio
+import json
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import quote
+
+import config
+from common.http_client import DEADLINE_HEADER
+
+# POST /batch: several gateway requests in one round trip.
+#
+#   {"timeout_ms": 2000,
+#    "requests": [
+#      {"id": "board", "method": "GET", "path": "/db/board/7"},
+#      {"id": "threads", "path": "/db/thread/", "query": {"board_id": "{{board.id}}"}},
+#      {"id": "me", "path": "/auth/me"}]}
+#
+# Sub-requests run concurrently (up to BATCH_MAX_CONCURRENCY per batch and
+# BATCH_MAX_WORKERS across all batches), each going through the gateway
+# exactly like a request of its own (rate limits, cache, breakers, ...) with
+# the headers of the batch request plus its own "headers". "body" is sent as
+# JSON.
+#
+# "{{id.field.0.name}}" in a path, query value, header or body is replaced
+# by that field of request id's JSON response, and makes the request wait
+# for it ("depends_on" adds dependencies without a reference). A request
+# whose dependency failed or lacks the field is answered 424 without being
+# sent. All sub-requests share the batch deadline: the client's own, or
+# "timeout_ms", or UPSTREAM_TIMEOUT, whichever is shortest; those not
+# started by then are answered 504.
+#
+# The response is NDJSON, one line per sub-request in order of completion:
+#   {"id": "board", "status": 200, "headers": {...}, "body": {...}, "elapsed_ms": 12}
+
+TEMPLATE = re.compile(r"\{\{\s*([\w-]+)((?:\.[^.{}\s]+)*)\s*\}\}")
+
+METHODS = {"GET", "POST", "PUT", "DELETE", "PATCH"}
+
+# Workers shared by every batch of the process, so concurrent batches cannot
+# add up to an unbounded number of threads or upstream calls
+_pool = ThreadPoolExecutor(max_workers=config.BATCH_MAX_WORKERS, thread_name_prefix="batch")
+_async_workers = asyncio.Semaphore(config.BATCH_MAX_WORKERS)
+
+# Headers of the batch request that describe the batch itself
+BATCH_ONLY_HEADERS = {"host", "content-length", "content-type", "content-encoding", "transfer-encoding",
+                      "accept-encoding", "connection", "if-none-match", "if-modified-since", "if-match",
+                      "if-unmodified-since", "if-range"}
+
+
+class BatchError(ValueError):
+    """Raised for a batch request that cannot be run at all."""
+
+
+class Unresolved(Exception):
+    """Raised when a sub-request refers to a result that failed or lacks the field."""
+
+
+class Expired(Exception):
+    """Raised for a sub-request still waiting for a worker when the batch deadline passes."""
+
+
+def _references(value):
+    if isinstance(value, str):
+        return {match.group(1) for match in TEMPLATE.finditer(value)}
+    if isinstance(value, dict):
+        return set().union(*map(_references, value.values())) if value else set()
+    if isinstance(value, list):
+        return set().union(*map(_references, value)) if value else set()
+    return set()
+
+
+def parse_batch(data, services):
+    """Validate a batch request body; returns (sub-requests, timeout in seconds or None)."""
+    if len(data) > config.BATCH_MAX_BODY_BYTES:
+        raise BatchError(f"The batch body exceeds {config.BATCH_MAX_BODY_BYTES} bytes")
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        raise BatchError("The batch body is not valid JSON") from None
+    if not isinstance(payload, dict) or not isinstance(payload.get("requests"), list):
+        raise BatchError("Expected a JSON object with a list of requests")
+    requests = payload["requests"]
+    if not requests:
+        raise BatchError("The batch has no requests")
+    if len(requests) > config.BATCH_MAX_REQUESTS:
+        raise BatchError(f"A batch may hold at most {config.BATCH_MAX_REQUESTS} requests")
+
+    items = []
+    for index, request in enumerate(requests):
+        if not isinstance(request, dict):
+            raise BatchError(f"Request {index} is not an object")
+        item = {
+            "id": str(request.get("id", index)),
+            "method": str(request.get("method", "GET")).upper(),
+            "path": request.get("path"),
+            "query": request.get("query") or {},
+            "headers": request.get("headers") or {},
+            "body": request.get("body"),
+        }
+        if item["method"] not in METHODS:
+            raise BatchError(f"Request {item['id']}: method {item['method']} is not allowed")
+        path = item["path"]
+        if not isinstance(path, str) or not path.startswith("/") or "?" in path or "/../" in path + "/":
+            raise BatchError(f"Request {item['id']}: path must be an absolute path without a query string")
+        service = path.split("/")[1]
+        if service not in services or len(path.split("/")) < 3:
+            raise BatchError(f"Request {item['id']}: {path} is not a route of a known service")
+        if not isinstance(item["query"], dict) or not isinstance(item["headers"], dict):
+            raise BatchError(f"Request {item['id']}: query and headers must be objects")
+        depends_on = request.get("depends_on") or []
+        if not isinstance(depends_on, list):
+            raise BatchError(f"Request {item['id']}: depends_on must be a list of ids")
+        item["deps"] = {str(dep) for dep in depends_on} | _references(
+            [item["path"], item["query"], item["headers"], item["body"]]
+        )
+        items.append(item)
+
+    ids = [item["id"] for item in items]
+    if len(set(ids)) != len(ids):
+        raise BatchError("Request ids must be unique")
+    for item in items:
+        unknown = item["deps"] - set(ids)
+        if unknown:
+            raise BatchError(f"Request {item['id']} depends on unknown requests {sorted(unknown)}")
+    _check_acyclic(items)
+
+    timeout = payload.get("timeout_ms")
+    if timeout is not None:
+        if not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise BatchError("timeout_ms must be a positive number")
+        timeout = timeout / 1000
+    return items, timeout
+
+
+def _check_acyclic(items):
+    deps = {item["id"]: item["deps"] for item in items}
+    done = set()
+    while len(done) < len(deps):
+        ready = [id for id, needs in deps.items() if id not in done and needs <= done]
+        if not ready:
+            raise BatchError(f"Requests {sorted(set(deps) - done)} depend on each other")
+        done.update(ready)
+
+
+def _lookup(results, id, path):
+    result = results[id]
+    if result["status"] >= 400:
+        raise Unresolved(f"request {id} failed with {result['status']}")
+    value = result["body"]
+    for key in path.split(".")[1:] if path else []:
+        try:
+            value = value[int(key)] if isinstance(value, list) else value[key]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise Unresolved(f"request {id} has no {path.lstrip('.')} in its response") from None
+    return value
+
+
+def _render(value, results, escape=str):
+    if isinstance(value, dict):
+        return {key: _render(item, results, escape) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_render(item, results, escape) for item in value]
+    if not isinstance(value, str):
+        return value
+    whole = TEMPLATE.fullmatch(value)
+    if whole and escape is None:
+        # A lone reference in a JSON body keeps the type of the value
+        return _lookup(results, whole.group(1), whole.group(2))
+    return TEMPLATE.sub(lambda match: (escape or str)(str(_lookup(results, match.group(1), match.group(2)))), value)
+
+
+def render(item, results):
+    """(method, path, query, headers, JSON body or None) of a sub-request, with references filled in."""
+    path = _render(item["path"], results, lambda value: quote(value, safe=""))
+    query = {str(key): _render(str(value), results) for key, value in item["query"].items()}
+    headers = {str(key): _render(str(value), results) for key, value in item["headers"].items()}
+    body = _render(item["body"], results, None)
+    return item["method"], path, query, headers, body
+
+
+def sub_request_headers(tenant_id, batch_headers, item_headers, remaining):
+    """Headers of a sub-request: the batch's own, its own on top, and what is left of the deadline."""
+    excluded = BATCH_ONLY_HEADERS | {"x-tenant-id", DEADLINE_HEADER.lower()}
+    overridden = {name.lower() for name in item_headers}
+    headers = {name: value for name, value in batch_headers if name.lower() not in excluded | overridden}
+    headers.update((name, value) for name, value in item_headers.items() if name.lower() not in excluded)
+    # A sub-request cannot switch tenants or outlive the batch
+    headers["X-Tenant-ID"] = tenant_id
+    headers[DEADLINE_HEADER] = str(max(int(remaining * 1000), 1))
+    return headers
+
+
+def _decode(headers, body):
+    content_type = next((value for name, value in headers.items() if name.lower() == "content-type"), "")
+    if "json" in content_type:
+        try:
+            return json.loads(body)
+        except ValueError:
+            pass
+    return body.decode("utf-8", errors="replace")
+
+
+class Batch:
+    """Which sub-requests of a batch can run, and their results so far."""
+
+    def __init__(self, items, deadline):
+        self.waiting = list(items)
+        self.results = {}
+        self.deadline = deadline
+
+    def _result(self, item, status, headers, body, started=None):
+        self.results[item["id"]] = {"status": status, "body": body}
+        line = {"id": item["id"], "status": status, "headers": headers, "body": body}
+        if started is not None:
+            line["elapsed_ms"] = int((time.monotonic() - started) * 1000)
+        return (json.dumps(line) + "\n").encode()
+
+    def _error(self, item, status, message):
+        return self._result(item, status, {}, {"error": message})
+
+    def advance(self):
+        """
+        Sub-requests that can be sent now as (item, rendered request), and
+        NDJSON lines of those answered without being sent.
+        """
+        ready, lines = [], []
+        progress = True
+        while progress:
+            progress = False
+            for item in list(self.waiting):
+                if not item["deps"] <= set(self.results):
+                    continue
+                self.waiting.remove(item)
+                progress = True
+                if time.monotonic() >= self.deadline:
+                    lines.append(self._error(item, 504, "The batch deadline passed before the request was sent"))
+                    continue
+                try:
+                    ready.append((item, render(item, self.results)))
+                except Unresolved as e:
+                    lines.append(self._error(item, 424, f"Failed dependency: {str(e)}"))
+        return ready, lines
+
+    def finish(self, item, started, outcome):
+        """NDJSON line for a sent sub-request from its (status, headers, body) or exception."""
+        if isinstance(outcome, Expired):
+            return self._error(item, 504, "The batch deadline passed before the request was sent")
+        if isinstance(outcome, BaseException):
+            return self._error(item, 502, f"Sub-request failed: {str(outcome)}")
+        status, headers, body = outcome
+        headers = {name: value for name, value in headers if name.lower() not in ("content-length", "content-encoding")}
+        return self._result(item, status, headers, _decode(headers, body), started)
+
+
+def _send(dispatch, request, deadline):
+    # It may have waited behind other batches for a worker
+    if time.monotonic() >= deadline:
+        raise Expired()
+    return dispatch(request, deadline)
+
+
+def run_threaded(batch, dispatch):
+    """
+    Run a batch on the shared workers (sync gateway), up to
+    BATCH_MAX_CONCURRENCY sub-requests at a time, yielding NDJSON lines as
+    sub-requests complete. dispatch(request, deadline) returns (status,
+    headers, body).
+    """
+    pending = []
+    running = {}
+    try:
+        while True:
+            ready, lines = batch.advance()
+            yield from lines
+            pending.extend(ready)
+            while pending and len(running) < config.BATCH_MAX_CONCURRENCY:
+                item, request = pending.pop(0)
+                future = _pool.submit(_send, dispatch, request, batch.deadline)
+                running[future] = (item, time.monotonic())
+            if not running:
+                return
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                item, started = running.pop(future)
+                yield batch.finish(item, started, future.exception() or future.result())
+    finally:
+        # Sub-requests already sent are bounded by the deadline they carry
+        for future in running:
+            future.cancel()
+        wait(running)
+
+
+async def run_async(batch, dispatch):
+    """Async counterpart of run_threaded; dispatch is a coroutine function."""
+    semaphore = asyncio.Semaphore(config.BATCH_MAX_CONCURRENCY)
+    running = {}
+
+    async def limited(request):
+        async with semaphore, _async_workers:
+            if time.monotonic() >= batch.deadline:
+                raise Expired()
+            return await dispatch(request, batch.deadline)
+
+    try:
+        while True:
+            ready, lines = batch.advance()
+            for line in lines:
+                yield line
+            for item, request in ready:
+                started = time.monotonic()
+                running[asyncio.ensure_future(limited(request))] = (item, started)
+            if not running:
+                return
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item, started = running.pop(task)
+                yield batch.finish(item, started, task.exception() or task.result())
+    finally:
+        # The client went away: nobody is left to read the results
+        for task in running:
+            task.cancel()
@@ -0,0 +1,188 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+import config
+
+logger = logging.getLogger("api-gateway")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Upstream answers that say the upstream itself is unhealthy; other 5xx (an
+# application 500, e.g. for an unknown tenant) are about the request
+FAILURE_STATUSES = {502, 503, 504}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, name, retry_after):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"Circuit for {name} is open; retry in {self.retry_after}s")
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one upstream (or one tenant of an upstream).
+
+    Closed: calls go through and their outcomes are counted in a rolling
+    window of BREAKER_WINDOW_SECONDS. Once the window holds at least
+    BREAKER_MIN_REQUESTS calls and the share of failures (connection errors,
+    timeouts, FAILURE_STATUSES) or of slow calls reaches its threshold, the circuit opens.
+
+    Open: calls fail straight away for BREAKER_OPEN_SECONDS, doubling each
+    time the circuit re-opens without having recovered.
+
+    Half-open: up to BREAKER_HALF_OPEN_PROBES calls are let through; if they
+    all succeed quickly the circuit closes, any failure opens it again.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.opened_until = 0
+        self.reopens = 0
+        self.trips = 0
+        self.rejected = 0
+        self.probes = 0
+        self.probe_successes = 0
+        # [second, requests, failures, slow calls] per second of the window
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    def _totals(self, now):
+        while self._window and self._window[0][0] <= now - config.BREAKER_WINDOW_SECONDS:
+            self._window.popleft()
+        requests = sum(bucket[1] for bucket in self._window)
+        failures = sum(bucket[2] for bucket in self._window)
+        slow = sum(bucket[3] for bucket in self._window)
+        return requests, failures, slow
+
+    def _count(self, now, failed, slow):
+        second = int(now)
+        if not self._window or self._window[-1][0] != second:
+            self._window.append([second, 0, 0, 0])
+        bucket = self._window[-1]
+        bucket[1] += 1
+        bucket[2] += failed
+        bucket[3] += slow
+
+    def _open(self, now, reason):
+        self.state = OPEN
+        self.trips += 1
+        self.opened_until = now + config.BREAKER_OPEN_SECONDS * 2 ** min(self.reopens, 5)
+        self._window.clear()
+        logger.warning(f"Circuit for {self.name} opened: {reason}")
+
+    def allow(self):
+        """Admit a call, returning whether it is a half-open probe; raises CircuitOpen otherwise."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN and now >= self.opened_until:
+                self.state = HALF_OPEN
+                self.probes = self.probe_successes = 0
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and self.probes < config.BREAKER_HALF_OPEN_PROBES:
+                self.probes += 1
+                return True
+            self.rejected += 1
+            retry_after = self.opened_until - now if self.state == OPEN else 1
+            raise CircuitOpen(self.name, retry_after)
+
+    def record(self, probe, latency, success):
+        """Count the outcome of an admitted call; success=None only frees its slot."""
+        now = time.monotonic()
+        with self._lock:
+            if success is None:
+                if probe and self.state == HALF_OPEN:
+                    self.probes -= 1
+                return
+            slow = latency >= config.BREAKER_SLOW_CALL_SECONDS
+
+            if self.state == HALF_OPEN:
+                if not probe:
+                    return
+                if not success or slow:
+                    self.reopens += 1
+                    self._open(now, "probe failed" if not success else f"probe took {latency:.2f}s")
+                    return
+                self.probe_successes += 1
+                if self.probe_successes >= config.BREAKER_HALF_OPEN_PROBES:
+                    self.state = CLOSED
+                    self.reopens = 0
+                    logger.info(f"Circuit for {self.name} closed")
+                return
+
+            # Calls that were already in flight when the circuit opened do not count
+            if self.state != CLOSED:
+                return
+            self._count(now, not success, slow)
+            requests, failures, slow_calls = self._totals(now)
+            if requests < config.BREAKER_MIN_REQUESTS:
+                return
+            if failures >= requests * config.BREAKER_ERROR_RATE:
+                self._open(now, f"{failures}/{requests} calls failed")
+            elif slow_calls >= requests * config.BREAKER_SLOW_CALL_RATE:
+                self._open(now, f"{slow_calls}/{requests} calls slower than {config.BREAKER_SLOW_CALL_SECONDS}s")
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            requests, failures, slow = self._totals(now)
+            return {
+                "state": self.state,
+                "open_for_seconds": round(max(self.opened_until - now, 0), 1) if self.state == OPEN else 0,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "window": {"requests": requests, "failures": failures, "slow": slow},
+            }
+
+
+class BreakerRegistry:
+    """
+    The circuit breakers of the gateway: one per tenant and service (the
+    default, BREAKER_PER_TENANT), so a tenant whose database is failing (or
+    a made-up tenant id) does not cut off the others, or one per upstream
+    service. Per-tenant breakers are kept for the BREAKER_MAX_CIRCUITS most
+    recently used tenants.
+    """
+
+    def __init__(self):
+        self._breakers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _breaker(self, service, tenant_id):
+        key = f"{service}/{tenant_id}" if config.BREAKER_PER_TENANT else service
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(key)
+                while len(self._breakers) > config.BREAKER_MAX_CIRCUITS:
+                    self._breakers.popitem(last=False)
+            self._breakers.move_to_end(key)
+            return breaker
+
+    def acquire(self, service, tenant_id):
+        """Admit a call to a service; returns a ticket for release(), or raises CircuitOpen."""
+        if not config.BREAKER_ENABLED:
+            return None
+        breaker = self._breaker(service, tenant_id)
+        return breaker, breaker.allow()
+
+    def release(self, ticket, latency, success):
+        if ticket is not None:
+            breaker, probe = ticket
+            breaker.record(probe, latency, success)
+
+    def stats(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.stats() for breaker in breakers}
+
+
+breakers = BreakerRegistry()
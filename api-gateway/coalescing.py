@@ -0,0 +1,175 @@
+import asyncio
+import fnmatch
+import threading
+
+import config
+
+# Request coalescing ("singleflight"): concurrent identical GETs share one
+# upstream call, and its response is fanned out to every waiting request.
+# Only routes listed in GATEWAY_COALESCE_ROUTES take part; their responses
+# must not depend on who is asking beyond the headers in the key. The
+# caller's credentials and cookies are always part of it: db-service reads
+# go to the primary or a replica depending on the db_primary_until cookie.
+
+# Headers that identify the caller or pick the upstream's read path
+CALLER_HEADERS = {"authorization", "cookie", "x-read-consistency"}
+
+
+class Unshared:
+    """A response only the request that made the upstream call can use (e.g. a streamed body)."""
+
+    def __init__(self, response, discard=None):
+        self.response = response
+        # Coroutine function releasing the response if it is never sent
+        self.discard = discard
+
+
+def flight_key(method, tenant_id, service, endpoint, args, upstream_headers, has_body):
+    """
+    Key of a request that may be coalesced, or None. Besides the route and
+    query it includes every header the upstream response may vary on, the
+    caller's credentials and cookies, and any conditional header the
+    upstream will see.
+    """
+    if method != "GET" or has_body or not config.COALESCE_ROUTES:
+        return None
+    if not any(fnmatch.fnmatchcase(f"{service}/{endpoint}", pattern) for pattern in config.COALESCE_ROUTES):
+        return None
+    lookup = {name.lower(): value for name, value in upstream_headers.items()}
+    names = sorted({name.lower() for name in config.COALESCE_VARY_HEADERS} | CALLER_HEADERS | {
+        "if-none-match", "if-modified-since"
+    })
+    return tenant_id, method, service, endpoint, tuple(sorted(args)), tuple(lookup.get(name) for name in names)
+
+
+def bufferable(response_headers):
+    """Whether a response is small enough to be held in memory and handed to every waiter."""
+    try:
+        return int(response_headers.get("Content-Length")) <= config.COALESCE_MAX_BODY_BYTES
+    except (TypeError, ValueError):
+        return False
+
+
+class _Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {"leaders": 0, "coalesced": 0, "unshared": 0, "max_waiters": 0}
+        self._flights = {}
+
+    def unshared(self):
+        """A waiter found the leader's response unshareable and makes its own call."""
+        with self._lock:
+            self._metrics["coalesced"] -= 1
+            self._metrics["unshared"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["in_flight"] = len(self._flights)
+        requests = stats["leaders"] + stats["coalesced"] + stats["unshared"]
+        stats["coalesced_ratio"] = round(stats["coalesced"] / requests, 4) if requests else 0.0
+        return stats
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class Singleflight(_Metrics):
+    """Coalescing for the threaded (Flask) gateway."""
+
+    def do(self, key, fn, timeout=None, lead=True):
+        """
+        Run fn() once for every concurrent caller with the same key and
+        return (result, leader). An exception from fn is raised in every
+        caller; a waiter gives up with TimeoutError after `timeout` seconds.
+        With lead=False, returns (None, False) rather than starting a call
+        when none is in flight.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader and not lead:
+                return None, False
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._metrics["leaders"] += 1
+            else:
+                flight.waiters += 1
+                self._metrics["coalesced"] += 1
+                self._metrics["max_waiters"] = max(self._metrics["max_waiters"], flight.waiters)
+
+        if leader:
+            try:
+                flight.result = fn()
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+            return flight.result, True
+
+        if not flight.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for a coalesced upstream request")
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, False
+
+
+class AsyncSingleflight(_Metrics):
+    """
+    Coalescing for the asyncio gateway. The shared call runs in its own task,
+    so it carries on for the waiters if the request that started it goes away.
+    """
+
+    async def do(self, key, fn, timeout=None, lead=True):
+        """Async counterpart of Singleflight.do; fn is a coroutine function."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader and not lead:
+                return None, False
+            if leader:
+                task = asyncio.ensure_future(fn())
+                flight = self._flights[key] = [task, 0]
+                task.add_done_callback(lambda _: self._finish(key, flight))
+                self._metrics["leaders"] += 1
+            else:
+                flight[1] += 1
+                self._metrics["coalesced"] += 1
+                self._metrics["max_waiters"] = max(self._metrics["max_waiters"], flight[1])
+
+        task = flight[0]
+        try:
+            # The leader's own call is bounded by its upstream timeout
+            result = await asyncio.wait_for(asyncio.shield(task), None if leader else timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Timed out waiting for a coalesced upstream request") from None
+        except asyncio.CancelledError:
+            if leader:
+                # A response meant only for the leader would never be sent or closed
+                task.add_done_callback(self._discard_unshared)
+            raise
+        return result, leader
+
+    def _finish(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        # Nobody may be left to retrieve a failure
+        if not flight[0].cancelled():
+            flight[0].exception()
+
+    @staticmethod
+    def _discard_unshared(task):
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if isinstance(result, Unshared) and result.discard is not None:
+            asyncio.ensure_future(result.discard())
@@ -0,0 +1,262 @@
+import asyncio
+import fnmatch
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+import config
+
+logger = logging.getLogger("api-gateway")
+
+# Adaptive concurrency limits and load shedding per upstream service.
+#
+# Each upstream gets a concurrency limit that follows its latency (AIMD on a
+# latency gradient): while recent latency stays close to the long-run
+# average and the limit is in use, it grows by about one per round trip;
+# when recent latency climbs past ADAPTIVE_LATENCY_TOLERANCE times the
+# average, or the upstream answers 429/503/504 or times out, it is cut by
+# ADAPTIVE_BACKOFF. A db-service slowed down by a vacuum thus gets fewer
+# concurrent requests instead of a growing pile of them.
+#
+# Requests over the limit wait in a priority queue managed like CoDel: a
+# request may wait CODEL_INTERVAL, but once the queue has not been empty for
+# a whole interval (a standing queue rather than a burst), only
+# CODEL_TARGET. Requests that wait longer are shed with a fast 503, and
+# low-priority ones are shed straight away. Health checks and auth calls go
+# first; list and search calls go last.
+
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+# Upstream answers that mean it is overloaded
+OVERLOAD_STATUSES = {429, 503, 504}
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing a request for an upstream that is over its concurrency limit."""
+
+    def __init__(self, name, reason):
+        self.retry_after = 1
+        super().__init__(f"{name} is overloaded: {reason}")
+
+
+def priority(method, service, endpoint):
+    """Queue priority of a request, from the "METHOD service/endpoint" patterns in config."""
+    route = f"{method} {service}/{endpoint}"
+    if any(fnmatch.fnmatchcase(route, pattern) for pattern in config.PRIORITY_HIGH_ROUTES):
+        return HIGH
+    if any(fnmatch.fnmatchcase(route, pattern) for pattern in config.PRIORITY_LOW_ROUTES):
+        return LOW
+    return NORMAL
+
+
+class _Waiter:
+    def __init__(self, priority):
+        self.priority = priority
+        self.granted = False
+        self.cancelled = False
+        self.event = threading.Event()
+
+    def wake(self):
+        self.event.set()
+
+
+class _AsyncWaiter(_Waiter):
+    def __init__(self, priority):
+        super().__init__(priority)
+        self.future = asyncio.get_running_loop().create_future()
+
+    def wake(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit and wait queue of one upstream service."""
+
+    def __init__(self, name):
+        self.name = name
+        self.limit = float(config.ADAPTIVE_INITIAL_LIMIT)
+        self.in_flight = 0
+        self.short_latency = None
+        self.long_latency = None
+        self._last_decrease = 0
+        self._queue = []
+        self._queued = 0
+        self._seq = itertools.count()
+        self._last_empty = time.monotonic()
+        self._lock = threading.Lock()
+        self._metrics = {"admitted": 0, "queued": 0, "shed": 0, "decreases": 0}
+
+    def _standing_queue(self, now):
+        return self._queued > 0 and now - self._last_empty > config.CODEL_INTERVAL
+
+    def enter(self, priority, waiter_class=_Waiter):
+        """
+        Admit a request straight away (returns None) or queue it, returning
+        (waiter, longest wait). Raises Overloaded if it is shed on arrival.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._queued == 0 and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                self._metrics["admitted"] += 1
+                return None
+            standing = self._standing_queue(now)
+            if priority == LOW and standing or self._queued >= config.ADMISSION_MAX_QUEUE:
+                self._metrics["shed"] += 1
+                raise Overloaded(self.name, f"{self._queued} requests queued")
+            if self._queued == 0:
+                self._last_empty = now
+            waiter = waiter_class(priority)
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            self._queued += 1
+            self._metrics["queued"] += 1
+            return waiter, config.CODEL_TARGET if standing else config.CODEL_INTERVAL
+
+    def leave(self, waiter):
+        """After waiting: the request was given a slot, or it is shed now."""
+        with self._lock:
+            if waiter.granted:
+                return
+            self._cancel(waiter)
+            self._metrics["shed"] += 1
+        raise Overloaded(self.name, "queued for too long")
+
+    def abandon(self, waiter):
+        """The request went away while waiting (e.g. the client disconnected)."""
+        with self._lock:
+            if not waiter.granted:
+                self._cancel(waiter)
+                return
+        self.release(None, False)
+
+    def _cancel(self, waiter):
+        waiter.cancelled = True
+        self._queued -= 1
+        if self._queued == 0:
+            self._last_empty = time.monotonic()
+
+    def release(self, latency, dropped):
+        """
+        Free a slot and hand it to the next waiter. `latency` (None if the
+        upstream was never called) and `dropped` feed the limit.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            if latency is not None:
+                self._sample(now, latency, dropped)
+            while self._queued and self.in_flight < int(self.limit):
+                _, _, waiter = heapq.heappop(self._queue)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self._queued -= 1
+                self.in_flight += 1
+                self._metrics["admitted"] += 1
+                waiter.wake()
+            if self._queued == 0:
+                self._last_empty = now
+                # Only cancelled waiters can be left
+                self._queue.clear()
+
+    def _sample(self, now, latency, dropped):
+        if self.short_latency is None:
+            self.short_latency = self.long_latency = latency
+        self.short_latency += (latency - self.short_latency) * 0.1
+        self.long_latency += (latency - self.long_latency) * 0.01
+
+        if dropped or self.short_latency > self.long_latency * config.ADAPTIVE_LATENCY_TOLERANCE:
+            # At most once per round trip, so one slow burst counts once
+            if now - self._last_decrease >= self.short_latency:
+                self.limit = max(config.ADAPTIVE_MIN_LIMIT, self.limit * config.ADAPTIVE_BACKOFF)
+                self._last_decrease = now
+                self._metrics["decreases"] += 1
+                logger.info(f"Concurrency limit for {self.name} lowered to {int(self.limit)}")
+        elif (self.in_flight + 1) * 2 >= self.limit:
+            # Only grow a limit that is actually being used
+            self.limit = min(config.ADAPTIVE_MAX_LIMIT, self.limit + 1 / self.limit)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._metrics)
+            stats.update({
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": self._queued,
+                "standing_queue": self._standing_queue(now),
+                "short_latency": round(self.short_latency, 4) if self.short_latency is not None else None,
+                "long_latency": round(self.long_latency, 4) if self.long_latency is not None else None,
+            })
+            return stats
+
+
+class LimiterRegistry:
+    """The adaptive concurrency limiters of the gateway, one per upstream service."""
+
+    def __init__(self):
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def _limiter(self, service):
+        with self._lock:
+            limiter = self._limiters.get(service)
+            if limiter is None:
+                limiter = self._limiters[service] = AdaptiveLimiter(service)
+            return limiter
+
+    def acquire(self, service, priority, deadline=None):
+        """
+        Take a slot for a call to a service, waiting for one if needed;
+        returns a ticket for release(), or raises Overloaded.
+        """
+        if not config.ADMISSION_ENABLED:
+            return None
+        limiter = self._limiter(service)
+        queued = limiter.enter(priority)
+        if queued is None:
+            return limiter
+        waiter, timeout = queued
+        if deadline is not None:
+            timeout = min(timeout, max(deadline - time.monotonic(), 0))
+        waiter.event.wait(timeout)
+        limiter.leave(waiter)
+        return limiter
+
+    async def acquire_async(self, service, priority, deadline=None):
+        """Async counterpart of acquire."""
+        if not config.ADMISSION_ENABLED:
+            return None
+        limiter = self._limiter(service)
+        queued = limiter.enter(priority, _AsyncWaiter)
+        if queued is None:
+            return limiter
+        waiter, timeout = queued
+        if deadline is not None:
+            timeout = min(timeout, max(deadline - time.monotonic(), 0))
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            limiter.abandon(waiter)
+            raise
+        limiter.leave(waiter)
+        return limiter
+
+    def release(self, ticket, latency=None, dropped=False):
+        if ticket is not None:
+            ticket.release(latency, dropped)
+
+    def stats(self):
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {limiter.name: limiter.stats() for limiter in limiters}
+
+
+limiters = LimiterRegistry()
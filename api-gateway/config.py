@@ -1,9 +1,128 @@
+import os
+
 API_GATEWAY_PORT = 5000
 
-# Microservices and their base URLs
+# Microservices and the base URLs of their instances
 SERVICE_MAP = {
-    "auth": "http://auth-service:5001/auth",
-    "config": "http://config-service:5002/config",
-    "db": "http://db-service:5003/db",
-    "post": "http://post-service:5004/post"
+    "auth": ["http://auth-service:5001/auth"],
+    "config": ["http://config-service:5002/config"],
+    "db": ["http://db-service:5003/db"],
 }
+# Optional JSON file with the same shape, re-read whenever it changes
+SERVICE_MAP_FILE = os.getenv("SERVICE_MAP_FILE")
+# "dns" turns each host into one endpoint per address it resolves to
+# (e.g. docker compose --scale db-service=3); "static" uses the URLs as given
+SERVICE_DISCOVERY = os.getenv("SERVICE_DISCOVERY", "static")
+DISCOVERY_INTERVAL = int(os.getenv("DISCOVERY_INTERVAL", 30))
+
+# Active health checks (GET <base URL>/health) and passive outlier detection
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 5))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 1))
+HEALTH_CHECK_FAILURES = int(os.getenv("HEALTH_CHECK_FAILURES", 2))
+OUTLIER_CONSECUTIVE_FAILURES = int(os.getenv("OUTLIER_CONSECUTIVE_FAILURES", 5))
+OUTLIER_BASE_EJECTION_SECONDS = float(os.getenv("OUTLIER_BASE_EJECTION_SECONDS", 30))
+OUTLIER_MAX_EJECTION_PERCENT = int(os.getenv("OUTLIER_MAX_EJECTION_PERCENT", 50))
+
+# Circuit breakers: calls to an upstream fail fast with a 503 for a while once
+# too many of them fail or are slow (see breaker.py)
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() == "true"
+BREAKER_PER_TENANT = os.getenv("BREAKER_PER_TENANT", "true").lower() == "true"
+BREAKER_MAX_CIRCUITS = int(os.getenv("BREAKER_MAX_CIRCUITS", 10000))
+BREAKER_WINDOW_SECONDS = int(os.getenv("BREAKER_WINDOW_SECONDS", 10))
+BREAKER_MIN_REQUESTS = int(os.getenv("BREAKER_MIN_REQUESTS", 20))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", 0.5))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", 2))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("BREAKER_SLOW_CALL_RATE", 0.8))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", 5))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", 3))
+
+# Shared cache for GET responses the upstreams mark as cacheable (see http_cache.py)
+CACHE_ENABLED = os.getenv("GATEWAY_CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_TENANT_MAX_BYTES = int(os.getenv("GATEWAY_CACHE_TENANT_MAX_BYTES", 8 * 1024 * 1024))
+CACHE_MAX_ENTRY_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_ENTRY_BYTES", 1024 * 1024))
+
+# Identical concurrent GETs to these routes ("service/endpoint" patterns) share
+# one upstream call. Only list routes whose responses depend on nothing but the
+# tenant, the URL, the caller's credentials and cookies, and the headers below
+COALESCE_ROUTES = [pattern.strip() for pattern in os.getenv("GATEWAY_COALESCE_ROUTES", "db/*").split(",") if pattern.strip()]
+COALESCE_VARY_HEADERS = [name.strip() for name in os.getenv(
+    "GATEWAY_COALESCE_VARY_HEADERS", "Accept,Accept-Encoding,Accept-Language"
+).split(",") if name.strip()]
+COALESCE_MAX_BODY_BYTES = int(os.getenv("GATEWAY_COALESCE_MAX_BODY_BYTES", 1024 * 1024))
+
+# Rate limits per tenant and per client within a tenant (see rate_limit.py):
+# up to RATE requests per PERIOD seconds on average, in bursts of up to BURST.
+# Tenants can override them with the "rate_limit" feature flag of their config
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_TENANT_RATE = float(os.getenv("RATE_LIMIT_TENANT_RATE", 500))
+RATE_LIMIT_TENANT_BURST = int(os.getenv("RATE_LIMIT_TENANT_BURST", 1000))
+RATE_LIMIT_CLIENT_RATE = float(os.getenv("RATE_LIMIT_CLIENT_RATE", 50))
+RATE_LIMIT_CLIENT_BURST = int(os.getenv("RATE_LIMIT_CLIENT_BURST", 100))
+RATE_LIMIT_PERIOD = float(os.getenv("RATE_LIMIT_PERIOD", 1))
+# Limits of a client across all tenants (0 turns them off), so it cannot get
+# fresh buckets by sending a new X-Tenant-ID with each request
+RATE_LIMIT_CALLER_RATE = float(os.getenv("RATE_LIMIT_CALLER_RATE", 100))
+RATE_LIMIT_CALLER_BURST = int(os.getenv("RATE_LIMIT_CALLER_BURST", 200))
+# Verifies access tokens so per-client limits key on the user, not on the raw header
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+# Verifies operator tokens for the /admin/* routes, the same key as config-service's
+# admin API (`flask admin-token`); the routes answer 503 while it is unset
+ADMIN_SECRET_KEY = os.getenv("CONFIG_ADMIN_SECRET_KEY")
+# Header holding the client address when the gateway is behind a proxy (e.g. X-Forwarded-For)
+RATE_LIMIT_CLIENT_IP_HEADER = os.getenv("RATE_LIMIT_CLIENT_IP_HEADER", "")
+# "memory" (single gateway instance) or "redis" (limits shared by every instance)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+# Connect and read timeout of rate limit checks in Redis, in seconds
+RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", 0.1))
+RATE_LIMIT_MEMORY_MAX_KEYS = int(os.getenv("RATE_LIMIT_MEMORY_MAX_KEYS", 100000))
+# Tenant limits are read from config-service in the background and cached
+TENANT_CONFIG_URL = os.getenv("TENANT_CONFIG_URL", "http://config-service:5002/config/get-config")
+RATE_LIMIT_POLICY_CACHE_SIZE = int(os.getenv("RATE_LIMIT_POLICY_CACHE_SIZE", 10000))
+RATE_LIMIT_POLICY_TTL = int(os.getenv("RATE_LIMIT_POLICY_TTL", 60))
+RATE_LIMIT_POLICY_STALE_TTL = int(os.getenv("RATE_LIMIT_POLICY_STALE_TTL", 600))
+RATE_LIMIT_MAX_POLICY_REFRESHES = int(os.getenv("RATE_LIMIT_MAX_POLICY_REFRESHES", 8))
+RATE_LIMIT_POLICY_RETRY_SECONDS = int(os.getenv("RATE_LIMIT_POLICY_RETRY_SECONDS", 10))
+
+# Adaptive concurrency limit per upstream and CoDel-style shedding of the
+# requests queued over it (see concurrency.py)
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADAPTIVE_INITIAL_LIMIT = int(os.getenv("ADAPTIVE_INITIAL_LIMIT", 20))
+ADAPTIVE_MIN_LIMIT = int(os.getenv("ADAPTIVE_MIN_LIMIT", 4))
+ADAPTIVE_MAX_LIMIT = int(os.getenv("ADAPTIVE_MAX_LIMIT", 500))
+ADAPTIVE_LATENCY_TOLERANCE = float(os.getenv("ADAPTIVE_LATENCY_TOLERANCE", 2))
+ADAPTIVE_BACKOFF = float(os.getenv("ADAPTIVE_BACKOFF", 0.9))
+CODEL_TARGET = float(os.getenv("CODEL_TARGET", 0.05))
+CODEL_INTERVAL = float(os.getenv("CODEL_INTERVAL", 0.5))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 1000))
+# "METHOD service/endpoint" patterns queued first and last
+PRIORITY_HIGH_ROUTES = [pattern.strip() for pattern in os.getenv(
+    "PRIORITY_HIGH_ROUTES", "* auth/*,* */health,* */health/*"
+).split(",") if pattern.strip()]
+PRIORITY_LOW_ROUTES = [pattern.strip() for pattern in os.getenv(
+    "PRIORITY_LOW_ROUTES", "GET db/board/,GET db/thread/,GET db/post/thread/*,GET db/search/*,* db/bulk/*"
+).split(",") if pattern.strip()]
+
+# POST /batch: sub-requests per batch, how many of them run at once, and the
+# largest batch body (see batch.py)
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", 20))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 8))
+# Sub-requests running at once across all batches of a gateway process (one
+# shared thread pool in sync mode); the others wait for a free worker
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", 32))
+BATCH_MAX_BODY_BYTES = int(os.getenv("BATCH_MAX_BODY_BYTES", 1024 * 1024))
+
+# "sync" serves the Flask app; "async" serves the ASGI app in asgi.py with uvicorn
+GATEWAY_MODE = os.getenv("GATEWAY_MODE", "sync")
+GATEWAY_WORKERS = int(os.getenv("GATEWAY_WORKERS", 1))
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", 5))
+
+# Bodies are streamed through in chunks of this size; larger request bodies
+# are rejected with a 413 (0 disables the limit)
+STREAM_CHUNK_SIZE = int(os.getenv("GATEWAY_STREAM_CHUNK_SIZE", 64 * 1024))
+MAX_BODY_BYTES = int(os.getenv("GATEWAY_MAX_BODY_BYTES", 100 * 1024 * 1024))
+
+# Async mode: upstream connection pool shared by all in-flight requests of a worker
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", 1000))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", 200))
@@ -0,0 +1,243 @@
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+# Shared HTTP cache for GET responses proxied by the gateway (RFC 9111, the
+# parts a reverse proxy in front of our own services needs).
+#
+# Entries are keyed by tenant, service, endpoint and normalised query args.
+# Responses are only stored when the upstream marks them as cacheable and
+# gives a validator or a freshness lifetime; responses to requests with
+# credentials or cookies also need "public" or "s-maxage". Stale entries are revalidated
+# with a conditional request, so an unchanged resource costs the upstream a
+# version check and a 304 instead of a full response. The gateway answers
+# the client's own If-None-Match/If-Modified-Since from the entry.
+#
+# Memory is bounded overall and per tenant, so one busy tenant cannot evict
+# everybody else's entries.
+
+CONDITIONAL_HEADERS = {"if-none-match", "if-modified-since", "if-match", "if-unmodified-since", "if-range"}
+# Headers of a 304 that update the stored response
+REVALIDATION_HEADERS = {"cache-control", "etag", "expires", "last-modified", "vary", "date"}
+
+
+def cache_control(headers):
+    """Parse a Cache-Control header into {directive: value or None}."""
+    directives = {}
+    for part in headers.get("Cache-Control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+def _seconds(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _etags(value):
+    return {tag.strip().removeprefix("W/") for tag in value.split(",") if tag.strip()}
+
+
+class CacheEntry:
+    def __init__(self, key, status, headers, body, vary):
+        self.key = key
+        self.status = status
+        self.body = body
+        self.vary = vary
+        self.update(headers)
+
+    def update(self, headers):
+        """(Re)set the stored headers and freshness, on store or after a 304."""
+        self.headers = headers
+        self.stored_at = time.monotonic()
+        lookup = {name.lower(): value for name, value in headers}
+        self.etag = lookup.get("etag")
+        self.last_modified = lookup.get("last-modified")
+        directives = cache_control({"Cache-Control": lookup.get("cache-control", "")})
+        if "no-cache" in directives:
+            self.lifetime = 0
+        else:
+            self.lifetime = _seconds(directives.get("s-maxage", directives.get("max-age")))
+        self.size = len(self.body) + sum(len(name) + len(value) for name, value in headers)
+
+    def age(self):
+        return time.monotonic() - self.stored_at
+
+    def fresh(self, request_headers):
+        directives = cache_control(request_headers)
+        if "no-cache" in directives or request_headers.get("Pragma", "").lower() == "no-cache":
+            return False
+        lifetime = self.lifetime
+        if "max-age" in directives:
+            lifetime = min(lifetime, _seconds(directives["max-age"]))
+        return self.age() < lifetime
+
+    def matches(self, request_headers):
+        """Whether the request selects this variant (Vary)."""
+        return all(request_headers.get(name, "") == value for name, value in self.vary.items())
+
+    def validators(self):
+        """Headers for a conditional request revalidating the entry."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def not_modified_for(self, request_headers):
+        """Whether the client's conditional headers say it already has this response."""
+        if_none_match = request_headers.get("If-None-Match")
+        if if_none_match is not None:
+            return self.etag is not None and (
+                if_none_match.strip() == "*" or self.etag.removeprefix("W/") in _etags(if_none_match)
+            )
+        if_modified_since = request_headers.get("If-Modified-Since")
+        return if_modified_since is not None and if_modified_since == self.last_modified
+
+    def response(self, request_headers, label):
+        """(status, headers, body) answering a request from the entry."""
+        extra = [("Age", str(int(self.age()))), ("X-Gateway-Cache", label)]
+        if self.not_modified_for(request_headers):
+            headers = [(name, value) for name, value in self.headers if name.lower() in REVALIDATION_HEADERS]
+            return 304, headers + extra, b""
+        return self.status, self.headers + extra, self.body
+
+
+class HttpCache:
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._tenants = {}
+        self._tenant_sizes = {}
+        self._paths = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "misses": 0, "revalidated": 0, "not_modified": 0,
+                         "stores": 0, "evictions": 0, "invalidations": 0}
+
+    def count(self, name):
+        with self._lock:
+            self._metrics[name] += 1
+
+    # Request side
+
+    def key(self, method, tenant_id, service, endpoint, args, request_headers):
+        """Cache key of a request, or None if the cache does not apply to it."""
+        if not config.CACHE_ENABLED or method != "GET" or "no-store" in cache_control(request_headers):
+            return None
+        return tenant_id, service, endpoint, tuple(sorted(args))
+
+    def lookup(self, key, request_headers):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry.matches(request_headers):
+                return None
+            self._entries.move_to_end(key)
+            self._tenants[key[0]].move_to_end(key)
+            return entry
+
+    # Response side
+
+    def storable(self, status, response_headers, request_headers):
+        """Whether a response to a cacheable GET may be stored, judging by its headers."""
+        if status != 200 or "Set-Cookie" in response_headers or response_headers.get("Vary", "").strip() == "*":
+            return False
+        directives = cache_control(response_headers)
+        if "no-store" in directives or "private" in directives:
+            return False
+        # The key does not include credentials or cookies, so a response to a request
+        # carrying them is only shared if the upstream explicitly allows it
+        if ("Authorization" in request_headers or "Cookie" in request_headers) and \
+                not {"public", "s-maxage"} & set(directives):
+            return False
+        if not ("ETag" in response_headers or "Last-Modified" in response_headers or
+                _seconds(directives.get("s-maxage", directives.get("max-age")))):
+            return False
+        try:
+            length = int(response_headers.get("Content-Length"))
+        except (TypeError, ValueError):
+            # Bodies of unknown length keep streaming through
+            return False
+        return length <= config.CACHE_MAX_ENTRY_BYTES
+
+    def store(self, key, request_headers, status, headers, body, vary_header):
+        vary = {
+            name.strip(): request_headers.get(name.strip(), "")
+            for name in vary_header.split(",") if name.strip()
+        }
+        entry = CacheEntry(key, status, headers, body, vary)
+        with self._lock:
+            self._remove(key)
+            tenant = self._tenants.setdefault(key[0], OrderedDict())
+            self._entries[key] = tenant[key] = entry
+            self._paths.setdefault(key[:3], set()).add(key)
+            self._size += entry.size
+            self._tenant_sizes[key[0]] = self._tenant_sizes.get(key[0], 0) + entry.size
+            self._metrics["stores"] += 1
+            self._evict(key[0])
+        return entry
+
+    def revalidated(self, entry, response_headers):
+        """Refresh an entry from a 304, keeping its body."""
+        updates = {name.lower(): value for name, value in response_headers.items() if name.lower() in REVALIDATION_HEADERS}
+        headers = [(name, updates.pop(name.lower(), value)) for name, value in entry.headers]
+        headers += [(name, value) for name, value in response_headers.items() if name.lower() in updates]
+        with self._lock:
+            if self._entries.get(entry.key) is entry:
+                previous = entry.size
+                entry.update(headers)
+                self._size += entry.size - previous
+                self._tenant_sizes[entry.key[0]] += entry.size - previous
+            self._metrics["revalidated"] += 1
+
+    def invalidate(self, tenant_id, service, endpoint):
+        """Drop every cached variant of a URL after a write to it (RFC 9111 section 4.4)."""
+        with self._lock:
+            keys = self._paths.pop((tenant_id, service, endpoint), ())
+            for key in list(keys):
+                self._remove(key)
+            if keys:
+                self._metrics["invalidations"] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= entry.size
+        self._tenant_sizes[key[0]] -= entry.size
+        tenant = self._tenants[key[0]]
+        del tenant[key]
+        if not tenant:
+            del self._tenants[key[0]]
+            del self._tenant_sizes[key[0]]
+        paths = self._paths.get(key[:3])
+        if paths is not None:
+            paths.discard(key)
+            if not paths:
+                del self._paths[key[:3]]
+
+    def _evict(self, tenant_id):
+        # Least recently used entries of the tenant first, then of everyone
+        while self._tenant_sizes.get(tenant_id, 0) > config.CACHE_TENANT_MAX_BYTES:
+            self._remove(next(iter(self._tenants[tenant_id])))
+            self._metrics["evictions"] += 1
+        while self._entries and self._size > config.CACHE_MAX_BYTES:
+            self._remove(next(iter(self._entries)))
+            self._metrics["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats.update({"entries": len(self._entries), "bytes": self._size, "tenants": len(self._tenants)})
+        lookups = stats["hits"] + stats["revalidated"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["revalidated"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+http_cache = HttpCache()
@@ -0,0 +1,451 @@
+import logging
+import math
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import quote
+
+import jwt
+
+import config
+from common.auth_utils import bearer_token, verify_session_token
+from common.cache_utils import TTLCache
+from common.http_client import http_client
+
+logger = logging.getLogger("api-gateway")
+
+# Rate limiting per tenant and per client, with the generic cell rate
+# algorithm (GCRA), a token bucket that only stores one timestamp per key:
+# the "theoretical arrival time" (TAT) at which the bucket is full again.
+# Each request pushes the TAT forward by period / rate and is admitted while
+# the TAT stays within burst requests' worth of time from now.
+#
+# A request has to fit both its tenant's bucket and its client's bucket, and
+# only consumes from either when it fits both. Before that it has to fit its
+# caller's bucket: the same client across every tenant, with the
+# RATE_LIMIT_CALLER_* limits, so a client cannot get fresh buckets by making
+# up a new X-Tenant-ID for each request. Clients are told where they
+# stand with RateLimit-Limit/-Remaining/-Reset, and rejected with a 429 and
+# Retry-After.
+#
+# Defaults come from config.py; a tenant can override them with the
+# "rate_limit" feature flag of its config in config-service:
+#
+#   {"rate_limit": {"tenant": {"rate": 1000, "burst": 2000, "period": 1},
+#                   "client": {"rate": 20, "burst": 40}}}
+#
+# Missing fields keep their default, false turns a scope (or, for
+# "rate_limit" itself, the tenant and client limits of the tenant) off; the
+# caller's bucket applies whatever the tenant.
+
+Limit = namedtuple("Limit", ["rate", "burst", "period"])
+Policy = namedtuple("Policy", ["tenant", "client"])
+
+
+def default_policy():
+    return Policy(
+        tenant=Limit(config.RATE_LIMIT_TENANT_RATE, config.RATE_LIMIT_TENANT_BURST, config.RATE_LIMIT_PERIOD),
+        client=Limit(config.RATE_LIMIT_CLIENT_RATE, config.RATE_LIMIT_CLIENT_BURST, config.RATE_LIMIT_PERIOD),
+    )
+
+
+def _limit(value, default):
+    if value is False:
+        return None
+    if not isinstance(value, dict):
+        return default
+    limit = Limit(
+        rate=float(value.get("rate", default.rate)),
+        burst=int(value.get("burst", default.burst)),
+        period=float(value.get("period", default.period)),
+    )
+    if limit.rate <= 0 or limit.burst < 1 or limit.period <= 0:
+        raise ValueError(f"invalid limit {value}")
+    return limit
+
+
+def parse_policy(feature_flags, tenant_id=None):
+    """The rate limits in a tenant's feature flags, or None if rate limiting is off for it."""
+    policy = default_policy()
+    flags = feature_flags.get("rate_limit") if isinstance(feature_flags, dict) else None
+    if flags is False or isinstance(flags, dict) and flags.get("enabled") is False:
+        return None
+    if not isinstance(flags, dict):
+        return policy
+    try:
+        return Policy(tenant=_limit(flags.get("tenant"), policy.tenant), client=_limit(flags.get("client"), policy.client))
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Ignoring the rate_limit feature flag of tenant {tenant_id}: {str(e)}")
+        return policy
+
+
+def client_id(headers, remote_addr):
+    """
+    Who a request counts against: the user (of its tenant) of a valid access
+    token, its address otherwise. Invalid tokens count against the address
+    too, so made-up tokens cannot each get a bucket of their own.
+    """
+    token = bearer_token(headers)
+    if token and config.JWT_SECRET_KEY:
+        try:
+            # Cached per token, so this is a dictionary lookup for repeat callers
+            claims = verify_session_token(token, config.JWT_SECRET_KEY)
+            return f"user:{claims.get('tenant')}:{claims['sub']}"
+        except (jwt.InvalidTokenError, KeyError):
+            pass
+    if config.RATE_LIMIT_CLIENT_IP_HEADER:
+        # The last address was added by our own proxy, earlier ones can be forged
+        forwarded = headers.get(config.RATE_LIMIT_CLIENT_IP_HEADER, "").split(",")[-1].strip()
+        if forwarded:
+            return "ip:" + forwarded
+    return f"ip:{remote_addr}"
+
+
+class Decision:
+    """Outcome of a rate limit check, for the bucket closest to its limit."""
+
+    def __init__(self, allowed, scope, limit, remaining, reset, retry_after):
+        self.allowed = allowed
+        self.scope = scope
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+        self.retry_after = retry_after
+
+    def __str__(self):
+        if self.allowed:
+            return f"{self.remaining} requests left for this {self.scope}"
+        return f"Rate limit for this {self.scope} exceeded; retry in {max(1, math.ceil(self.retry_after))}s"
+
+    def headers(self):
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+def _interval(limit):
+    return limit.period / limit.rate
+
+
+def _fits(limit, delay):
+    """Whether one more request fits a bucket whose TAT is `delay` seconds from now."""
+    # The epsilon absorbs float error in whole multiples of the interval
+    return delay + _interval(limit) <= limit.burst * _interval(limit) + 1e-9
+
+
+class MemoryBackend:
+    """
+    GCRA state in this process, for a single gateway instance. Keys are
+    spread over striped locks, so checks for different tenants do not
+    contend with each other.
+    """
+
+    name = "memory"
+
+    def __init__(self, stripes=64):
+        self._stripes = [(threading.Lock(), {}) for _ in range(stripes)]
+
+    def _stripe(self, key):
+        return hash(key) % len(self._stripes)
+
+    def acquire(self, buckets):
+        """
+        Admit one request against every bucket [(key, limit)], or none of
+        them. Returns [(fits, delay)] per bucket, delay being how far its
+        TAT was ahead of now before the request.
+        """
+        now = time.monotonic()
+        # Always lock stripes in the same order
+        locks = sorted({self._stripe(key) for key, _ in buckets})
+        for index in locks:
+            self._stripes[index][0].acquire()
+        try:
+            results = []
+            for key, limit in buckets:
+                tats = self._stripes[self._stripe(key)][1]
+                delay = max(tats.get(key, now) - now, 0)
+                results.append((_fits(limit, delay), delay))
+            if all(fits for fits, _ in results):
+                for (key, limit), (_, delay) in zip(buckets, results):
+                    self._stripes[self._stripe(key)][1][key] = now + delay + _interval(limit)
+            for index in locks:
+                self._sweep(self._stripes[index][1], now)
+            return results
+        finally:
+            for index in reversed(locks):
+                self._stripes[index][0].release()
+
+    async def acquire_async(self, buckets):
+        return self.acquire(buckets)
+
+    def _sweep(self, tats, now):
+        if len(tats) <= config.RATE_LIMIT_MEMORY_MAX_KEYS // len(self._stripes):
+            return
+        # A key whose TAT has passed is a full bucket, the same as no key
+        for key in [key for key, tat in tats.items() if tat <= now]:
+            del tats[key]
+        # Still too many busy keys: forget the oldest ones
+        while len(tats) > config.RATE_LIMIT_MEMORY_MAX_KEYS // len(self._stripes):
+            del tats[next(iter(tats))]
+
+    def stats(self):
+        return {"keys": sum(len(tats) for _, tats in self._stripes)}
+
+
+# KEYS: bucket keys; ARGV: emission interval and tolerance (burst * interval)
+# in microseconds for each key. Returns fits (0/1) and delay per key. Uses the
+# Redis clock, so every gateway instance agrees on the time.
+GCRA_SCRIPT = """
+redis.replicate_commands()
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000000 + tonumber(clock[2])
+local results = {}
+local tats = {}
+local admitted = true
+for i, key in ipairs(KEYS) do
+    local interval = tonumber(ARGV[2 * i - 1])
+    local tolerance = tonumber(ARGV[2 * i])
+    local tat = tonumber(redis.call('GET', key)) or now
+    if tat < now then
+        tat = now
+    end
+    local fits = tat - now + interval <= tolerance
+    admitted = admitted and fits
+    tats[i] = tat + interval
+    results[2 * i - 1] = fits and 1 or 0
+    results[2 * i] = tat - now
+end
+if admitted then
+    for i, key in ipairs(KEYS) do
+        redis.call('SET', key, string.format('%.0f', tats[i]), 'PX', math.ceil((tats[i] - now) / 1000) + 1)
+    end
+end
+return results
+"""
+
+
+class RedisBackend:
+    """
+    GCRA state in Redis, shared by every gateway instance. A check is one
+    Lua script call, so concurrent requests on different instances cannot
+    both take the last token.
+    """
+
+    name = "redis"
+
+    def __init__(self, redis_url):
+        import redis
+        import redis.asyncio
+
+        # Short timeouts: an unreachable Redis must not hold up every request
+        # before the check gives up and lets it through
+        timeouts = {"socket_connect_timeout": config.RATE_LIMIT_REDIS_TIMEOUT,
+                    "socket_timeout": config.RATE_LIMIT_REDIS_TIMEOUT}
+        self.redis = redis.Redis.from_url(redis_url, **timeouts)
+        self._script = self.redis.register_script(GCRA_SCRIPT)
+        # The async gateway gets its own client, created on its event loop
+        self._async_redis = redis.asyncio.Redis.from_url(redis_url, **timeouts)
+        self._async_script = self._async_redis.register_script(GCRA_SCRIPT)
+
+    @staticmethod
+    def _args(buckets):
+        keys = [key for key, _ in buckets]
+        args = []
+        for _, limit in buckets:
+            interval = _interval(limit) * 1000000
+            args += [int(interval), int(limit.burst * interval)]
+        return keys, args
+
+    @staticmethod
+    def _results(values):
+        return [(bool(values[i]), values[i + 1] / 1000000) for i in range(0, len(values), 2)]
+
+    def acquire(self, buckets):
+        keys, args = self._args(buckets)
+        return self._results(self._script(keys=keys, args=args))
+
+    async def acquire_async(self, buckets):
+        keys, args = self._args(buckets)
+        return self._results(await self._async_script(keys=keys, args=args))
+
+    def stats(self):
+        return {}
+
+
+class TenantPolicies:
+    """
+    Each tenant's rate limits, from its config in config-service. Lookups
+    never wait for config-service: until a tenant's config has been fetched
+    in the background, and while config-service is unreachable, the defaults
+    (or the last known limits) apply.
+    """
+
+    def __init__(self):
+        self._cache = TTLCache(
+            maxsize=config.RATE_LIMIT_POLICY_CACHE_SIZE,
+            ttl=config.RATE_LIMIT_POLICY_TTL,
+            stale_ttl=config.RATE_LIMIT_POLICY_STALE_TTL,
+        )
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id):
+        entry = self._cache.get_entry(tenant_id)
+        if entry is None or entry[1]:
+            self._refresh_in_background(tenant_id, known=entry is not None)
+        return default_policy() if entry is None else entry[0]
+
+    def fetch(self, tenant_id):
+        response = http_client.get(f"{config.TENANT_CONFIG_URL}/{quote(tenant_id, safe='')}")
+        if response.status_code == 404:
+            # Unknown tenants get the defaults; their requests fail upstream anyway
+            return default_policy()
+        if response.status_code != 200:
+            raise Exception(f"config-service answered {response.status_code}")
+        return parse_policy(response.json().get("feature_flags"), tenant_id)
+
+    def _refresh_in_background(self, tenant_id, known):
+        with self._lock:
+            # Bound the threads a flood of made-up tenant ids can start
+            if tenant_id in self._refreshing or len(self._refreshing) >= config.RATE_LIMIT_MAX_POLICY_REFRESHES:
+                return
+            self._refreshing.add(tenant_id)
+
+        def refresh():
+            try:
+                self._cache.set(tenant_id, self.fetch(tenant_id))
+            except Exception as e:
+                logger.warning(f"Failed to load rate limits for tenant {tenant_id}: {str(e)}")
+                if not known:
+                    # Try again in a while rather than on every request
+                    self._cache.set(tenant_id, default_policy(), ttl=config.RATE_LIMIT_POLICY_RETRY_SECONDS)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(tenant_id)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+class RateLimiter:
+    def __init__(self):
+        self.policies = TenantPolicies()
+        self._backend = None
+        self._backend_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._metrics = {"allowed": 0, "limited_caller": 0, "limited_tenant": 0, "limited_client": 0,
+                         "backend_errors": 0}
+
+    @property
+    def backend(self):
+        with self._backend_lock:
+            if self._backend is None:
+                if config.RATE_LIMIT_BACKEND == "redis":
+                    self._backend = RedisBackend(config.REDIS_URL)
+                else:
+                    self._backend = MemoryBackend()
+            return self._backend
+
+    def _buckets(self, tenant_id, client):
+        policy = self.policies.get(tenant_id) if config.RATE_LIMIT_ENABLED else None
+        if policy is None:
+            return []
+        # One hash tag per tenant keeps both keys on the same Redis Cluster slot
+        buckets = []
+        if policy.tenant is not None:
+            buckets.append(("tenant", f"ratelimit:{{{tenant_id}}}:tenant", policy.tenant))
+        if policy.client is not None:
+            buckets.append(("client", f"ratelimit:{{{tenant_id}}}:client:{client}", policy.client))
+        return buckets
+
+    def _caller_buckets(self, client):
+        if not config.RATE_LIMIT_ENABLED or config.RATE_LIMIT_CALLER_RATE <= 0:
+            return []
+        limit = Limit(config.RATE_LIMIT_CALLER_RATE, config.RATE_LIMIT_CALLER_BURST, config.RATE_LIMIT_PERIOD)
+        # Its own hash tag: a separate call, as it shares no slot with the tenant's keys
+        return [("caller", f"ratelimit:{{{client}}}:caller", limit)]
+
+    def check(self, tenant_id, client):
+        """Admit a request, returning a Decision, or None if no limit applies to it."""
+        decisions = []
+        try:
+            for buckets in (self._caller_buckets(client), self._buckets(tenant_id, client)):
+                if buckets:
+                    results = self.backend.acquire([(key, limit) for _, key, limit in buckets])
+                    decisions.append(self._decide(buckets, results))
+                    if not decisions[-1].allowed:
+                        break
+        except Exception as e:
+            return self._failed(e)
+        return self._count(decisions)
+
+    async def check_async(self, tenant_id, client):
+        """Async counterpart of check."""
+        decisions = []
+        try:
+            for buckets in (self._caller_buckets(client), self._buckets(tenant_id, client)):
+                if buckets:
+                    results = await self.backend.acquire_async([(key, limit) for _, key, limit in buckets])
+                    decisions.append(self._decide(buckets, results))
+                    if not decisions[-1].allowed:
+                        break
+        except Exception as e:
+            return self._failed(e)
+        return self._count(decisions)
+
+    def _failed(self, e):
+        # Losing the limiter must not take the gateway down with it
+        logger.warning(f"Rate limit check failed, letting the request through: {str(e)}")
+        with self._lock:
+            self._metrics["backend_errors"] += 1
+        return None
+
+    def _decide(self, buckets, results):
+        admitted = all(fits for fits, _ in results)
+        decisions = []
+        for (scope, _, limit), (fits, delay) in zip(buckets, results):
+            interval = _interval(limit)
+            if fits:
+                after = delay + interval if admitted else delay
+                remaining = max(int((limit.burst * interval - after) / interval + 1e-9), 0)
+                decisions.append(Decision(True, scope, limit.burst, remaining, after, 0))
+            else:
+                decisions.append(Decision(False, scope, limit.burst, 0, delay,
+                                          delay + interval - limit.burst * interval))
+        if admitted:
+            return min(decisions, key=lambda d: d.remaining)
+        return max((d for d in decisions if not d.allowed), key=lambda d: d.retry_after)
+
+    def _count(self, decisions):
+        if not decisions:
+            return None
+        if decisions[-1].allowed:
+            decision = min(decisions, key=lambda d: d.remaining)
+        else:
+            decision = decisions[-1]
+        with self._lock:
+            self._metrics["allowed" if decision.allowed else f"limited_{decision.scope}"] += 1
+        return decision
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["enabled"] = config.RATE_LIMIT_ENABLED
+        stats["backend"] = config.RATE_LIMIT_BACKEND
+        stats["defaults"] = {scope: limit._asdict() for scope, limit in default_policy()._asdict().items()}
+        stats["defaults"]["caller"] = {"rate": config.RATE_LIMIT_CALLER_RATE, "burst": config.RATE_LIMIT_CALLER_BURST,
+                                       "period": config.RATE_LIMIT_PERIOD}
+        stats["policies"] = self.policies.stats()
+        if self._backend is not None:
+            stats.update(self._backend.stats())
+        return stats
+
+
+rate_limiter = RateLimiter()
@@ -1,11 +1,32 @@
 from flask import Blueprint, request, jsonify, Response
-from common.error_handlers import get_dynamic_logger
+from common.error_handlers import (
+    get_dynamic_logger,
+    http_exception_body,
+    service_unavailable_body,
+    gateway_timeout_body,
+    too_many_requests_body,
+    bad_request_body,
+    internal_error_body
+)
 from common.utils import validate_tenant_id
+from common.http_client import http_client, current_deadline, DEADLINE_HEADER
 from flask import current_app
+import functools
+import time
 import config
 import requests
+from streaming import BodyTooLarge, RequestBodyStream, forwardable_headers, declared_length, has_body, iter_raw_response
+from balancer import balancer, NoAvailableEndpoint
+from breaker import breakers, CircuitOpen, FAILURE_STATUSES
+from http_cache import http_cache, CONDITIONAL_HEADERS
+from coalescing import Singleflight, Unshared, flight_key, bufferable
+from rate_limit import rate_limiter, client_id
+from concurrency import limiters, priority, Overloaded, OVERLOAD_STATUSES
+from batch import Batch, BatchError, parse_batch, run_threaded, sub_request_headers
+from admin import admin_denied
 
 gateway_bp = Blueprint('gateway', __name__)
+singleflight = Singleflight()
 
 @gateway_bp.route("/<service>/<path:endpoint>", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 def gateway(service, endpoint):
@@ -15,58 +36,312 @@ def gateway(service, endpoint):
     # Log the incoming request
     logger.info(f"Tenant ID: {tenant_id} | Service: {service} | Endpoint: {endpoint} - Request received")
 
+    decision = rate_limiter.check(tenant_id, client_id(request.headers, request.remote_addr))
+    if decision is not None and not decision.allowed:
+        logger.warning(f"Rate limited tenant: {tenant_id} | Service: {service} | Endpoint: {endpoint} - {str(decision)}")
+        return jsonify(too_many_requests_body(decision)), 429, decision.headers()
+
     try:
         # Handle the request (assuming handle_request is a function you already have)
-        return handle_request(service, endpoint, tenant_id, request)
+        response = handle_request(service, endpoint, tenant_id, request)
+        if decision is not None:
+            response.headers.update(decision.headers())
+        return response
+
+    except BodyTooLarge as e:
+        logger.warning(f"Rejected request to service: {service}, endpoint: {endpoint} - {str(e)}")
+        return jsonify(http_exception_body("Request Entity Too Large", 413, e)), 413
+
+    except CircuitOpen as e:
+        logger.warning(f"Rejected request to service: {service}, endpoint: {endpoint} - {str(e)}")
+        return jsonify(service_unavailable_body(e)), 503, {"Retry-After": str(e.retry_after)}
+
+    except Overloaded as e:
+        logger.warning(f"Shed request to service: {service}, endpoint: {endpoint} - {str(e)}")
+        return jsonify(service_unavailable_body(e)), 503, {"Retry-After": str(e.retry_after)}
+
+    except NoAvailableEndpoint as e:
+        logger.error(f"No instance available for service: {service} - {str(e)}")
+        return jsonify(service_unavailable_body(e)), 503
 
     except requests.exceptions.ConnectionError as e:
         # Log error if a connection error occurs
         logger.error(f"Connection error while trying to reach service: {service}, endpoint: {endpoint} - {str(e)}")
-        return jsonify({"error": "Service Unavailable", "message": str(e)}), 503
+        return jsonify(service_unavailable_body(e)), 503
 
     except requests.exceptions.Timeout as e:
         # Log timeout error
         logger.warning(f"Request to service: {service}, endpoint: {endpoint} timed out - {str(e)}")
-        return jsonify({"error": "Request Timeout", "message": str(e)}), 504
+        return jsonify(gateway_timeout_body(e)), 504
 
     except Exception as e:
         # Log unexpected errors
         logger.exception(f"Unexpected error occurred while processing request: {str(e)}")
-        return jsonify({"error": "Internal Server Error", "message": "Something went wrong on our end."}), 500
+        return jsonify(internal_error_body()), 500
+
+@gateway_bp.route('/batch', methods=['POST'])
+def batch():
+    """Run several gateway requests concurrently and stream their results as NDJSON (see batch.py)."""
+    logger = get_dynamic_logger()
+    tenant_id = validate_tenant_id(request.headers)
+    try:
+        # One byte over the limit is enough to tell the body is too large
+        items, timeout = parse_batch(request.stream.read(config.BATCH_MAX_BODY_BYTES + 1), balancer.services())
+    except BatchError as e:
+        logger.warning(f"Bad Request: {str(e)}")
+        return jsonify(bad_request_body(e)), 400
+
+    # One deadline for the whole batch
+    deadline = time.monotonic() + min(timeout or config.UPSTREAM_TIMEOUT, config.UPSTREAM_TIMEOUT)
+    if current_deadline() is not None:
+        deadline = min(deadline, current_deadline())
+    logger.info(f"Tenant ID: {tenant_id} | Batch of {len(items)} requests received")
+
+    app = current_app._get_current_object()
+    batch_headers = list(request.headers.items())
+    remote_addr = request.remote_addr
+
+    def dispatch(sub_request, deadline):
+        method, path, query, headers, body = sub_request
+        # Through the gateway's own app, so a sub-request is handled exactly
+        # like the same request sent on its own
+        response = app.test_client().open(
+            path,
+            method=method,
+            query_string=query,
+            headers=sub_request_headers(tenant_id, batch_headers, headers, deadline - time.monotonic()),
+            json=body,
+            environ_base={"REMOTE_ADDR": remote_addr},
+        )
+        try:
+            return response.status_code, list(response.headers.items()), response.get_data()
+        finally:
+            response.close()
+
+    return Response(run_threaded(Batch(items, deadline), dispatch), mimetype="application/x-ndjson")
 
 @gateway_bp.route('/health', methods=['GET'])
 def health():
     # Perform any basic checks if needed
     return "OK", 200
 
+def admin_required(f):
+    """Only operators may call an /admin/* route (see admin.py)."""
+    @functools.wraps(f)
+    def decorated(*args, **kwargs):
+        denied = admin_denied(request.headers)
+        if denied is not None:
+            message, status = denied
+            return jsonify({"error": message}), status
+        return f(*args, **kwargs)
+    return decorated
+
+@gateway_bp.route('/admin/upstreams', methods=['GET'])
+@admin_required
+def upstreams():
+    """Per-instance health, ejections, load and latency of every upstream service."""
+    return jsonify(balancer.stats()), 200
+
+@gateway_bp.route('/admin/cache', methods=['GET'])
+@admin_required
+def cache_stats():
+    """Hit rates, revalidations and memory use of the gateway response cache."""
+    return jsonify(http_cache.stats()), 200
+
+@gateway_bp.route('/admin/coalescing', methods=['GET'])
+@admin_required
+def coalescing_stats():
+    """How many requests shared another request's upstream call."""
+    return jsonify(singleflight.stats()), 200
+
+@gateway_bp.route('/admin/rate-limits', methods=['GET'])
+@admin_required
+def rate_limits():
+    """Admitted and rejected requests, default limits and the tenant limit cache."""
+    return jsonify(rate_limiter.stats()), 200
+
+@gateway_bp.route('/admin/concurrency', methods=['GET'])
+@admin_required
+def concurrency():
+    """Adaptive concurrency limit, queue and shed requests per upstream service."""
+    return jsonify(limiters.stats()), 200
+
+@gateway_bp.route('/admin/circuits', methods=['GET'])
+@admin_required
+def circuits():
+    """Circuit breaker state per upstream and the retry budget per upstream host."""
+    return jsonify({"circuits": breakers.stats(), "retry_budgets": http_client.retry_budget_stats()}), 200
+
+def from_cache(entry, client_request, label):
+    status, headers, body = entry.response(client_request.headers, label)
+    if status == 304:
+        http_cache.count("not_modified")
+    return Response(body, status=status, headers=headers)
+
 def handle_request(service, endpoint, tenant_id, client_request):
-    logger = get_dynamic_logger()
-    if service not in config.SERVICE_MAP:
-        raise ValueError(f"Service '{service}' not found in SERVICE_MAP")
+    # Cacheable GETs are served from the gateway cache while the copy there is fresh
+    cache_key = http_cache.key(client_request.method, tenant_id, service, endpoint,
+                               client_request.args.items(multi=True), client_request.headers)
+    entry = http_cache.lookup(cache_key, client_request.headers) if cache_key else None
+    if entry is not None and entry.fresh(client_request.headers):
+        http_cache.count("hits")
+        return from_cache(entry, client_request, "HIT")
+
+    # Stream the request body upstream instead of buffering it
+    length = declared_length(client_request.headers)
+    body = RequestBodyStream(client_request.stream, length) if has_body(client_request.headers, length) else None
 
-    url = f"{config.SERVICE_MAP[service]}/{endpoint}"
-    headers = {key: value for key, value in client_request.headers if key.lower() != "host"}
+    headers = dict(forwardable_headers(client_request.headers, exclude=("host", "x-tenant-id", DEADLINE_HEADER.lower())))
     headers["X-Tenant-ID"] = tenant_id
+    if cache_key:
+        # The gateway answers the client's conditional headers itself, and
+        # revalidates its own copy instead
+        headers = {name: value for name, value in headers.items() if name.lower() not in CONDITIONAL_HEADERS}
+        if entry is not None:
+            headers.update(entry.validators())
+
+    # The gateway starts the deadline; a client may only ask for a shorter one
+    deadline = time.monotonic() + config.UPSTREAM_TIMEOUT
+    client_bound = current_deadline() is not None and current_deadline() < deadline
+    if client_bound:
+        deadline = current_deadline()
+
+    call = functools.partial(proxy, service, endpoint, tenant_id, client_request, headers, body, deadline, client_bound,
+                             cache_key, entry)
+
+    # Identical concurrent GETs on opted-in routes share one upstream call, on
+    # the gateway's own deadline: a client with a shorter one may wait for a
+    # call in flight (as long as its deadline allows) but never starts one
+    key = flight_key(client_request.method, tenant_id, service, endpoint,
+                     client_request.args.items(multi=True), headers, body is not None)
+    if key is None:
+        outcome = call(shared=False)
+    else:
+        try:
+            outcome, leader = singleflight.do(key, lambda: call(shared=True), timeout=deadline - time.monotonic(),
+                                              lead=not client_bound)
+        except TimeoutError as e:
+            raise requests.exceptions.Timeout(str(e))
+        if outcome is None:
+            outcome = call(shared=False)
+        elif isinstance(outcome, Unshared) and not leader:
+            # The leader's response could not be shared (e.g. too large); fetch our own
+            singleflight.unshared()
+            outcome = call(shared=False)
+    return outcome.response if isinstance(outcome, Unshared) else outcome(client_request)
+
+def proxy(service, endpoint, tenant_id, client_request, headers, body, deadline, client_bound, cache_key, entry, shared):
+    """
+    Make the upstream call for a request. Returns a function building the
+    response for any request sharing the call, or Unshared(response) when the
+    response can only be streamed to the request that made the call.
+    `client_bound` says the deadline is the client's, shorter than the gateway's own.
+    """
+    logger = get_dynamic_logger()
+    # Fail fast while the upstream is known to be failing
+    ticket = breakers.acquire(service, tenant_id)
+    try:
+        # Wait for a slot under the upstream's concurrency limit, or be shed
+        slot = limiters.acquire(service, priority(client_request.method, service, endpoint), deadline)
+    except BaseException:
+        breakers.release(ticket, 0, success=None)
+        raise
+    try:
+        instance = balancer.acquire(service)
+    except BaseException:
+        limiters.release(slot)
+        breakers.release(ticket, 0, success=None)
+        raise
+    tried = [instance]
+    started = attempt_started = time.monotonic()
 
+    def failover(failed_url):
+        # Retry on another instance; the one that failed counts the failure
+        nonlocal instance, attempt_started
+        replacement = balancer.acquire(service, exclude=tried)
+        balancer.release(service, instance, time.monotonic() - attempt_started, success=False)
+        instance = replacement
+        tried.append(instance)
+        attempt_started = time.monotonic()
+        logger.info(f"Retrying {failed_url} on {instance.url}")
+        return f"{instance.url}/{endpoint}"
+
+    url = f"{instance.url}/{endpoint}"
     try:
-        logger.info(f"Making request to: {url} with headers: {headers}")
+        logger.info(f"Making request to: {url}")
 
-        response = requests.request(
+        response = http_client.request(
             method=client_request.method,
             url=url,
             headers=headers,
-            data=client_request.get_data(),
+            data=body,
             params=client_request.args,
-            timeout=5
+            timeout=config.UPSTREAM_TIMEOUT,
+            deadline=deadline,
+            failover=failover,
+            stream=True
         )
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        if client_bound and isinstance(e, requests.exceptions.Timeout) and time.monotonic() >= deadline:
+            # The client's short deadline ran out: says nothing about the upstream
+            balancer.release(service, instance, time.monotonic() - attempt_started, success=None)
+            breakers.release(ticket, time.monotonic() - started, success=None)
+            limiters.release(slot)
+        else:
+            balancer.release(service, instance, time.monotonic() - attempt_started, success=False)
+            breakers.release(ticket, time.monotonic() - started, success=False)
+            limiters.release(slot, time.monotonic() - started, dropped=True)
+        logger.warning(f"Request to {service}/{endpoint} failed: {str(e)}")
+        raise
+    except BaseException:
+        # Not the instance's fault (e.g. the client body was too large)
+        balancer.release(service, instance, time.monotonic() - attempt_started, success=None)
+        breakers.release(ticket, time.monotonic() - started, success=None)
+        limiters.release(slot)
+        raise
 
-        logger.info(f"Received response: {response.status_code} from service: {service}, endpoint: {endpoint}")
-        return Response(response.content, status=response.status_code, headers=dict(response.headers))
+    # Latency is time to response headers; the instance stays busy until the body is sent
+    latency = time.monotonic() - started
+    instance_latency = time.monotonic() - attempt_started
+    logger.info(f"Received response: {response.status_code} from service: {service}, endpoint: {endpoint}")
 
-    except requests.exceptions.ConnectionError as e:
-        logger.error(f"Connection error: {str(e)}")
-        raise e
+    def finish():
+        response.close()
+        balancer.release(service, instance, instance_latency, success=response.status_code not in FAILURE_STATUSES)
+        breakers.release(ticket, latency, success=response.status_code not in FAILURE_STATUSES)
+        limiters.release(slot, latency, dropped=response.status_code in OVERLOAD_STATUSES)
 
-    except requests.exceptions.Timeout as e:
-        logger.warning(f"Timeout error: {str(e)}")
-        raise e
+    def read_body():
+        try:
+            return response.raw.read(decode_content=False)
+        finally:
+            finish()
+
+    if cache_key:
+        if entry is not None and response.status_code == 304:
+            finish()
+            http_cache.revalidated(entry, response.raw.headers)
+            return lambda request: from_cache(entry, request, "REVALIDATED")
+        http_cache.count("misses")
+        if http_cache.storable(response.status_code, response.raw.headers, client_request.headers):
+            stored = http_cache.store(cache_key, client_request.headers, response.status_code,
+                                      forwardable_headers(response.raw.headers), read_body(),
+                                      response.raw.headers.get("Vary", ""))
+            return lambda request: from_cache(stored, request, "MISS")
+    elif client_request.method != "GET" and response.status_code < 400:
+        # A successful write makes cached copies of the URL stale
+        http_cache.invalidate(tenant_id, service, endpoint)
+
+    if shared and bufferable(response.raw.headers):
+        status, response_headers, data = response.status_code, forwardable_headers(response.raw.headers), read_body()
+        return lambda request: Response(data, status=status, headers=response_headers)
+
+    # Raw bytes, so Content-Encoding and Content-Length stay valid
+    proxied = Response(
+        iter_raw_response(response.raw),
+        status=response.status_code,
+        headers=forwardable_headers(response.raw.headers)
+    )
+    # Runs once the body is sent or the client goes away
+    proxied.call_on_close(finish)
+    return Unshared(proxied)
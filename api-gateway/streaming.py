@@ -0,0 +1,104 @@
+import config
+
+# Headers that describe a single connection rather than the message, and so
+# must not be forwarded by a proxy (RFC 7230 section 6.1)
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+class BodyTooLarge(Exception):
+    """Raised when a request body exceeds GATEWAY_MAX_BODY_BYTES."""
+
+    def __init__(self, limit=None):
+        self.limit = config.MAX_BODY_BYTES if limit is None else limit
+        super().__init__(f"Request body exceeds the limit of {self.limit} bytes")
+
+
+def forwardable_headers(headers, exclude=()):
+    """
+    Copy end-to-end headers as (name, value) pairs, dropping hop-by-hop
+    headers, any header the Connection header names, and `exclude`
+    (lower-case names). Repeated headers such as Set-Cookie stay separate;
+    Content-Length and Content-Encoding are passed through unchanged.
+    """
+    connection_tokens = {token.strip().lower() for token in headers.get("Connection", "").split(",")}
+    dropped = HOP_BY_HOP_HEADERS | connection_tokens | set(exclude)
+    # httpx merges repeated headers in items(); multi_items() keeps them apart
+    items = headers.multi_items() if hasattr(headers, "multi_items") else headers.items()
+    return [(key, value) for key, value in items if key.lower() not in dropped]
+
+
+def declared_length(headers):
+    """Content-Length of a request as an int, or None; rejects oversized bodies before reading them."""
+    value = headers.get("Content-Length")
+    if not value:
+        return None
+    length = int(value)
+    if config.MAX_BODY_BYTES and length > config.MAX_BODY_BYTES:
+        raise BodyTooLarge()
+    return length
+
+
+def has_body(headers, length):
+    return bool(length) or "chunked" in headers.get("Transfer-Encoding", "").lower()
+
+
+class RequestBodyStream:
+    """
+    Iterates a WSGI input stream in bounded chunks, enforcing the body size
+    limit as bytes arrive. `len` is set when the client declared a length,
+    so the upstream request keeps its Content-Length instead of going chunked.
+    """
+
+    def __init__(self, stream, length=None):
+        self.stream = stream
+        if length is not None:
+            self.len = length
+        self.received = 0
+
+    def __iter__(self):
+        while True:
+            chunk = self.stream.read(config.STREAM_CHUNK_SIZE)
+            if not chunk:
+                return
+            self.received += len(chunk)
+            if config.MAX_BODY_BYTES and self.received > config.MAX_BODY_BYTES:
+                raise BodyTooLarge()
+            yield chunk
+
+
+def iter_raw_response(raw):
+    """
+    Yield an upstream response's undecoded bytes as soon as they arrive, at
+    most STREAM_CHUNK_SIZE at a time. Bodies that are not chunk-encoded are
+    read with read1() so a slow stream is not held back to fill a chunk.
+    """
+    if raw.chunked or not hasattr(raw, "read1"):
+        yield from raw.stream(config.STREAM_CHUNK_SIZE, decode_content=False)
+        return
+    while True:
+        chunk = raw.read1(config.STREAM_CHUNK_SIZE, decode_content=False)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def limited_async_body(chunks):
+    """Async counterpart of RequestBodyStream for ASGI request streams."""
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if config.MAX_BODY_BYTES and received > config.MAX_BODY_BYTES:
+            raise BodyTooLarge()
+        if chunk:
+            yield chunk
@@ -10,7 +10,9 @@ from common.error_handlers import (
     # token_expired_handler,
     # invalid_token_handler
 )
-from extensions import db
+from common.auth_utils import init_auth
+from common.http_client import init_deadline
+from extensions import db, revocation_list, revocation_checker
 # Application-Specific Imports
 from routes import auth_bp
 
@@ -18,6 +20,15 @@ from routes import auth_bp
 def create_app():
     """Factory function to create and configure the Flask app."""
     app = Flask(__name__)
+    app.config.from_object("config.Config")
+
+    # Verify bearer tokens locally on every request, rejecting revoked ones
+    revocation_list.init_app(app)
+    revocation_checker.init_app(app)
+    init_auth(app)
+
+    # Stop early on requests whose caller has already given up
+    init_deadline(app)
 
     # Register error handlers
     register_error_handlers(app)
@@ -5,3 +5,13 @@ class Config:
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
     DB_SERVICE_URL = os.getenv("DB_SERVICE_URL")
 
+    # Session tokens issued at login
+    ACCESS_TOKEN_MINUTES = int(os.getenv("ACCESS_TOKEN_MINUTES", 15))
+    REFRESH_TOKEN_DAYS = int(os.getenv("REFRESH_TOKEN_DAYS", 7))
+
+    # Token revocation: "memory" (single instance) or "redis"
+    REVOCATION_BACKEND = os.getenv("REVOCATION_BACKEND", "memory")
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    REVOCATION_FILTER_CAPACITY = int(os.getenv("REVOCATION_FILTER_CAPACITY", 100000))
+    REVOCATION_FILTER_ERROR_RATE = float(os.getenv("REVOCATION_FILTER_ERROR_RATE", 0.001))
+    REVOCATION_REFRESH_SECONDS = int(os.getenv("REVOCATION_REFRESH_SECONDS", 5))
@@ -1,4 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 
+from revocation import RevocationList, LocalRevocationChecker
+
 # Initialize SQLAlchemy
 db = SQLAlchemy()
+
+# Token revocation list and the checker used by this service's own auth middleware
+revocation_list = RevocationList()
+revocation_checker = LocalRevocationChecker(revocation_list)
@@ -0,0 +1,152 @@
+import threading
+import time
+
+from common.bloom import BloomFilter
+from common.revocation import RevocationChecker, user_key
+
+
+class MemoryRevocationStore:
+    """Revoked keys in process memory; only suitable for a single auth-service instance."""
+
+    def __init__(self):
+        self._entries = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def revoke(self, key, revoked_at, ttl):
+        with self._lock:
+            self._entries[key] = (revoked_at, time.time() + ttl)
+            self._version += 1
+
+    def lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def keys(self):
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]:
+                del self._entries[key]
+            return list(self._entries)
+
+    def version(self):
+        return self._version
+
+
+class RedisRevocationStore:
+    """Revoked keys in Redis, shared by every auth-service instance; entries expire with the tokens."""
+
+    PREFIX = "revoked:"
+    VERSION_KEY = "revocations:version"
+
+    def __init__(self, redis_url):
+        import redis
+        self.redis = redis.Redis.from_url(redis_url)
+
+    def revoke(self, key, revoked_at, ttl):
+        pipe = self.redis.pipeline()
+        pipe.set(self.PREFIX + key, revoked_at, ex=max(int(ttl), 1))
+        pipe.incr(self.VERSION_KEY)
+        pipe.execute()
+
+    def lookup(self, key):
+        value = self.redis.get(self.PREFIX + key)
+        return float(value) if value is not None else None
+
+    def keys(self):
+        return [
+            key.decode("utf-8")[len(self.PREFIX):]
+            for key in self.redis.scan_iter(match=self.PREFIX + "*", count=1000)
+        ]
+
+    def version(self):
+        return int(self.redis.get(self.VERSION_KEY) or 0)
+
+
+class RevocationList:
+    """
+    The revocation subsystem: records revocations in a store and publishes
+    them as a Bloom filter snapshot, rebuilt only when the list has changed.
+    """
+
+    def __init__(self, app=None):
+        self.store = None
+        self.capacity = 100000
+        self.error_rate = 0.001
+        self.entry_ttl = 7 * 24 * 3600
+        self._snapshot = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if app.config.get("REVOCATION_BACKEND", "memory") == "redis":
+            self.store = RedisRevocationStore(app.config["REDIS_URL"])
+        else:
+            self.store = MemoryRevocationStore()
+        self.capacity = app.config.get("REVOCATION_FILTER_CAPACITY", self.capacity)
+        self.error_rate = app.config.get("REVOCATION_FILTER_ERROR_RATE", self.error_rate)
+        # Entries must outlive every token they can apply to
+        self.entry_ttl = app.config.get("REFRESH_TOKEN_DAYS", 7) * 24 * 3600
+        app.extensions["revocation_list"] = self
+
+    def revoke_token(self, claims):
+        """Revoke a single token until it would have expired anyway."""
+        ttl = claims.get("exp", time.time() + self.entry_ttl) - time.time()
+        self.store.revoke(f"jti:{claims['jti']}", time.time(), max(ttl, 1))
+
+    def revoke_user(self, tenant_id, user_id):
+        """Ban a user of a tenant: revoke every token issued so far and refuse new ones."""
+        self.store.revoke(user_key(tenant_id, user_id), time.time(), self.entry_ttl)
+
+    def is_banned(self, tenant_id, user_id):
+        """Whether a user is banned; login and refresh must not issue tokens to them."""
+        return self.store.lookup(user_key(tenant_id, user_id)) is not None
+
+    def lookup(self, key):
+        return self.store.lookup(key)
+
+    def snapshot(self):
+        """Return (etag, filter bytes, filter) for the current revocation list."""
+        version = self.store.version()
+        with self._lock:
+            if self._snapshot is None or self._snapshot[0] != version:
+                keys = self.store.keys()
+                # Never size below the live entries, or the false-positive rate would degrade
+                bloom = BloomFilter(max(self.capacity, len(keys)), self.error_rate)
+                for key in keys:
+                    bloom.add(key)
+                self._snapshot = (version, f'"{version}"', bloom.to_bytes(), bloom)
+            _, etag, data, bloom = self._snapshot
+        return etag, data, bloom
+
+    def stats(self):
+        _, data, bloom = self.snapshot()
+        return {
+            "backend": type(self.store).__name__,
+            "entries": len(bloom),
+            "capacity": self.capacity,
+            "target_false_positive_rate": self.error_rate,
+            "false_positive_rate": round(bloom.false_positive_rate(), 6),
+            "snapshot_bytes": len(data),
+        }
+
+
+class LocalRevocationChecker(RevocationChecker):
+    """auth-service's own checker reads the revocation list directly instead of over HTTP."""
+
+    def __init__(self, revocation_list, app=None):
+        self.revocation_list = revocation_list
+        super().__init__(app)
+
+    def fetch_snapshot(self, etag):
+        current_etag, data, _ = self.revocation_list.snapshot()
+        if current_etag == etag:
+            return None
+        return current_etag, data
+
+    def lookup(self, key):
+        return self.revocation_list.lookup(key)
@@ -1,6 +1,10 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, g, Response
+import jwt
 import requests
-from werkzeug.security import generate_password_hash
+from common.auth_utils import generate_session_tokens, verify_session_token, require_auth, require_service_token, REFRESH_TOKEN
+from common.revocation import revocation_keys, is_revoked_by
+from common.http_client import http_client
+from extensions import revocation_list
 from config import Config
 
 auth_bp = Blueprint('auth', __name__)
@@ -18,7 +22,7 @@ def register():
     # Retrieve user information from the request body
     username = data.get('username')
     email = data.get('email')
-    password = generate_password_hash(data.get('password'))
+    password = data.get('password')  # Hashed once, by db-service
 
     # Validate the input
     if not all([username, email, password]):
@@ -29,7 +33,6 @@ def register():
         return jsonify({"error": "Invalid email format"}), 400
 
     # Prepare the user data for the db-service
-    # IMPORTANT: The password is being double hashed we need to remove that in db-service
     user_data = {"username": username, "email": email, "password": password}
 
     # Set up the request headers with the tenant ID
@@ -38,11 +41,14 @@ def register():
     try:
         # Make a request to the db-service to save the new user
         create_user_url = f"{Config.DB_SERVICE_URL}/db/user/register"
-        db_response = requests.post(create_user_url, json=user_data, headers=headers)
+        db_response = http_client.post(create_user_url, json=user_data, headers=headers)
 
         # Check the db-service response
         if db_response.status_code == 201:
             return jsonify({"message": f"User {username} registered successfully"}), 201
+        elif db_response.status_code == 503:
+            # Password hashing is saturated; pass the fast rejection through
+            return jsonify(db_response.json()), 503
         else:
             # Log the error from db-service and return a 500 error
             current_app.logger.error(f"Failed to register user: {db_response.json()}")
@@ -65,9 +71,20 @@ def login():
 
     try:
         get_login_url = f"{Config.DB_SERVICE_URL}/db/user/login"
-        db_response = requests.post(get_login_url, json=user_data, headers=headers)
+        db_response = http_client.post(get_login_url, json=user_data, headers=headers)
         if db_response.status_code == 200:
-            return jsonify({"message": f"Successfully logged in user {db_response.json()['username']}"}), 200
+            user = db_response.json()
+            # A ban outlasts the tokens it revoked: banned users cannot log back in
+            if revocation_list.is_banned(tenant_id, user['id']):
+                return jsonify({"error": "This account has been banned"}), 403
+            tokens = generate_session_tokens(
+                Config.JWT_SECRET_KEY, user['id'], user['role'], tenant_id,
+                access_minutes=Config.ACCESS_TOKEN_MINUTES, refresh_days=Config.REFRESH_TOKEN_DAYS
+            )
+            return jsonify({"message": f"Successfully logged in user {user['username']}", **tokens}), 200
+        elif db_response.status_code in (401, 503):
+            # Bad credentials or a saturated hashing pool are the client's to see
+            return jsonify(db_response.json()), db_response.status_code
         else:
             # Log the error from db-service and return a 500 error
             current_app.logger.error(f"Failed to login user: {db_response.json()}")
@@ -77,6 +94,106 @@ def login():
         current_app.logger.error(f"Error while making request to db-service: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+@auth_bp.route('/refresh', methods=['POST'])
+def refresh():
+    """Exchange a refresh token for a new access/refresh token pair without re-checking credentials."""
+    data = request.get_json() or {}
+    refresh_token = data.get('refresh_token')
+    if not refresh_token:
+        return jsonify({"error": "Refresh token missing"}), 400
+
+    try:
+        claims = verify_session_token(refresh_token, Config.JWT_SECRET_KEY, token_type=REFRESH_TOKEN)
+    except jwt.ExpiredSignatureError:
+        return jsonify({"error": "Refresh token has expired"}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({"error": "Invalid refresh token"}), 401
+
+    tenant_id = request.headers.get('X-Tenant-ID')
+    if tenant_id and tenant_id != claims['tenant']:
+        return jsonify({"error": "Token was not issued for this tenant"}), 403
+
+    # Refreshes are rare, so check the revocation list exactly rather than via the filter
+    for key in revocation_keys(claims):
+        if is_revoked_by(key, revocation_list.lookup(key), claims):
+            return jsonify({"error": "Refresh token has been revoked"}), 401
+    # Also refuses refresh tokens issued after the ban (e.g. in the same second)
+    if revocation_list.is_banned(claims['tenant'], claims['sub']):
+        return jsonify({"error": "This account has been banned"}), 403
+
+    tokens = generate_session_tokens(
+        Config.JWT_SECRET_KEY, claims['sub'], claims['role'], claims['tenant'],
+        access_minutes=Config.ACCESS_TOKEN_MINUTES, refresh_days=Config.REFRESH_TOKEN_DAYS
+    )
+    return jsonify(tokens), 200
+
+@auth_bp.route('/me', methods=['GET'])
+@require_auth()
+def me():
+    """Return the caller's identity straight from the verified access token."""
+    return jsonify({"id": g.claims['sub'], "role": g.claims['role'], "tenant_id": g.claims['tenant']}), 200
+
+@auth_bp.route('/logout', methods=['POST'])
+@require_auth()
+def logout():
+    """Revoke the caller's access token and, if given, its refresh token."""
+    revocation_list.revoke_token(g.claims)
+
+    refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+    if refresh_token:
+        try:
+            claims = verify_session_token(refresh_token, Config.JWT_SECRET_KEY, token_type=REFRESH_TOKEN)
+        except jwt.InvalidTokenError:
+            claims = None
+        if claims and claims['sub'] == g.claims['sub'] and claims['tenant'] == g.claims['tenant']:
+            revocation_list.revoke_token(claims)
+
+    return jsonify({"message": "Logged out"}), 200
+
+@auth_bp.route('/revoke', methods=['POST'])
+@require_auth('admin')
+def revoke():
+    """Admin ban: revoke every token issued so far to a user of the admin's tenant."""
+    user_id = (request.get_json(silent=True) or {}).get('user_id')
+    if user_id is None:
+        return jsonify({"error": "user_id is required"}), 400
+
+    revocation_list.revoke_user(g.claims['tenant'], user_id)
+    current_app.logger.info(f"Revoked all tokens of user {user_id} in tenant {g.claims['tenant']}")
+    return jsonify({"message": f"Tokens of user {user_id} revoked"}), 200
+
+@auth_bp.route('/revocations/filter', methods=['GET'])
+@require_service_token
+def revocation_filter():
+    """Bloom filter snapshot of the revocation list, polled by every service's auth middleware."""
+    etag, data, bloom = revocation_list.snapshot()
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers={"ETag": etag})
+
+    headers = {
+        "ETag": etag,
+        "X-Bloom-Entries": str(len(bloom)),
+        "X-Bloom-False-Positive-Rate": f"{bloom.false_positive_rate():.6f}",
+    }
+    return Response(data, mimetype="application/octet-stream", headers=headers)
+
+@auth_bp.route('/revocations/lookup', methods=['GET'])
+@require_service_token
+def revocation_lookup():
+    """Exact revocation entry for a key, used after a Bloom filter hit."""
+    key = request.args.get('key')
+    if not key:
+        return jsonify({"error": "key is required"}), 400
+    return jsonify({"key": key, "revoked_at": revocation_list.lookup(key)}), 200
+
+@auth_bp.route('/revocations/stats', methods=['GET'])
+def revocation_stats():
+    """Revocation list size and filter accuracy, plus this service's checker metrics."""
+    return jsonify({
+        "list": revocation_list.stats(),
+        "checker": current_app.extensions["revocation_checker"].stats(),
+    }), 200
+
 # Health check endpoint
 @auth_bp.route('/health', methods=['GET'])
 def health():
@@ -1,10 +1,47 @@
 import jwt
+import os
+import time
+import uuid
+import hashlib
 import datetime
+from functools import wraps
+
+from flask import current_app, g, request, jsonify
+
+from common.cache_utils import TTLCache
+
+ACCESS_TOKEN = "access"
+REFRESH_TOKEN = "refresh"
+# Operator tokens for admin APIs spanning every tenant, signed with their own key
+ADMIN_TOKEN = "admin"
+# Tokens services present to each other's internal endpoints
+SERVICE_TOKEN = "service"
+
+# Verified claims keyed by token digest, so a token presented over and over
+# is only decoded and HMAC-checked once per TOKEN_CACHE_TTL (or until it expires)
+_claims_cache = TTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", 4096)),
+    ttl=int(os.getenv("TOKEN_CACHE_TTL", 300)),
+)
+# Invalid tokens are remembered briefly, in their own cache so a flood of bad
+# tokens cannot evict the valid ones
+_invalid_token_cache = TTLCache(
+    maxsize=int(os.getenv("INVALID_TOKEN_CACHE_SIZE", 1024)),
+    ttl=int(os.getenv("INVALID_TOKEN_CACHE_TTL", 30)),
+)
+
 
 def generate_token(secret_key, payload, expiration_hours=1):
     """
     Generate a JWT token for a given user.
+    The token expires after `expiration_hours`; pass None for a token that never
+    expires (e.g. signed configuration values).
     """
+    payload = dict(payload)
+    if expiration_hours is not None:
+        now = datetime.datetime.utcnow()
+        payload["iat"] = now
+        payload["exp"] = now + datetime.timedelta(hours=expiration_hours)
     token = jwt.encode(payload, secret_key, algorithm="HS256")
     return token
 
@@ -13,5 +50,184 @@ def verify_token(token, secret_key):
     Verify a JWT token and return the decoded payload.
     Raises jwt.ExpiredSignatureError if the token has expired.
     Raises jwt.InvalidTokenError for any other validation error.
+    Results are cached per token (valid ones until they expire, invalid ones
+    briefly), so repeated tokens skip the signature check.
+    """
+    key = _token_digest(token, secret_key)
+
+    claims = _claims_cache.get(key)
+    if claims is not None:
+        exp = claims.get("exp")
+        if exp is None or exp > time.time():
+            return dict(claims)
+        _claims_cache.delete(key)
+
+    rejection = _invalid_token_cache.get(key)
+    if rejection is not None:
+        error_class, message = rejection
+        raise error_class(message)
+
+    try:
+        claims = jwt.decode(token, secret_key, algorithms=["HS256"])
+    except jwt.InvalidTokenError as e:
+        _invalid_token_cache.set(key, (type(e), str(e)))
+        raise
+
+    ttl = _claims_cache.ttl
+    if claims.get("exp") is not None:
+        ttl = min(ttl, claims["exp"] - time.time())
+    _claims_cache.set(key, claims, ttl=ttl)
+    return dict(claims)
+
+def _token_digest(token, secret_key):
+    """Cache key for a token; the key is included so claims never leak across secrets."""
+    return hashlib.sha256(f"{secret_key}\0{token}".encode("utf-8")).hexdigest()
+
+def token_cache_stats():
+    """Hit/miss counters for the verified and rejected token caches."""
+    return {"valid": _claims_cache.stats(), "invalid": _invalid_token_cache.stats()}
+
+def generate_session_tokens(secret_key, user_id, role, tenant_id, access_minutes=15, refresh_days=7):
+    """
+    Issue a short-lived access token and a longer-lived refresh token for a user.
+    Both carry the user id, role and tenant, so other services can authorise
+    requests without looking the user up.
+    """
+    claims = {"sub": str(user_id), "role": role, "tenant": tenant_id}
+    access_token = generate_token(
+        secret_key, {**claims, "type": ACCESS_TOKEN, "jti": uuid.uuid4().hex}, access_minutes / 60
+    )
+    refresh_token = generate_token(
+        secret_key, {**claims, "type": REFRESH_TOKEN, "jti": uuid.uuid4().hex}, refresh_days * 24
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "Bearer",
+        "expires_in": access_minutes * 60,
+    }
+
+def verify_session_token(token, secret_key, token_type=ACCESS_TOKEN):
+    """
+    Verify a session token of the given type and return its claims.
+    Raises jwt.InvalidTokenError if it is of another type (e.g. a refresh
+    token presented as an access token).
+    """
+    claims = verify_token(token, secret_key)
+    if claims.get("type") != token_type:
+        raise jwt.InvalidTokenError(f"Expected an {token_type} token")
+    return claims
+
+def generate_service_token(secret_key, service, expiration_hours=1):
+    """Issue a token for `service` to call another service's internal endpoints."""
+    return generate_token(secret_key, {"sub": service, "type": SERVICE_TOKEN}, expiration_hours)
+
+def bearer_token(headers):
+    """Extract the token from an `Authorization: Bearer <token>` header, or None."""
+    scheme, _, token = headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token.strip()
+
+def authenticate_request(secret_key):
+    """
+    Verify the request's access token locally and store its claims as
+    `g.claims` (None for anonymous, invalid or revoked tokens, with the
+    reason in `g.auth_error`). Revocation is checked when the app has a
+    RevocationChecker installed.
+    """
+    g.claims = None
+    g.auth_error = None
+    token = bearer_token(request.headers)
+    if token is None:
+        return
+    try:
+        claims = verify_session_token(token, secret_key)
+    except jwt.ExpiredSignatureError:
+        g.auth_error = "Token has expired!"
+        return
+    except jwt.InvalidTokenError:
+        g.auth_error = "Invalid token!"
+        return
+
+    checker = current_app.extensions.get("revocation_checker")
+    if checker is not None and checker.is_revoked(claims):
+        g.auth_error = "Token has been revoked!"
+        return
+    g.claims = claims
+
+def init_auth(app):
+    """
+    Authenticate every request of an app before it is dispatched. Invalid
+    tokens are only rejected by views that require authentication.
+    """
+    @app.before_request
+    def load_claims():
+        authenticate_request(app.config["JWT_SECRET_KEY"])
+
+def require_auth(*roles):
+    """
+    Reject requests without a valid access token for the request's tenant,
+    or whose role is not one of `roles` (any role if none are given).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if "claims" not in g:
+                # init_auth is not installed on this app; verify here instead
+                authenticate_request(current_app.config["JWT_SECRET_KEY"])
+
+            if g.claims is None:
+                return jsonify({"error": g.auth_error or "Token is missing!"}), 401
+
+            tenant_id = request.headers.get("X-Tenant-ID")
+            if tenant_id and g.claims.get("tenant") != tenant_id:
+                return jsonify({"error": "Token was not issued for this tenant"}), 403
+            if roles and g.claims.get("role") not in roles:
+                return jsonify({"error": "Insufficient permissions"}), 403
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+def require_service_token(f):
+    """Reject requests without a valid service token (internal endpoints only)."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = bearer_token(request.headers)
+        if token is None:
+            return jsonify({"error": "Token is missing!"}), 401
+        try:
+            claims = verify_token(token, current_app.config["JWT_SECRET_KEY"])
+        except jwt.ExpiredSignatureError:
+            return jsonify({"error": "Token has expired!"}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({"error": "Invalid token!"}), 401
+        if claims.get("type") != SERVICE_TOKEN:
+            return jsonify({"error": "Insufficient permissions"}), 403
+        return f(*args, **kwargs)
+    return decorated
+
+def require_operator_token(f):
+    """
+    Reject requests without an operator token: of type ADMIN_TOKEN with the
+    admin role, signed with the app's ADMIN_SECRET_KEY rather than the key
+    of user sessions (for operations that span every tenant).
     """
-    return jwt.decode(token, secret_key, algorithms=["HS256"])
\ No newline at end of file
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        secret_key = current_app.config.get("ADMIN_SECRET_KEY")
+        if not secret_key or secret_key == current_app.config["JWT_SECRET_KEY"]:
+            return jsonify({"error": "Operator API is disabled: CONFIG_ADMIN_SECRET_KEY is not set"}), 503
+        token = bearer_token(request.headers)
+        if token is None:
+            return jsonify({"error": "Token is missing!"}), 401
+        try:
+            claims = verify_token(token, secret_key)
+        except jwt.ExpiredSignatureError:
+            return jsonify({"error": "Token has expired!"}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({"error": "Invalid token!"}), 401
+        if claims.get("type") != ADMIN_TOKEN or claims.get("role") != "admin":
+            return jsonify({"error": "Insufficient permissions"}), 403
+        return f(*args, **kwargs)
+    return decorated
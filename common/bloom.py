@@ -0,0 +1,65 @@
+import hashlib
+import math
+import struct
+
+# Serialized form: number of bits, number of hash functions and number of
+# items added, followed by the bit array
+_HEADER = struct.Struct(">IIQ")
+
+
+class BloomFilter:
+    """
+    A fixed-size Bloom filter: membership tests never give false negatives,
+    and give false positives at roughly `error_rate` once `capacity` items
+    have been added.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001, num_bits=None, num_hashes=None):
+        capacity = max(int(capacity), 1)
+        if num_bits is None:
+            num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        if num_hashes is None:
+            num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        self.num_bits = max(int(num_bits), 8)
+        self.num_hashes = num_hashes
+        self.count = 0
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.sha256(item.encode("utf-8")).digest()
+        h1, h2 = struct.unpack(">QQ", digest[:16])
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def size_bytes(self):
+        return len(self.bits)
+
+    def false_positive_rate(self):
+        """Expected false-positive rate given the number of items added so far."""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def to_bytes(self):
+        return _HEADER.pack(self.num_bits, self.num_hashes, self.count) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        num_bits, num_hashes, count = _HEADER.unpack_from(data)
+        bloom = cls(num_bits=num_bits, num_hashes=num_hashes)
+        bits = data[_HEADER.size:]
+        if len(bits) != len(bloom.bits):
+            raise ValueError("Truncated Bloom filter snapshot")
+        bloom.bits = bytearray(bits)
+        bloom.count = count
+        return bloom
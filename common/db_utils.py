@@ -1,16 +1,94 @@
-import requests
+import logging
+import os
+import threading
+
 from common.auth_utils import verify_token
-from extensions import cache
+from common.http_client import http_client
+from common.cache_utils import TTLCache
 
+logger = logging.getLogger(__name__)
 
-def get_tenant_db_url(tenant_id, secret_key=None):
-    """Fetch the database URL for a tenant from config-service."""
+# Resolved tenant database URLs (primary and replicas), so the request hot path
+# does not call config-service
+_tenant_url_cache = TTLCache(
+    maxsize=int(os.getenv("TENANT_URL_CACHE_SIZE", 1024)),
+    ttl=int(os.getenv("TENANT_URL_CACHE_TTL", 300)),
+    stale_ttl=int(os.getenv("TENANT_URL_CACHE_STALE_TTL", 600)),
+)
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+
+def fetch_tenant_db_urls(tenant_id, secret_key=None):
+    """
+    Fetch a tenant's database URLs from config-service, bypassing the cache.
+    Returns {"primary": url, "replicas": [url, ...]}.
+    """
     config_service_url = f"http://config-service:5002/config/get-config/{tenant_id}"
 
     # Send GET request to fetch config from config-service
-    response = requests.get(config_service_url)
+    response = http_client.get(config_service_url)
     if response.status_code == 200:
         config_data = response.json()
         payload = verify_token(config_data['database_url_hash'], secret_key)
-        return payload['database_url']
+        replicas = [
+            verify_token(replica_hash, secret_key)['database_url']
+            for replica_hash in config_data.get('replica_url_hashes') or []
+        ]
+        return {"primary": payload['database_url'], "replicas": replicas}
     raise Exception(f"Failed to fetch config for tenant {tenant_id}. Status Code: {response.status_code}")
+
+
+def get_tenant_db_urls(tenant_id, secret_key=None):
+    """
+    Return a tenant's primary and replica database URLs.
+    Fresh cached values are returned directly; stale ones are returned while
+    a background refresh fetches the current value from config-service.
+    """
+    entry = _tenant_url_cache.get_entry(tenant_id)
+    if entry is not None:
+        db_urls, is_stale = entry
+        if is_stale:
+            _refresh_in_background(tenant_id, secret_key)
+        return db_urls
+
+    db_urls = fetch_tenant_db_urls(tenant_id, secret_key)
+    _tenant_url_cache.set(tenant_id, db_urls)
+    return db_urls
+
+
+def get_tenant_db_url(tenant_id, secret_key=None):
+    """Return the primary database URL for a tenant."""
+    return get_tenant_db_urls(tenant_id, secret_key)["primary"]
+
+
+def _refresh_in_background(tenant_id, secret_key):
+    with _refresh_lock:
+        if tenant_id in _refreshing:
+            return
+        _refreshing.add(tenant_id)
+
+    def refresh():
+        try:
+            _tenant_url_cache.set(tenant_id, fetch_tenant_db_urls(tenant_id, secret_key))
+        except Exception as e:
+            # Keep serving the stale value until it falls out of the stale window
+            logger.warning(f"Failed to refresh DB URL for tenant {tenant_id}: {str(e)}")
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(tenant_id)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def invalidate_tenant_db_url(tenant_id=None):
+    """Drop a tenant's cached URL (e.g. after a config update), or every URL if no tenant is given."""
+    if tenant_id is None:
+        _tenant_url_cache.clear()
+    else:
+        _tenant_url_cache.delete(tenant_id)
+
+
+def tenant_db_url_cache_stats():
+    """Hit/miss counters for the tenant URL cache."""
+    return _tenant_url_cache.stats()
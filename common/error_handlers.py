@@ -8,26 +8,63 @@ def get_dynamic_logger():
     logger = logging.getLogger(logger_name)
     return logger
 
-def method_not_allowed_handler(e):
-    logger = get_dynamic_logger()
-    logger.warning(f"Method Not Allowed: {str(e)}")  # Log the error context
+# Error bodies, shared by the Flask handlers below and by servers that are not
+# Flask apps (the async gateway) so every mode returns the same JSON
 
-    response = {
+def method_not_allowed_body():
+    return {
         "error": "Method Not Allowed",
         "message": "The requested method is not allowed for this endpoint."
     }
-    return jsonify(response), 405
+
+def http_exception_body(name, code, description):
+    return {
+        "error": name,
+        "code": code,
+        "message": str(description)
+    }
+
+def service_unavailable_body(e):
+    return {
+        "error": "Service Unavailable",
+        "message": str(e)
+    }
+
+def gateway_timeout_body(e):
+    return {
+        "error": "Request Timeout",
+        "message": str(e)
+    }
+
+def too_many_requests_body(e):
+    return {
+        "error": "Too Many Requests",
+        "message": str(e)
+    }
+
+def bad_request_body(e):
+    return {
+        "error": "Bad Request",
+        "message": str(e)
+    }
+
+def internal_error_body():
+    return {
+        "error": "Internal Server Error",
+        "message": "Something went wrong on our end."
+    }
+
+def method_not_allowed_handler(e):
+    logger = get_dynamic_logger()
+    logger.warning(f"Method Not Allowed: {str(e)}")  # Log the error context
+
+    return jsonify(method_not_allowed_body()), 405
 
 def http_exception_handler(e):
     logger = get_dynamic_logger()
     logger.error(f"HTTP Exception: {str(e)}")  # Log the error details
 
-    response = {
-        "error": e.name,
-        "code": e.code,
-        "message": str(e.description)
-    }
-    return jsonify(response), e.code
+    return jsonify(http_exception_body(e.name, e.code, e.description)), e.code
 
 def unexpected_error_handler(e):
     logger = get_dynamic_logger()
@@ -43,21 +80,13 @@ def service_unavailable_handler(e):
     logger = get_dynamic_logger()
     logger.error(f"Service Unavailable: {str(e)}")  # Log service availability issues
 
-    response = {
-        "error": "Service Unavailable",
-        "message": str(e)
-    }
-    return jsonify(response), 503
+    return jsonify(service_unavailable_body(e)), 503
 
 def bad_request_handler(e):
     logger = get_dynamic_logger()
     logger.warning(f"Bad Request: {str(e)}")  # Log invalid request error
 
-    response = {
-        "error": "Bad Request",
-        "message": str(e)
-    }
-    return jsonify(response), 400
+    return jsonify(bad_request_body(e)), 400
 
 def log_exception(error):
     """Log the details of unhandled exceptions."""
@@ -0,0 +1,246 @@
+import math
+import os
+import random
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import g, has_request_context, jsonify, request
+
+from common.error_handlers import gateway_timeout_body
+
+# Remaining time budget of a request in milliseconds. Each service turns it
+# into a local deadline on arrival and forwards what is left on every call it
+# makes, so no hop keeps working on a request its caller has given up on.
+# A relative budget (rather than an absolute time) is immune to clock skew.
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+# Cookie policy of pooled clients shared by every caller: a cookie set in
+# one caller's response must never be sent on another caller's request
+NO_COOKIES = DefaultCookiePolicy(allowed_domains=[])
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {502, 503, 504}
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised instead of calling an upstream when the request's deadline has already passed."""
+
+
+def init_deadline(app):
+    """
+    Read the caller's deadline for every request into g.deadline, and answer
+    504 straight away if it has already passed (e.g. after queueing).
+    """
+    @app.before_request
+    def load_deadline():
+        budget = request_budget(request.headers)
+        g.deadline = None if budget is None else time.monotonic() + budget
+        if budget is not None and budget <= 0:
+            return jsonify(gateway_timeout_body("Deadline exceeded before the request was processed")), 504
+
+
+def request_budget(headers):
+    """Seconds the caller is still willing to wait, from the deadline header, or None."""
+    try:
+        budget = float(headers[DEADLINE_HEADER]) / 1000
+    except (KeyError, ValueError):
+        return None
+    # "inf" and "nan" parse as floats but are no deadline at all
+    return budget if math.isfinite(budget) else None
+
+
+def current_deadline():
+    """The deadline (time.monotonic()) of the request being handled, or None."""
+    if has_request_context():
+        return g.get("deadline")
+    return None
+
+
+def deadline_remaining(deadline=None):
+    """Seconds left until a deadline (the current request's by default), or None if there is none."""
+    deadline = current_deadline() if deadline is None else deadline
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class RetryBudget:
+    """
+    Caps retries at a share of the calls made, so retrying cannot multiply
+    the load on an upstream that is already struggling. Every call deposits
+    `ratio` of a token and every retry spends a whole one; `min_per_second`
+    tokens trickle in over time so a quiet client can still retry.
+    """
+
+    def __init__(self, ratio=0.1, min_per_second=1.0, max_tokens=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.balance = max_tokens
+        self.calls = 0
+        self.retries = 0
+        self.exhausted = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, amount):
+        now = time.monotonic()
+        amount += (now - self._updated) * self.min_per_second
+        self._updated = now
+        self.balance = min(self.max_tokens, self.balance + amount)
+
+    def deposit(self):
+        with self._lock:
+            self._refill(self.ratio)
+            self.calls += 1
+
+    def withdraw(self):
+        """Spend a token on a retry; False if the budget is used up."""
+        with self._lock:
+            self._refill(0)
+            if self.balance < 1:
+                self.exhausted += 1
+                return False
+            self.balance -= 1
+            self.retries += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            self._refill(0)
+            return {
+                "balance": round(self.balance, 2),
+                "calls": self.calls,
+                "retries": self.retries,
+                "exhausted": self.exhausted,
+            }
+
+
+class ServiceClient:
+    """
+    HTTP client for calls between services.
+
+    Keeps a keep-alive connection pool per upstream host, applies connect
+    and read timeouts to every call, retries idempotent calls on connection
+    errors and 502/503/504 with jittered exponential backoff within a
+    per-host retry budget, and forwards the remaining request deadline.
+    """
+
+    def __init__(self, pool_size=20, connect_timeout=1.0, read_timeout=5.0, retries=2, backoff=0.05,
+                 retry_budget_ratio=0.1, retry_budget_min_per_second=1.0):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_budget_ratio = retry_budget_ratio
+        self.retry_budget_min_per_second = retry_budget_min_per_second
+        self._sessions = {}
+        self._budgets = {}
+        self._lock = threading.Lock()
+
+    def _session(self, url):
+        """Connection pool and retry budget of a URL's host."""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        session = self._sessions.get(key)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is None:
+                    session = requests.Session()
+                    session.cookies.set_policy(NO_COOKIES)
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount(f"{parts.scheme}://", adapter)
+                    self._budgets[key] = RetryBudget(self.retry_budget_ratio, self.retry_budget_min_per_second)
+                    self._sessions[key] = session
+        return session, self._budgets[key]
+
+    def retry_budget_stats(self):
+        with self._lock:
+            budgets = dict(self._budgets)
+        return {f"{scheme}://{netloc}": budget.stats() for (scheme, netloc), budget in budgets.items()}
+
+    def request(self, method, url, timeout=None, deadline=None, retries=None, failover=None, **kwargs):
+        """
+        Send a request; takes the same keyword arguments as requests.request.
+        `timeout` is a read timeout or a (connect, read) pair; `deadline`
+        (time.monotonic()) defaults to the deadline of the current request.
+        `failover(url)`, called with the URL of a failed attempt before a
+        retry, returns the URL to retry instead (e.g. another instance).
+        """
+        method = method.upper()
+        deadline = current_deadline() if deadline is None else deadline
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (
+            self.connect_timeout, timeout or self.read_timeout
+        )
+        # A streamed body can only be sent once
+        body = kwargs.get("data")
+        replayable = body is None or isinstance(body, (bytes, str, dict, list, tuple))
+        attempts = 1 + (self.retries if retries is None else retries) if (
+            method in IDEMPOTENT_METHODS and replayable
+        ) else 1
+
+        session, budget = self._session(url)
+        budget.deposit()
+        headers = dict(kwargs.pop("headers", None) or {})
+        for attempt in range(attempts):
+            remaining = deadline_remaining(deadline)
+            if remaining is not None:
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"Deadline exceeded before calling {url}")
+                headers[DEADLINE_HEADER] = str(int(remaining * 1000))
+            call_timeout = (
+                connect_timeout if remaining is None else min(connect_timeout, remaining),
+                read_timeout if remaining is None else min(read_timeout, remaining),
+            )
+
+            last_attempt = attempt == attempts - 1
+            try:
+                response = session.request(method, url, headers=headers, timeout=call_timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_attempt or not budget.withdraw():
+                    raise
+            else:
+                if last_attempt or response.status_code not in RETRY_STATUSES or not budget.withdraw():
+                    return response
+                response.close()
+
+            if failover is not None:
+                url = failover(url)
+                session, budget = self._session(url)
+
+            # Full jitter, but never sleep past the deadline
+            delay = random.uniform(0, self.backoff * (2 ** attempt))
+            remaining = deadline_remaining(deadline)
+            if remaining is not None:
+                delay = min(delay, max(remaining, 0))
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+
+# Shared by every caller in the process
+http_client = ServiceClient(
+    pool_size=int(os.getenv("HTTP_POOL_SIZE", 20)),
+    connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", 1)),
+    read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", 5)),
+    retries=int(os.getenv("HTTP_RETRIES", 2)),
+    backoff=float(os.getenv("HTTP_RETRY_BACKOFF", 0.05)),
+    retry_budget_ratio=float(os.getenv("HTTP_RETRY_BUDGET_RATIO", 0.1)),
+    retry_budget_min_per_second=float(os.getenv("HTTP_RETRY_BUDGET_MIN_PER_SECOND", 1)),
+)
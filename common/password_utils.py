@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from werkzeug import security
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Work factors werkzeug uses when a method string leaves them out
+DEFAULT_PARAMETERS = {
+    "pbkdf2": ["sha256", str(getattr(security, "DEFAULT_PBKDF2_ITERATIONS", 260000))],
+    "scrypt": [str(2 ** 15), "8", "1"],
+}
+
+
+def hash_parameters(method):
+    """
+    The KDF and work factor a werkzeug method string ("pbkdf2:sha256",
+    "scrypt:32768:8:1", ...) or a stored hash stands for, defaults filled in.
+    """
+    name, *args = method.split("$", 1)[0].split(":")
+    defaults = DEFAULT_PARAMETERS.get(name, [])
+    return tuple([name] + args + defaults[len(args):])
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool is saturated and the request should be rejected with a 503."""
+
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification in a bounded process pool, so the
+    deliberately slow KDF neither blocks the request thread's GIL nor lets a
+    login storm queue up unbounded work.
+    """
+
+    def __init__(self, app=None):
+        self.method = "pbkdf2:sha256:600000"
+        self.workers = os.cpu_count() or 1
+        self.max_pending = 64
+        self.timeout = 10
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config.get("PASSWORD_HASH_METHOD", self.method)
+        self.workers = app.config.get("PASSWORD_HASH_WORKERS", self.workers)
+        self.max_pending = app.config.get("PASSWORD_HASH_MAX_PENDING", self.max_pending)
+        self.timeout = app.config.get("PASSWORD_HASH_TIMEOUT", self.timeout)
+        app.extensions["password_hasher"] = self
+
+    def _get_executor(self):
+        # Created lazily so every forked server worker gets its own pool. The pool's
+        # processes are never forked from this threaded process, as a child could
+        # inherit a lock held by another thread
+        with self._lock:
+            if self._executor is None:
+                start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(start_method)
+                )
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+            return self._executor
+
+    def _run(self, fn, *args, **kwargs):
+        executor = self._get_executor()
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PasswordHasherBusy("Too many pending password operations, try again shortly")
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the KDF has finished, even after the caller stopped
+        # waiting, so max_pending bounds the work actually queued in the pool
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise PasswordHasherBusy("Password operation timed out")
+
+    def hash(self, password):
+        """Hash a password with the configured work factor."""
+        return self._run(generate_password_hash, password, method=self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with a different method or work factor than configured."""
+        return hash_parameters(password_hash) != hash_parameters(self.method)
+
+    def stats(self):
+        in_flight = self.max_pending - self._slots._value if self._slots is not None else 0
+        return {
+            "method": self.method,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": in_flight,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
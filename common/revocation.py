@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+
+from common.auth_utils import generate_service_token
+from common.bloom import BloomFilter
+from common.cache_utils import TTLCache
+from common.http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+
+def user_key(tenant_id, user_id):
+    """Revocation entry banning a user of a tenant."""
+    return f"user:{tenant_id}:{user_id}"
+
+
+def revocation_keys(claims):
+    """
+    Revocation entries that can apply to a token: the token itself (logout)
+    and every token of its user in its tenant (ban).
+    """
+    keys = []
+    if claims.get("jti"):
+        keys.append(f"jti:{claims['jti']}")
+    if claims.get("sub") is not None and claims.get("tenant"):
+        keys.append(user_key(claims['tenant'], claims['sub']))
+    return keys
+
+
+def is_revoked_by(key, revoked_at, claims):
+    """A user ban only applies to tokens issued before it; token revocations always apply."""
+    if revoked_at is None:
+        return False
+    if key.startswith("user:"):
+        return claims.get("iat", 0) <= revoked_at
+    return True
+
+
+class RevocationChecker:
+    """
+    Checks tokens against auth-service's revocation list without a network
+    hop per request: a Bloom filter snapshot of the revoked keys is refreshed
+    in the background, and the exact revocation entry is only looked up when
+    the filter reports a possible match.
+
+    Until the first snapshot arrives (or if auth-service is unreachable)
+    tokens are accepted; `stats()` reports how old the snapshot is.
+    """
+
+    def __init__(self, app=None):
+        self.service_url = "http://auth-service:5001/auth/revocations"
+        self.refresh_interval = 30
+        self.timeout = 2
+        self.secret_key = None
+        self._token = None
+        self._filter = None
+        self._etag = None
+        self._loaded_at = None
+        self._lookups = TTLCache(maxsize=4096, ttl=self.refresh_interval)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._metrics = {"checks": 0, "filter_hits": 0, "lookups": 0, "revoked": 0,
+                         "false_positives": 0, "refreshes": 0, "refresh_failures": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.service_url = app.config.get("REVOCATION_SERVICE_URL", self.service_url)
+        self.refresh_interval = app.config.get("REVOCATION_REFRESH_SECONDS", self.refresh_interval)
+        self.secret_key = app.config.get("JWT_SECRET_KEY")
+        self._lookups = TTLCache(maxsize=4096, ttl=self.refresh_interval)
+        app.extensions["revocation_checker"] = self
+
+    def _count(self, name):
+        with self._lock:
+            self._metrics[name] += 1
+
+    def _ensure_started(self):
+        # Started lazily so every forked server worker runs its own refresher
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            self.refresh()
+            time.sleep(self.refresh_interval)
+
+    def refresh(self):
+        """Load the current filter snapshot; an unchanged snapshot is not re-downloaded."""
+        try:
+            result = self.fetch_snapshot(self._etag)
+            if result is not None:
+                etag, data = result
+                self._filter = BloomFilter.from_bytes(data)
+                self._etag = etag
+                # Entries looked up against the old snapshot may have changed
+                self._lookups.clear()
+            self._loaded_at = time.time()
+            self._count("refreshes")
+        except Exception as e:
+            self._count("refresh_failures")
+            logger.warning(f"Failed to refresh revocation filter: {str(e)}")
+
+    def _auth_headers(self):
+        """Service token for auth-service's revocation endpoints, renewed before it expires."""
+        if not self.secret_key:
+            return {}
+        token = self._token
+        if token is None or token[1] - time.time() < 300:
+            token = self._token = (generate_service_token(self.secret_key, "revocation-checker"), time.time() + 3600)
+        return {"Authorization": f"Bearer {token[0]}"}
+
+    def fetch_snapshot(self, etag):
+        """Return (etag, filter bytes), or None if the snapshot has not changed since `etag`."""
+        headers = self._auth_headers()
+        if etag:
+            headers["If-None-Match"] = etag
+        response = http_client.get(f"{self.service_url}/filter", headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        return response.headers.get("ETag"), response.content
+
+    def lookup(self, key):
+        """Exact revocation time of a key (epoch seconds), or None if it is not revoked."""
+        response = http_client.get(f"{self.service_url}/lookup", params={"key": key},
+                                   headers=self._auth_headers(), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json().get("revoked_at")
+
+    def is_revoked(self, claims):
+        self._ensure_started()
+        self._count("checks")
+        bloom = self._filter
+        if bloom is None:
+            return False
+
+        for key in revocation_keys(claims):
+            if key not in bloom:
+                continue
+            self._count("filter_hits")
+            entry = self._lookups.get_entry(key)
+            if entry is None:
+                self._count("lookups")
+                try:
+                    revoked_at = self.lookup(key)
+                except Exception as e:
+                    logger.warning(f"Revocation lookup for {key} failed: {str(e)}")
+                    continue
+                self._lookups.set(key, revoked_at)
+            else:
+                revoked_at = entry[0]
+            if is_revoked_by(key, revoked_at, claims):
+                self._count("revoked")
+                return True
+            self._count("false_positives")
+        return False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        bloom = self._filter
+        stats.update({
+            "refresh_interval": self.refresh_interval,
+            "snapshot_age_seconds": round(time.time() - self._loaded_at, 1) if self._loaded_at else None,
+            "snapshot_etag": self._etag,
+            "filter_entries": len(bloom) if bloom is not None else None,
+            "filter_size_bytes": bloom.size_bytes if bloom is not None else None,
+            "filter_false_positive_rate": round(bloom.false_positive_rate(), 6) if bloom is not None else None,
+        })
+        return stats
@@ -1,3 +1,4 @@
+import click
 from flask import Flask
 from flask_migrate import Migrate
 from werkzeug.exceptions import HTTPException, MethodNotAllowed
@@ -5,6 +6,8 @@ from werkzeug.exceptions import HTTPException, MethodNotAllowed
 from config import Config
 from extensions import db, cache
 from routes import config_bp
+from common.http_client import init_deadline
+from common.auth_utils import generate_token, ADMIN_TOKEN
 import logging
 from common.error_handlers import (
     method_not_allowed_handler,
@@ -28,6 +31,19 @@ def create_app():
     cache.init_app(app)
     migrate.init_app(app, db)
 
+    # Stop early on requests whose caller has already given up
+    init_deadline(app)
+
+    @app.cli.command("admin-token")
+    @click.argument("subject")
+    @click.option("--hours", default=1, show_default=True, help="Token lifetime.")
+    def admin_token(subject, hours):
+        """Print an operator token for the admin API, signed with ADMIN_SECRET_KEY."""
+        if not app.config.get("ADMIN_SECRET_KEY"):
+            raise click.UsageError("CONFIG_ADMIN_SECRET_KEY is not set")
+        payload = {"sub": subject, "role": "admin", "type": ADMIN_TOKEN}
+        click.echo(generate_token(app.config["ADMIN_SECRET_KEY"], payload, expiration_hours=hours))
+
     return app
 
 def register_error_handlers(app):
@@ -1,23 +1,34 @@
 import jwt
 from flask import request, jsonify
 from functools import wraps
+from common.auth_utils import verify_token, ADMIN_TOKEN
 from config import Config
 
-SECRET_KEY = Config.JWT_SECRET_KEY
+SECRET_KEY = Config.ADMIN_SECRET_KEY
 
 def token_required(f):
+    """
+    Require an operator token: signed with ADMIN_SECRET_KEY rather than the
+    key of user sessions, of type "admin" and with the admin role.
+    """
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.headers.get("Authorization")
         if not token:
             return jsonify({"error": "Token is missing!"}), 401
+        if not SECRET_KEY or SECRET_KEY == Config.JWT_SECRET_KEY:
+            return jsonify({"error": "Admin API is disabled: CONFIG_ADMIN_SECRET_KEY is not set"}), 503
 
         try:
-            jwt.decode(token.split(" ")[1], SECRET_KEY, algorithms=["HS256"])
+            # Shared verified-token cache: repeated admin tokens skip the HMAC check
+            claims = verify_token(token.split(" ")[-1], SECRET_KEY)
         except jwt.ExpiredSignatureError:
             return jsonify({"error": "Token has expired!"}), 401
         except jwt.InvalidTokenError:
             return jsonify({"error": "Invalid token!"}), 401
 
+        if claims.get("type") != ADMIN_TOKEN or claims.get("role") != "admin":
+            return jsonify({"error": "Insufficient permissions"}), 403
+
         return f(*args, **kwargs)
     return decorated
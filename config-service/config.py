@@ -6,3 +6,6 @@ class Config:
     CACHE_TYPE = os.getenv("CACHE_TYPE") # "RedisCache"
     CACHE_REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "default_secret_key")
+    # Signs operator tokens for the admin API; must differ from JWT_SECRET_KEY,
+    # which also signs user sessions. The admin API is disabled while unset.
+    ADMIN_SECRET_KEY = os.getenv("CONFIG_ADMIN_SECRET_KEY")
@@ -0,0 +1,24 @@
+"""Add replica_url_hashes to tenant_db
+
+Revision ID: 4a7d2e9c1f35
+Revises: 9e186f5f4e2d
+Create Date: 2026-10-18 17:02:11.603845
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a7d2e9c1f35'
+down_revision = '9e186f5f4e2d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tenant_db', sa.Column('replica_url_hashes', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('tenant_db', 'replica_url_hashes')
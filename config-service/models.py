@@ -14,6 +14,9 @@ class TenantConfig(db.Model):
     # Database URL for the tenant (this will be used to connect to the tenant-specific database)
     database_url_hash = db.Column(db.String(255), nullable=False)
 
+    # Optional read replicas, stored as a list of signed tokens like database_url_hash
+    replica_url_hashes = db.Column(db.JSON, nullable=True)
+
     # Feature flags or other configuration settings in JSON format
     feature_flags = db.Column(db.JSON, nullable=True)
 
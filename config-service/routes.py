@@ -2,11 +2,15 @@ from flask import Blueprint, request, jsonify
 from extensions import db, cache
 from models import TenantConfig
 from auth import token_required
-from common.auth_utils import generate_token, verify_token
+from common.auth_utils import generate_token, verify_token, token_cache_stats
 from config import Config
 
 config_bp = Blueprint("config", __name__)
 
+def hash_replica_urls(replica_urls):
+    """Sign each replica URL the same way as the primary database URL."""
+    return [generate_token(Config.JWT_SECRET_KEY, {"database_url": url}, expiration_hours=None) for url in replica_urls or []]
+
 @config_bp.route("/get-config/<tenant_id>", methods=["GET"])
 def get_config(tenant_id):
     # Check if the configuration is cached
@@ -24,6 +28,7 @@ def get_config(tenant_id):
     response = {
         "tenant_id": db_response.tenant_id,
         "database_url_hash": db_response.database_url_hash,
+        "replica_url_hashes": db_response.replica_url_hashes or [],
         "feature_flags": db_response.feature_flags
     }
 
@@ -50,11 +55,13 @@ def add_config():
         payload = {
             "database_url": data["database_url"]
         }
-        database_url_hash = generate_token(Config.JWT_SECRET_KEY, payload)
+        # Signed configuration values must not expire
+        database_url_hash = generate_token(Config.JWT_SECRET_KEY, payload, expiration_hours=None)
         # Create the new tenant configuration
         config = TenantConfig(
             tenant_id=data["tenant_id"],
             database_url_hash=database_url_hash,
+            replica_url_hashes=hash_replica_urls(data.get("replica_urls")),
             feature_flags=data.get("feature_flags")
         )
         db.session.add(config)
@@ -79,6 +86,8 @@ def update_config(tenant_id):
     # Update the relevant fields in the tenant config
     config.database_url = data.get("database_url_hash", config.database_url)  # Update database_url
     config.feature_flags = data.get("feature_flags", config.feature_flags)  # Update feature_flags
+    if "replica_urls" in data:
+        config.replica_url_hashes = hash_replica_urls(data["replica_urls"])  # Update read replicas
 
     # Commit the changes to the database
     db.session.commit()
@@ -114,6 +123,11 @@ def test_cache():
         return f"Cache works! Value: {cached_value}", 200
     return "Cache not working.", 500
 
+@config_bp.route('/health/token-cache', methods=['GET'])
+def token_cache_health():
+    """Report hit rates of the verified-token cache."""
+    return jsonify(token_cache_stats()), 200
+
 @config_bp.route('/health', methods=['GET'])
 def health():
     # Perform any basic checks if needed
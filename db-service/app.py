@@ -3,7 +3,6 @@ from flask import Flask, request, jsonify
 from flask_migrate import Migrate
 from werkzeug.exceptions import MethodNotAllowed, HTTPException
 from models import Board, Thread
-from common.db_utils import get_tenant_db_url
 from common.error_handlers import (
     unexpected_error_handler,
     method_not_allowed_handler,
@@ -12,8 +11,13 @@ from common.error_handlers import (
     service_unavailable_handler,
     log_exception
 )
-from extensions import db, cache
+from extensions import db, cache, engine_registry, replica_monitor, password_hasher, revocation_checker
+from common.password_utils import PasswordHasherBusy
+from tenant_db import bind_tenant
+from common.auth_utils import init_auth
+from common.http_client import init_deadline
 from routes import db_bp
+from cli import bulk_cli, counters_cli
 
 migrate = Migrate()
 
@@ -28,23 +32,38 @@ def create_app():
 
     db.init_app(app)
     cache.init_app(app)
+    engine_registry.init_app(app)
+    replica_monitor.init_app(app)
+    password_hasher.init_app(app)
     migrate.init_app(app, db)
 
+    # Verify bearer tokens locally, so authenticated requests carry the
+    # user's id and role in g.claims without querying the users table
+    revocation_checker.init_app(app)
+    init_auth(app)
+
+    # Stop early on requests whose caller has already given up
+    init_deadline(app)
+
     # Register routes
     app.register_blueprint(db_bp, url_prefix='/db')
 
+    # Register CLI commands
+    app.cli.add_command(bulk_cli)
+    app.cli.add_command(counters_cli)
+
     # Register error handlers
     register_error_handlers(app)
 
-    # Before request hook to dynamically set the DB URL
+    # Before request hook to bind the tenant's database to this request only.
+    # Nothing process-global is touched, so concurrent requests for different
+    # tenants can be served by threaded or greenlet workers.
     @app.before_request
-    def set_db_url():
+    def set_tenant():
         tenant_id = request.headers.get('X-Tenant-ID')
         if tenant_id:
             try:
-                db_url = get_tenant_db_url(tenant_id, app.config["JWT_SECRET_KEY"])
-                app.config['SQLALCHEMY_DATABASE_URI'] = db_url
-                app.logger.info(f"Database URL set for tenant {tenant_id}")
+                bind_tenant(tenant_id)
             except Exception as e:
                 app.logger.error(f"Failed to fetch DB URL for tenant {tenant_id}: {str(e)}")
                 return {'error': str(e)}, 500
@@ -55,6 +74,7 @@ def register_error_handlers(app):
     """Register custom error handlers for the application."""
     app.register_error_handler(ValueError, bad_request_handler)
     app.register_error_handler(requests.exceptions.ConnectionError, service_unavailable_handler)
+    app.register_error_handler(PasswordHasherBusy, service_unavailable_handler)
     app.register_error_handler(MethodNotAllowed, method_not_allowed_handler)
     app.register_error_handler(HTTPException, http_exception_handler)
     app.register_error_handler(Exception, unexpected_error_handler)
@@ -68,4 +88,4 @@ def validation_error_handler(err):
 
 if __name__ == "__main__":
     app = create_app()
-    app.run(host="0.0.0.0", port=5003)
+    app.run(host="0.0.0.0", port=5003, threaded=True)
@@ -0,0 +1,284 @@
+import csv
+import datetime
+import io
+import json
+import time
+import zlib
+
+from sqlalchemy import func, text
+
+from models import User, Board, Thread, Post
+
+DEFAULT_CHUNK_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+
+# Left out of HTTP exports unless an admin asks for them
+SECRET_COLUMNS = {"password_hash"}
+
+# Record types in dependency order: parents must be written before children
+RECORD_TYPES = {
+    "user": {"model": User, "columns": ["id", "username", "email", "password_hash", "role"], "parents": {}},
+    "board": {"model": Board, "columns": ["id", "name", "description", "created_at"], "parents": {}},
+    "thread": {"model": Thread, "columns": ["id", "board_id", "title", "description", "created_at"],
+               "parents": {"board_id": "board"}},
+    "post": {"model": Post, "columns": ["id", "thread_id", "content", "created_at"], "parents": {"thread_id": "thread"}},
+}
+
+
+class ImportFailed(Exception):
+    """
+    Raised when an import stops part way. Chunks written before the failure
+    stay committed; `report` counts them and `error` is the cause.
+    """
+
+    def __init__(self, error, report):
+        super().__init__(str(error))
+        self.error = error
+        self.report = report
+
+
+class BulkImporter:
+    """
+    Load NDJSON/CSV records into a tenant database in chunked transactions.
+
+    Every record gets a new id in the target database; references to parents
+    imported earlier in the same run are remapped to the new ids. A reference
+    to a parent that was not imported (yet) is an error, unless
+    attach_existing is set: it then keeps the id as it is, so rows can be
+    attached to boards/threads that already exist in the target database.
+    On Postgres ids are reserved from the table sequences and rows are loaded
+    with COPY; other databases use batched multi-row inserts.
+    """
+
+    def __init__(self, db_session, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, attach_existing=False):
+        self.db_session = db_session
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.attach_existing = attach_existing
+        self.use_copy = db_session.get_bind().dialect.name == 'postgresql'
+        self.id_map = {record_type: {} for record_type in RECORD_TYPES}
+        self.buffers = {record_type: [] for record_type in RECORD_TYPES}
+        self.counts = {record_type: 0 for record_type in RECORD_TYPES}
+        self.chunks = 0
+        self.started_at = time.monotonic()
+
+    def add(self, record_type, record):
+        if record_type not in RECORD_TYPES:
+            raise ValueError(f"Unknown record type '{record_type}'")
+        self.buffers[record_type].append(record)
+        if len(self.buffers[record_type]) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write every buffered record in one transaction, parents first."""
+        if not any(self.buffers.values()):
+            return
+        try:
+            for record_type in RECORD_TYPES:
+                records = self.buffers[record_type]
+                if records:
+                    self._write(record_type, records)
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            raise
+
+        for record_type, records in self.buffers.items():
+            self.counts[record_type] += len(records)
+            records.clear()
+        self.chunks += 1
+        if self.progress is not None:
+            self.progress(self.report())
+
+    def finish(self):
+        self.flush()
+        return self.report()
+
+    def report(self):
+        elapsed = time.monotonic() - self.started_at
+        total = sum(self.counts.values())
+        return {
+            "imported": dict(self.counts),
+            "total": total,
+            "chunks": self.chunks,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(total / elapsed, 1) if elapsed > 0 else None,
+        }
+
+    def _write(self, record_type, records):
+        spec = RECORD_TYPES[record_type]
+        table = spec["model"].__table__
+        new_ids = self._allocate_ids(table, len(records))
+
+        rows = []
+        existing = {}
+        for record, new_id in zip(records, new_ids):
+            row = {column: record.get(column) for column in spec["columns"]}
+            old_id = row["id"]
+            row["id"] = new_id
+            for column, parent_type in spec["parents"].items():
+                if row[column] is None:
+                    raise ValueError(f"{record_type} record {old_id} is missing {column}")
+                parent_id = int(row[column])
+                if parent_id in self.id_map[parent_type]:
+                    row[column] = self.id_map[parent_type][parent_id]
+                elif self.attach_existing:
+                    existing.setdefault(parent_type, {})[parent_id] = old_id
+                    row[column] = parent_id
+                else:
+                    raise ValueError(f"{record_type} record {old_id} refers to {parent_type} {parent_id}, "
+                                     f"which was not imported before it")
+            if record_type == "user" and not row["role"]:
+                row["role"] = "user"
+            if "created_at" in row:
+                row["created_at"] = parse_timestamp(row["created_at"])
+            if old_id is not None:
+                self.id_map[record_type][int(old_id)] = new_id
+            rows.append(row)
+
+        for parent_type, references in existing.items():
+            self._check_existing(record_type, parent_type, references)
+
+        if self.use_copy:
+            self._copy_rows(table, spec["columns"], rows)
+        else:
+            self.db_session.execute(table.insert(), rows)
+
+    def _check_existing(self, record_type, parent_type, references):
+        """Make sure parents referenced by id (old id -> referring record) exist in the target database."""
+        parent = RECORD_TYPES[parent_type]["model"]
+        found = {row[0] for row in self.db_session.query(parent.id).filter(parent.id.in_(list(references)))}
+        for parent_id, old_id in references.items():
+            if parent_id not in found:
+                raise ValueError(f"{record_type} record {old_id} refers to {parent_type} {parent_id}, "
+                                 f"which does not exist")
+
+    def _allocate_ids(self, table, count):
+        """Reserve `count` new primary keys for a table."""
+        if self.use_copy:
+            result = self.db_session.execute(
+                text(f"SELECT nextval(pg_get_serial_sequence('{table.name}', 'id')) FROM generate_series(1, :count)"),
+                {"count": count}
+            )
+            return [row[0] for row in result]
+        start = self.db_session.query(func.coalesce(func.max(table.c.id), 0)).scalar() + 1
+        return list(range(start, start + count))
+
+    def _copy_rows(self, table, columns, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(["" if row[column] is None else row[column] for column in columns])
+        buffer.seek(0)
+
+        # COPY goes straight through the session's psycopg2 connection, inside the chunk transaction
+        cursor = self.db_session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        finally:
+            cursor.close()
+
+
+def parse_timestamp(value):
+    """Timestamps are exported as ISO 8601 strings; missing ones default to now."""
+    if value is None:
+        return datetime.datetime.utcnow()
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(value)
+
+
+def import_ndjson(db_session, lines, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, attach_existing=False):
+    """
+    Import NDJSON lines of the form {"type": "board", "id": 1, ...}.
+    Raises ImportFailed, with the report of the chunks already written.
+    """
+    importer = BulkImporter(db_session, chunk_size, progress, attach_existing)
+    try:
+        for line_number, line in enumerate(lines, 1):
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ValueError(f"Invalid JSON on line {line_number}")
+            if not isinstance(record, dict):
+                raise ValueError(f"Line {line_number} is not a JSON object")
+            importer.add(record.pop("type", None), record)
+        return importer.finish()
+    except Exception as e:
+        raise ImportFailed(e, importer.report()) from e
+
+
+def import_csv(db_session, record_type, lines, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, attach_existing=False):
+    """
+    Import CSV rows of one record type; the header row names the columns.
+    Raises ImportFailed, with the report of the chunks already written.
+    """
+    importer = BulkImporter(db_session, chunk_size, progress, attach_existing)
+    text_lines = (line.decode("utf-8") if isinstance(line, bytes) else line for line in lines)
+    try:
+        for record in csv.DictReader(text_lines):
+            importer.add(record_type, {key: (value if value != "" else None) for key, value in record.items()})
+        return importer.finish()
+    except Exception as e:
+        raise ImportFailed(e, importer.report()) from e
+
+
+def export_ndjson(db_session, omit=()):
+    """Yield every record of a tenant as NDJSON lines, in import order, without the `omit` columns."""
+    for record_type, spec in RECORD_TYPES.items():
+        model = spec["model"]
+        columns = [getattr(model, column) for column in spec["columns"] if column not in omit]
+        rows = (
+            db_session.query(*columns)
+            .order_by(model.id)
+            .execution_options(stream_results=True)  # Server-side cursor on Postgres
+            .yield_per(EXPORT_BATCH_SIZE)
+        )
+        for row in rows:
+            record = {"type": record_type}
+            record.update(row._mapping)
+            if record.get("created_at") is not None:
+                record["created_at"] = record["created_at"].isoformat()
+            yield record_type, json.dumps(record) + "\n"
+
+
+def export_gzip(db_session, progress=None, omit=()):
+    """
+    Yield a gzip-compressed NDJSON dump of a tenant with constant memory use.
+    `progress` is called with the per-type counts once the dump is complete.
+    """
+    compressor = zlib.compressobj(wbits=31)  # 31 selects the gzip container
+    counts = {record_type: 0 for record_type in RECORD_TYPES}
+    started_at = time.monotonic()
+    pending = []
+    pending_size = 0
+
+    for record_type, line in export_ndjson(db_session, omit):
+        counts[record_type] += 1
+        pending.append(line.encode("utf-8"))
+        pending_size += len(pending[-1])
+        if pending_size >= 64 * 1024:
+            chunk = compressor.compress(b"".join(pending))
+            pending, pending_size = [], 0
+            if chunk:
+                yield chunk
+
+    yield compressor.compress(b"".join(pending)) + compressor.flush()
+
+    if progress is not None:
+        elapsed = time.monotonic() - started_at
+        total = sum(counts.values())
+        progress({
+            "exported": counts,
+            "total": total,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(total / elapsed, 1) if elapsed > 0 else None,
+        })
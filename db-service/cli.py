@@ -0,0 +1,89 @@
+import gzip
+import sys
+
+import click
+from flask.cli import AppGroup
+
+from bulk import RECORD_TYPES, DEFAULT_CHUNK_SIZE, ImportFailed, import_ndjson, import_csv, export_gzip
+from counters import reconcile_counters
+from search import reset_memory_index
+from tenant_db import open_tenant_session
+
+bulk_cli = AppGroup('bulk', help='Bulk tenant import and export.')
+counters_cli = AppGroup('counters', help='Board and thread activity counters.')
+
+
+def open_input(path):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def print_progress(report):
+    click.echo(f"{report['total']} rows, {report['chunks']} chunks, {report['rows_per_second']} rows/s", err=True)
+
+
+@bulk_cli.command('import')
+@click.argument('tenant_id')
+@click.argument('path')
+@click.option('--format', 'data_format', type=click.Choice(['ndjson', 'csv']), default='ndjson')
+@click.option('--type', 'record_type', type=click.Choice(list(RECORD_TYPES)), help='Record type of a CSV file.')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True)
+@click.option('--attach-existing', is_flag=True, help='Let records refer to boards/threads already in the tenant.')
+def import_command(tenant_id, path, data_format, record_type, chunk_size, attach_existing):
+    """Import an NDJSON or CSV file (optionally .gz, or - for stdin) into a tenant."""
+    if data_format == 'csv' and record_type is None:
+        raise click.UsageError('--type is required for CSV imports')
+
+    db_session = open_tenant_session(tenant_id)
+    failure = None
+    try:
+        with open_input(path) as lines:
+            try:
+                if data_format == 'csv':
+                    report = import_csv(db_session, record_type, lines, chunk_size, print_progress, attach_existing)
+                else:
+                    report = import_ndjson(db_session, lines, chunk_size, print_progress, attach_existing)
+            except ImportFailed as e:
+                failure, report = e, e.report
+        # Also for the chunks committed before a failure
+        report["counters"] = reconcile_counters(db_session)
+        reset_memory_index(db_session)
+    finally:
+        db_session.close()
+    if failure is not None:
+        raise click.ClickException(f"Import stopped after {report['imported']}: {str(failure)}")
+    click.echo(f"Imported {report['imported']} in {report['seconds']}s ({report['rows_per_second']} rows/s)")
+
+
+@bulk_cli.command('export')
+@click.argument('tenant_id')
+@click.argument('path')
+def export_command(tenant_id, path):
+    """Write a gzip NDJSON dump of a tenant to PATH (- for stdout)."""
+    def done(report):
+        click.echo(f"Exported {report['exported']} in {report['seconds']}s ({report['rows_per_second']} rows/s)", err=True)
+
+    db_session = open_tenant_session(tenant_id)
+    try:
+        out = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        with out:
+            for chunk in export_gzip(db_session, done):
+                out.write(chunk)
+    finally:
+        db_session.close()
+
+
+@counters_cli.command('reconcile')
+@click.argument('tenant_ids', nargs=-1, required=True)
+def reconcile_command(tenant_ids):
+    """Recompute activity counters for one or more tenants and repair drift."""
+    for tenant_id in tenant_ids:
+        db_session = open_tenant_session(tenant_id)
+        try:
+            result = reconcile_counters(db_session)
+        finally:
+            db_session.close()
+        click.echo(f"{tenant_id}: {result['threads_fixed']} threads and {result['boards_fixed']} boards repaired")
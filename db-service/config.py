@@ -4,7 +4,41 @@ class Config:
     """Base config class for db-service."""
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_DATABASE_URI = os.getenv("MIGRATION_URI")
-    CACHE_TYPE = os.getenv("CACHE_TYPE")
-    CACHE_REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    # Shared by every worker and instance: the response cache is invalidated by
+    # bumping generation keys, which a per-process SimpleCache would only bump in
+    # the worker that handled the write. SimpleCache only suits a single worker.
+    CACHE_TYPE = os.getenv("CACHE_TYPE", "RedisCache")
+    CACHE_REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "default_secret_key")
+    # Verifies operator tokens (config-service's `flask admin-token`) for
+    # cross-tenant operations such as flushing the tenant URL cache
+    ADMIN_SECRET_KEY = os.getenv("CONFIG_ADMIN_SECRET_KEY")
 
+    # Read-through cache for tenant GET responses
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", 60))
+    # How long shared caches (the gateway) may serve a response before revalidating it
+    HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", 0))
+
+    # Per-tenant connection pool settings
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_TENANT_IDLE_TIMEOUT = int(os.getenv("DB_TENANT_IDLE_TIMEOUT", 900))
+
+    # Read replica routing
+    REPLICA_HEALTH_INTERVAL = int(os.getenv("REPLICA_HEALTH_INTERVAL", 5))
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 10))
+    REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 5))
+
+    # Password hashing: the KDF runs in a bounded process pool, and logins
+    # transparently rehash passwords stored with a different method/work factor
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000")
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))
+
+    # Token revocation filter published by auth-service
+    REVOCATION_SERVICE_URL = os.getenv("REVOCATION_SERVICE_URL", "http://auth-service:5001/auth/revocations")
+    REVOCATION_REFRESH_SECONDS = int(os.getenv("REVOCATION_REFRESH_SECONDS", 5))
@@ -0,0 +1,117 @@
+import datetime
+
+from sqlalchemy import case, func, or_, select, update
+
+from models import Board, Thread, Post
+
+# Write hooks. Each issues an atomic UPDATE (column = column + n) in the caller's
+# transaction, so counters commit or roll back together with the write itself.
+
+
+def thread_created(db_session, thread):
+    now = thread.created_at or datetime.datetime.utcnow()
+    db_session.execute(
+        update(Board)
+        .where(Board.id == thread.board_id)
+        .values(thread_count=Board.thread_count + 1, last_post_at=now)
+    )
+
+
+def thread_deleted(db_session, thread):
+    db_session.execute(
+        update(Board)
+        .where(Board.id == thread.board_id)
+        .values(thread_count=Board.thread_count - 1, post_count=Board.post_count - thread.post_count)
+    )
+
+
+def thread_moved(db_session, thread, old_board_id):
+    """Move a thread's counts from its old board to its new one."""
+    if thread.board_id == old_board_id:
+        return
+    db_session.execute(
+        update(Board)
+        .where(Board.id == old_board_id)
+        .values(thread_count=Board.thread_count - 1, post_count=Board.post_count - thread.post_count)
+    )
+    db_session.execute(
+        update(Board)
+        .where(Board.id == thread.board_id)
+        .values(
+            thread_count=Board.thread_count + 1,
+            post_count=Board.post_count + thread.post_count,
+            last_post_at=case(
+                (Board.last_post_at < thread.last_post_at, thread.last_post_at),
+                else_=Board.last_post_at
+            )
+        )
+    )
+
+
+def post_created(db_session, post, board_id):
+    now = post.created_at or datetime.datetime.utcnow()
+    db_session.execute(
+        update(Thread)
+        .where(Thread.id == post.thread_id)
+        .values(post_count=Thread.post_count + 1, last_post_at=now)
+    )
+    db_session.execute(
+        update(Board)
+        .where(Board.id == board_id)
+        .values(post_count=Board.post_count + 1, last_post_at=now)
+    )
+
+
+def post_deleted(db_session, post, board_id):
+    # last_post_at is left as is; the reconciliation job recomputes it
+    db_session.execute(
+        update(Thread)
+        .where(Thread.id == post.thread_id)
+        .values(post_count=Thread.post_count - 1)
+    )
+    db_session.execute(
+        update(Board)
+        .where(Board.id == board_id)
+        .values(post_count=Board.post_count - 1)
+    )
+
+
+def reconcile_counters(db_session):
+    """
+    Recompute every counter and last_post_at from the underlying rows and
+    repair the ones that drifted. Returns the number of threads and boards fixed.
+    """
+    thread_posts = select(func.count(Post.id)).where(Post.thread_id == Thread.id).scalar_subquery()
+    thread_last = func.coalesce(
+        select(func.max(Post.created_at)).where(Post.thread_id == Thread.id).scalar_subquery(),
+        Thread.created_at
+    )
+    threads_fixed = db_session.execute(
+        update(Thread)
+        .where(or_(Thread.post_count != thread_posts, Thread.last_post_at != thread_last))
+        .values(post_count=thread_posts, last_post_at=thread_last)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    # Boards are derived from the thread counters that were just repaired
+    board_threads = select(func.count(Thread.id)).where(Thread.board_id == Board.id).scalar_subquery()
+    board_posts = func.coalesce(
+        select(func.sum(Thread.post_count)).where(Thread.board_id == Board.id).scalar_subquery(), 0
+    )
+    board_last = func.coalesce(
+        select(func.max(Thread.last_post_at)).where(Thread.board_id == Board.id).scalar_subquery(),
+        Board.created_at
+    )
+    boards_fixed = db_session.execute(
+        update(Board)
+        .where(or_(
+            Board.thread_count != board_threads,
+            Board.post_count != board_posts,
+            Board.last_post_at != board_last
+        ))
+        .values(thread_count=board_threads, post_count=board_posts, last_post_at=board_last)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    db_session.commit()
+    return {"threads_fixed": threads_fixed, "boards_fixed": boards_fixed}
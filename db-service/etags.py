@@ -0,0 +1,73 @@
+import hashlib
+
+from flask import current_app, request
+from sqlalchemy import func
+
+# Validators for conditional GETs.
+#
+# Every board, thread and post carries a version that each UPDATE of the row
+# bumps (see models.version_column). A response's ETag hashes the versions of
+# the rows it is built from, so it can be computed with one small query and
+# compared with If-None-Match before the response itself is built.
+#
+# A validator returns (parts, last_modified), or None if the entity does not
+# exist (the view then answers 404 as usual). last_modified is only given
+# when it covers every row of the response; aggregates over a set of rows
+# cannot tell when a row was deleted, so they only contribute to the ETag.
+
+
+def row_version(db_session, model, entity_id):
+    """Validators of a single row: its version and update time."""
+    row = db_session.query(model.version, model.updated_at).filter(model.id == entity_id).first()
+    if row is None:
+        return None
+    return (model.__tablename__, entity_id, row.version), row.updated_at
+
+
+def table_version(db_session, model, *criteria):
+    """
+    Validators of a set of rows. An update raises the sum of versions, an
+    insert raises the highest id (ids are never reused) and a delete lowers
+    the count, so any change to the set changes the result.
+    """
+    count, version_sum, max_id = (
+        db_session.query(func.count(model.id), func.coalesce(func.sum(model.version), 0), func.max(model.id))
+        .filter(*criteria)
+        .one()
+    )
+    return (model.__tablename__, count, int(version_sum), max_id), None
+
+
+def combine(*validators):
+    """Validators of a response built from several rows or sets of rows."""
+    if any(validator is None for validator in validators):
+        return None
+    parts = tuple(validator[0] for validator in validators)
+    last_modified = [validator[1] for validator in validators]
+    return parts, max(last_modified) if all(last_modified) else None
+
+
+def make_etag(resource, parts):
+    """Strong ETag over the row versions and the normalised query args of a response."""
+    args = sorted(request.args.items(multi=True))
+    return hashlib.sha256(repr((resource, parts, args)).encode()).hexdigest()[:32]
+
+
+def set_validators(response, etag, last_modified=None):
+    """Attach the ETag, Last-Modified and caching policy to a response."""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Shared caches (the gateway) may keep the response but must revalidate
+    # it once it is older than max-age; the tenant is part of the variant
+    max_age = current_app.config.get("HTTP_CACHE_MAX_AGE", 0)
+    response.headers["Cache-Control"] = f"max-age={max_age}, must-revalidate"
+    response.vary.add("X-Tenant-ID")
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    """A 304 for a request whose If-None-Match/If-Modified-Since matches, or None."""
+    response = set_validators(current_app.response_class(status=200), etag, last_modified)
+    response.make_conditional(request)
+    return response if response.status_code == 304 else None
@@ -1,5 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_caching import Cache
+from tenant_db import TenantEngineRegistry
+from replicas import ReplicaMonitor
+from common.password_utils import PasswordHasher
+from common.revocation import RevocationChecker
 
 db = SQLAlchemy()
-cache = Cache()
\ No newline at end of file
+cache = Cache()
+engine_registry = TenantEngineRegistry()
+replica_monitor = ReplicaMonitor()
+password_hasher = PasswordHasher()
+revocation_checker = RevocationChecker()
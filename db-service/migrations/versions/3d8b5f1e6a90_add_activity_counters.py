@@ -0,0 +1,65 @@
+"""Add activity counters and timestamps to boards, threads and posts
+
+Revision ID: 3d8b5f1e6a90
+Revises: e5a2c7d91b03
+Create Date: 2026-10-18 15:21:48.270664
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d8b5f1e6a90'
+down_revision = 'e5a2c7d91b03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('boards', 'threads', 'posts'):
+        op.add_column(table, sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+
+    op.add_column('boards', sa.Column('thread_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('boards', sa.Column('post_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('boards', sa.Column('last_post_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+    op.add_column('threads', sa.Column('post_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('threads', sa.Column('last_post_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+
+    # Backfill the counters and last activity from the existing rows, the way
+    # reconcile_counters computes them: a thread's latest post (or its own
+    # creation), then a board's latest thread activity (or its own creation)
+    op.execute("""
+        UPDATE threads SET
+            post_count = (SELECT count(*) FROM posts WHERE posts.thread_id = threads.id),
+            last_post_at = coalesce(
+                (SELECT max(posts.created_at) FROM posts WHERE posts.thread_id = threads.id),
+                threads.created_at
+            )
+    """)
+    op.execute("""
+        UPDATE boards SET
+            thread_count = (SELECT count(*) FROM threads WHERE threads.board_id = boards.id),
+            post_count = (SELECT coalesce(sum(post_count), 0) FROM threads WHERE threads.board_id = boards.id),
+            last_post_at = coalesce(
+                (SELECT max(threads.last_post_at) FROM threads WHERE threads.board_id = boards.id),
+                boards.created_at
+            )
+    """)
+
+    op.create_index('ix_boards_last_post_at_id', 'boards', ['last_post_at', 'id'], unique=False)
+    op.create_index('ix_threads_last_post_at_id', 'threads', ['last_post_at', 'id'], unique=False)
+    op.create_index('ix_threads_board_id_last_post_at_id', 'threads', ['board_id', 'last_post_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_threads_board_id_last_post_at_id', table_name='threads')
+    op.drop_index('ix_threads_last_post_at_id', table_name='threads')
+    op.drop_index('ix_boards_last_post_at_id', table_name='boards')
+    op.drop_column('threads', 'last_post_at')
+    op.drop_column('threads', 'post_count')
+    op.drop_column('boards', 'last_post_at')
+    op.drop_column('boards', 'post_count')
+    op.drop_column('boards', 'thread_count')
+    for table in ('posts', 'threads', 'boards'):
+        op.drop_column(table, 'created_at')
@@ -0,0 +1,24 @@
+"""Add index on threads (board_id, id)
+
+Revision ID: 7c1f3b9a2d4e
+Revises: 536ea7f669c8
+Create Date: 2026-10-18 09:12:40.118302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1f3b9a2d4e'
+down_revision = '536ea7f669c8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_threads_board_id_id', 'threads', ['board_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_threads_board_id_id', table_name='threads')
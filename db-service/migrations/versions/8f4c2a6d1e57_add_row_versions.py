@@ -0,0 +1,28 @@
+"""Add row versions and update times to boards, threads and posts
+
+Revision ID: 8f4c2a6d1e57
+Revises: 3d8b5f1e6a90
+Create Date: 2026-10-18 16:02:11.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f4c2a6d1e57'
+down_revision = '3d8b5f1e6a90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('boards', 'threads', 'posts'):
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+
+
+def downgrade():
+    for table in ('posts', 'threads', 'boards'):
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
@@ -0,0 +1,51 @@
+"""Add full-text search columns and indexes
+
+Revision ID: b41e6d0c8f27
+Revises: 7c1f3b9a2d4e
+Create Date: 2026-10-18 11:40:03.552817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41e6d0c8f27'
+down_revision = '7c1f3b9a2d4e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # Generated columns keep the vectors in sync on every insert and update
+    op.execute("""
+        ALTER TABLE threads ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'B')
+        ) STORED
+    """)
+    op.execute("""
+        ALTER TABLE posts ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED
+    """)
+
+    op.create_index('ix_threads_search_vector', 'threads', ['search_vector'], postgresql_using='gin')
+    op.create_index('ix_posts_search_vector', 'posts', ['search_vector'], postgresql_using='gin')
+
+    # Trigram indexes make substring (ILIKE '%...%') matches on titles and names indexable
+    op.create_index('ix_threads_title_trgm', 'threads', ['title'], postgresql_using='gin',
+                    postgresql_ops={'title': 'gin_trgm_ops'})
+    op.create_index('ix_boards_name_trgm', 'boards', ['name'], postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_boards_name_trgm', table_name='boards')
+    op.drop_index('ix_threads_title_trgm', table_name='threads')
+    op.drop_index('ix_posts_search_vector', table_name='posts')
+    op.drop_index('ix_threads_search_vector', table_name='threads')
+    op.execute("ALTER TABLE posts DROP COLUMN search_vector")
+    op.execute("ALTER TABLE threads DROP COLUMN search_vector")
@@ -0,0 +1,29 @@
+"""Add trigram indexes for substring search on thread descriptions and post content
+
+Revision ID: c2e8f4a71d36
+Revises: 8f4c2a6d1e57
+Create Date: 2026-10-18 18:24:37.106492
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e8f4a71d36'
+down_revision = '8f4c2a6d1e57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # With ix_threads_title_trgm, these serve the ILIKE '%...%' half of searches
+    op.create_index('ix_threads_description_trgm', 'threads', ['description'], postgresql_using='gin',
+                    postgresql_ops={'description': 'gin_trgm_ops'})
+    op.create_index('ix_posts_content_trgm', 'posts', ['content'], postgresql_using='gin',
+                    postgresql_ops={'content': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_posts_content_trgm', table_name='posts')
+    op.drop_index('ix_threads_description_trgm', table_name='threads')
@@ -0,0 +1,24 @@
+"""Add index on posts (thread_id, id)
+
+Revision ID: e5a2c7d91b03
+Revises: b41e6d0c8f27
+Create Date: 2026-10-18 13:05:27.904511
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a2c7d91b03'
+down_revision = 'b41e6d0c8f27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_posts_thread_id_id', 'posts', ['thread_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_posts_thread_id_id', table_name='posts')
@@ -1,6 +1,25 @@
-from extensions import db
+import datetime
+
 from sqlalchemy import Enum
-from werkzeug.security import generate_password_hash, check_password_hash
+
+from extensions import db, password_hasher
+
+
+def last_post_at_default(context):
+    """New boards and threads start with their creation time as last activity."""
+    return context.get_current_parameters().get('created_at') or datetime.datetime.utcnow()
+
+
+def version_column():
+    """Row version, bumped by every UPDATE of the row (ORM or Core, e.g. counters.py); backs ETags."""
+    return db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                     onupdate=db.literal_column('version') + 1)
+
+
+def updated_at_column():
+    return db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow, server_default=db.func.now(),
+                     onupdate=datetime.datetime.utcnow)
+
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -15,22 +34,40 @@ class User(db.Model):
     def __init__(self, username, email, password, role):
         self.username = username
         self.email = email
-        self.password_hash = password
+        self.set_password(password)
         self.role = role
 
     def check_password(self, password):
-        """Check if the password matches the hash"""
-        return check_password_hash(self.password_hash, password)
+        """Check if the password matches the hash (runs in the hashing pool)"""
+        return password_hasher.verify(self.password_hash, password)
 
     def set_password(self, password):
-        """Set the password hash in the gateway to protect data while it transits"""
-        self.password_hash = password
+        """Hash the plain password with the configured work factor (runs in the hashing pool)"""
+        self.password_hash = password_hasher.hash(password)
+
+    def password_needs_rehash(self):
+        """True if the stored hash predates the current work factor setting"""
+        return password_hasher.needs_rehash(self.password_hash)
 
 class Board(db.Model):
     __tablename__ = 'boards'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
     description = db.Column(db.String(256))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow, server_default=db.func.now())
+
+    # Activity counters, maintained by counters.py in the same transaction as the writes
+    thread_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Time of the latest post or thread on the board (creation time until then)
+    last_post_at = db.Column(db.DateTime, nullable=False, default=last_post_at_default, server_default=db.func.now())
+
+    # Validators for conditional GETs (see etags.py)
+    version = version_column()
+    updated_at = updated_at_column()
+
+    # Backs sorting boards by recent activity
+    __table_args__ = (db.Index('ix_boards_last_post_at_id', 'last_post_at', 'id'),)
 
     # One-to-many relationship: A board has many threads
     threads = db.relationship('Thread', backref='board', lazy=True, cascade="all, delete-orphan")  # Cascade delete
@@ -41,6 +78,24 @@ class Thread(db.Model):
     board_id = db.Column(db.Integer, db.ForeignKey('boards.id'), nullable=False)
     title = db.Column(db.String(128), nullable=False)
     description = db.Column(db.Text, nullable=False)  # Description field
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow, server_default=db.func.now())
+
+    # Activity counters, maintained by counters.py in the same transaction as the writes
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Time of the latest post in the thread (creation time until then)
+    last_post_at = db.Column(db.DateTime, nullable=False, default=last_post_at_default, server_default=db.func.now())
+
+    # Validators for conditional GETs (see etags.py)
+    version = version_column()
+    updated_at = updated_at_column()
+
+    __table_args__ = (
+        # Serves per-board thread listings
+        db.Index('ix_threads_board_id_id', 'board_id', 'id'),
+        # Serve sorting threads by recent activity, overall and within a board
+        db.Index('ix_threads_last_post_at_id', 'last_post_at', 'id'),
+        db.Index('ix_threads_board_id_last_post_at_id', 'board_id', 'last_post_at', 'id'),
+    )
 
     # One-to-many relationship: A thread has many posts
     posts = db.relationship('Post', backref='thread', lazy=True, cascade="all, delete-orphan")  # Cascade delete
@@ -50,3 +105,11 @@ class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     thread_id = db.Column(db.Integer, db.ForeignKey('threads.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow, server_default=db.func.now())
+
+    # Validators for conditional GETs (see etags.py)
+    version = version_column()
+    updated_at = updated_at_column()
+
+    # Backs keyset pagination of a thread's posts on (thread_id, id)
+    __table_args__ = (db.Index('ix_posts_thread_id_id', 'thread_id', 'id'),)
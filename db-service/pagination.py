@@ -0,0 +1,113 @@
+import base64
+import datetime
+import hashlib
+import json
+
+from sqlalchemy import DateTime, tuple_
+
+from extensions import cache
+
+DEFAULT_PER_PAGE = 10
+MAX_PER_PAGE = 100
+COUNT_CACHE_TIMEOUT = 60
+
+
+def get_per_page(args, default=DEFAULT_PER_PAGE):
+    """Read per_page from the query args, capped server-side at MAX_PER_PAGE."""
+    per_page = int(args.get('per_page', default))
+    if per_page < 1:
+        raise ValueError("per_page must be a positive integer")
+    return min(per_page, MAX_PER_PAGE)
+
+
+def is_cursor_request(args):
+    """Cursor mode is used when a cursor is given or explicitly requested."""
+    return 'after' in args or 'before' in args or args.get('pagination') == 'cursor'
+
+
+def wants_total(args):
+    return args.get('include_total', '').lower() in ('1', 'true', 'yes')
+
+
+def encode_cursor(values):
+    """Encode the sort key of a row as an opaque URL-safe token."""
+    values = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in values]
+    raw = json.dumps(values, separators=(',', ':'), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor produced by encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid pagination cursor")
+    if not isinstance(values, list) or not values:
+        raise ValueError("Invalid pagination cursor")
+    return values
+
+
+def keyset_page(query, columns, per_page, after=None, before=None, descending=False):
+    """
+    Fetch one page of `query` ordered by `columns` using keyset pagination.
+
+    The sort key must be unique (end it with the primary key) and backed by
+    an index so every page is a range scan regardless of depth.
+    Returns (rows, next_cursor, prev_cursor).
+    """
+    key = tuple_(*columns) if len(columns) > 1 else columns[0]
+
+    def bound(token):
+        values = decode_cursor(token)
+        if len(values) != len(columns):
+            raise ValueError("Invalid pagination cursor")
+        # Timestamps travel as ISO strings; compare them as timestamps again
+        values = [
+            datetime.datetime.fromisoformat(value)
+            if isinstance(column.type, DateTime) and isinstance(value, str) else value
+            for column, value in zip(columns, values)
+        ]
+        return tuple_(*values) if len(columns) > 1 else values[0]
+
+    if after:
+        query = query.filter(key < bound(after) if descending else key > bound(after))
+    if before:
+        query = query.filter(key > bound(before) if descending else key < bound(before))
+
+    # Walking backwards means reading in the opposite order and flipping the page
+    backwards = bool(before) and not after
+    ascending = descending if backwards else not descending
+    query = query.order_by(*[column.asc() if ascending else column.desc() for column in columns])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def cursor_for(row):
+        return encode_cursor([getattr(row, column.key) for column in columns])
+
+    if backwards:
+        next_cursor = cursor_for(rows[-1]) if rows else None
+        prev_cursor = cursor_for(rows[0]) if rows and has_more else None
+    else:
+        next_cursor = cursor_for(rows[-1]) if rows and has_more else None
+        prev_cursor = cursor_for(rows[0]) if rows and after else None
+    return rows, next_cursor, prev_cursor
+
+
+def cached_count(query, tenant_id, scope, ttl=COUNT_CACHE_TIMEOUT):
+    """
+    Count the rows of a query, caching the result briefly per tenant so list
+    endpoints do not run a full COUNT on every page load.
+    """
+    compiled = query.statement.compile()
+    digest = hashlib.sha1(f"{compiled}|{sorted(compiled.params.items())}".encode()).hexdigest()
+    key = f"count:{tenant_id}:{scope}:{digest}"
+    total = cache.get(key)
+    if total is None:
+        total = query.order_by(None).count()
+        cache.set(key, total, timeout=ttl)
+    return total
@@ -0,0 +1,113 @@
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import text
+
+# Seconds of replay lag on a Postgres standby; 0 on a primary or when idle
+LAG_SQL = text(
+    "SELECT CASE WHEN pg_is_in_recovery() "
+    "THEN coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "ELSE 0 END"
+)
+STICKY_COOKIE = "db_primary_until"
+
+
+class ReplicaMonitor:
+    """
+    Tracks the health and replication lag of tenant read replicas.
+    Checks run in the background at most every `health_interval` seconds per
+    replica, so routing never waits on a health probe; a replica is only used
+    once a check has found it reachable and within `max_lag` seconds.
+    """
+
+    def __init__(self, app=None):
+        self._state = {}
+        self._checking = set()
+        self._lock = threading.Lock()
+        self.health_interval = 5
+        self.max_lag = 10
+        self.sticky_seconds = 5
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.health_interval = app.config.get("REPLICA_HEALTH_INTERVAL", self.health_interval)
+        self.max_lag = app.config.get("REPLICA_MAX_LAG_SECONDS", self.max_lag)
+        self.sticky_seconds = app.config.get("REPLICA_STICKY_SECONDS", self.sticky_seconds)
+        app.extensions["replica_monitor"] = self
+        app.after_request(self._mark_primary_sticky)
+
+    def healthy_replicas(self, tenant_id, replica_urls, registry):
+        """Return the replicas currently fit to serve reads, scheduling checks as needed."""
+        now = time.monotonic()
+        healthy = []
+        for index, url in enumerate(replica_urls):
+            key = f"{tenant_id}:replica:{index}"
+            with self._lock:
+                state = self._state.get(key)
+            if state is None or now - state["checked_at"] > self.health_interval:
+                self._schedule_check(key, url, registry)
+            if state is not None and state["url"] == url and state["healthy"] and state["lag"] <= self.max_lag:
+                healthy.append((key, url))
+        return healthy
+
+    def _schedule_check(self, key, url, registry):
+        with self._lock:
+            if key in self._checking:
+                return
+            self._checking.add(key)
+        threading.Thread(target=self._check, args=(key, url, registry), daemon=True).start()
+
+    def _check(self, key, url, registry):
+        state = {"url": url, "checked_at": time.monotonic(), "healthy": False, "lag": None, "error": None}
+        try:
+            engine = registry.get_engine(key, url)["engine"]
+            with engine.connect() as connection:
+                if engine.dialect.name == "postgresql":
+                    state["lag"] = float(connection.execute(LAG_SQL).scalar() or 0)
+                else:
+                    connection.execute(text("SELECT 1"))
+                    state["lag"] = 0.0
+            state["healthy"] = True
+        except Exception as e:
+            state["error"] = str(e)
+        finally:
+            with self._lock:
+                self._state[key] = state
+                self._checking.discard(key)
+
+    def prefers_primary(self):
+        """Reads go to the primary for a short window after the client wrote, or on request."""
+        if request.headers.get("X-Read-Consistency", "").lower() == "strong":
+            return True
+        try:
+            return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _mark_primary_sticky(self, response):
+        if (self.sticky_seconds and g.get("tenant_id")
+                and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400):
+            response.set_cookie(STICKY_COOKIE, str(time.time() + self.sticky_seconds),
+                                max_age=self.sticky_seconds, httponly=True)
+        return response
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            states = dict(self._state)
+        return {
+            "max_lag": self.max_lag,
+            "health_interval": self.health_interval,
+            "sticky_seconds": self.sticky_seconds,
+            "replicas": {
+                key: {
+                    "healthy": state["healthy"],
+                    "lag_seconds": state["lag"],
+                    "checked_seconds_ago": round(now - state["checked_at"], 1),
+                    "error": state["error"],
+                }
+                for key, state in states.items()
+            },
+        }
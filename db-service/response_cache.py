@@ -0,0 +1,233 @@
+import math
+import threading
+import time
+import uuid
+from functools import wraps
+
+from flask import current_app, request, make_response
+
+from extensions import cache
+from etags import make_etag, set_validators, not_modified
+from tenant_db import get_read_session, read_from_replica
+
+# Response cache for tenant reads.
+#
+# Keys embed generation tokens rather than being deleted on writes: every
+# tenant has a tenant-wide generation, every resource type a list generation
+# and every entity its own generation. A write bumps the generations it
+# affects, so all cached variants of a page (any query args) become
+# unreachable at once and simply expire.
+#
+# Cached entries keep their ETag, so a conditional GET that hits the cache is
+# answered with a 304 without touching the database.
+#
+# Reads that must see the client's own writes (see ReplicaMonitor.prefers_primary)
+# skip the cache. For as long as replicas may lag behind a write, responses
+# read from a replica are not cached, so a stale page never lands under the
+# generation the write has just bumped.
+
+_metrics = {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0, "not_modified": 0}
+_metrics_lock = threading.Lock()
+
+_fill_locks = {}
+_fill_locks_guard = threading.Lock()
+
+
+def _count(name, amount=1):
+    with _metrics_lock:
+        _metrics[name] += amount
+
+
+def response_cache_stats():
+    with _metrics_lock:
+        stats = dict(_metrics)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    return stats
+
+
+def _generation_key(tenant_id, resource=None, entity_id=None):
+    parts = ["gen", tenant_id]
+    if resource is not None:
+        parts.append(resource)
+    if entity_id is not None:
+        parts.append(str(entity_id))
+    return ":".join(parts)
+
+
+def _generations(keys):
+    """Read generation tokens, creating any that are missing (or were evicted)."""
+    values = cache.get_many(*keys)
+    result = []
+    for key, value in zip(keys, values):
+        if value is None:
+            # add() only wins if nobody created the token in the meantime
+            cache.add(key, uuid.uuid4().hex, timeout=0)
+            value = cache.get(key)
+        result.append(value)
+    return result
+
+
+def _bump(key):
+    cache.set(key, uuid.uuid4().hex, timeout=0)
+
+
+def _write_key(tenant_id):
+    return f"wrote:{tenant_id}"
+
+
+def _note_write(tenant_id):
+    """Remember a write to a tenant for as long as its replicas may not show it."""
+    monitor = current_app.extensions.get("replica_monitor")
+    if monitor is None:
+        return
+    window = max(monitor.max_lag, monitor.sticky_seconds)
+    if window > 0:
+        cache.set(_write_key(tenant_id), time.time(), timeout=math.ceil(window))
+
+
+def _cacheable_read(tenant_id):
+    """Whether a response just built can be stored: not from a replica that may predate a write."""
+    return not read_from_replica(tenant_id) or cache.get(_write_key(tenant_id)) is None
+
+
+def _prefers_primary():
+    monitor = current_app.extensions.get("replica_monitor")
+    return monitor is not None and monitor.prefers_primary()
+
+
+def _normalized_args():
+    """Query args sorted by name so equivalent URLs share a cache entry."""
+    return "&".join(f"{key}={value}" for key, value in sorted(request.args.items(multi=True)))
+
+
+def _fill_lock(key):
+    with _fill_locks_guard:
+        entry = _fill_locks.get(key)
+        if entry is None:
+            entry = _fill_locks[key] = [threading.Lock(), 0]
+        entry[1] += 1
+        return entry
+
+
+def _release_fill_lock(key, entry):
+    with _fill_locks_guard:
+        entry[1] -= 1
+        if entry[1] == 0:
+            _fill_locks.pop(key, None)
+
+
+def _conditional_view(view, resource, validator, tenant_id, args, kwargs):
+    """
+    Run a view behind its validators: answer 304 if the client already has the
+    current version, otherwise return the view's response with its ETag.
+    Returns (response, etag, last_modified).
+    """
+    validators = validator(get_read_session(tenant_id), **kwargs) if validator and tenant_id else None
+    if validators is None:
+        return make_response(view(*args, **kwargs)), None, None
+
+    etag = make_etag(resource, validators[0])
+    last_modified = validators[1]
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        _count("not_modified")
+        return response, etag, last_modified
+
+    response = make_response(view(*args, **kwargs))
+    if response.status_code == 200:
+        set_validators(response, etag, last_modified)
+    return response, etag, last_modified
+
+
+def cached_response(resource, id_arg=None, timeout=None, validator=None):
+    """
+    Cache successful GET responses per tenant and normalised query args.
+    With id_arg the response belongs to one entity (e.g. board_id); otherwise
+    it is a list page of the resource.
+    Concurrent misses for the same key are collapsed so only one request
+    queries the database (stampede protection within the process).
+    `validator(db_session, **view_kwargs)` returns the row versions the
+    response is built from (see etags.py) and enables ETags and 304s.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            tenant_id = request.headers.get('X-Tenant-ID')
+            if not tenant_id or not current_app.config.get("RESPONSE_CACHE_ENABLED", True):
+                return _conditional_view(view, resource, validator, tenant_id, args, kwargs)[0]
+            if _prefers_primary():
+                # The client must read its own writes: neither serve nor fill the cache
+                response = _conditional_view(view, resource, validator, tenant_id, args, kwargs)[0]
+                response.headers["X-Cache"] = "BYPASS"
+                return response
+
+            entity_id = kwargs.get(id_arg) if id_arg else None
+            generation_keys = [_generation_key(tenant_id)]
+            if id_arg:
+                generation_keys.append(_generation_key(tenant_id, resource, entity_id))
+            else:
+                generation_keys.append(_generation_key(tenant_id, resource))
+            generations = _generations(generation_keys)
+            key = f"resp:{tenant_id}:{resource}:{entity_id}:{':'.join(generations)}:{_normalized_args()}"
+
+            cached = cache.get(key)
+            if cached is not None:
+                _count("hits")
+                return _build_response(cached, "HIT")
+
+            lock_entry = _fill_lock(key)
+            try:
+                with lock_entry[0]:
+                    # Another request may have filled the entry while we waited
+                    cached = cache.get(key)
+                    if cached is not None:
+                        _count("coalesced")
+                        return _build_response(cached, "HIT")
+
+                    _count("misses")
+                    response, etag, last_modified = _conditional_view(view, resource, validator, tenant_id, args, kwargs)
+                    if response.status_code == 200 and not response.is_streamed and _cacheable_read(tenant_id):
+                        ttl = timeout or current_app.config.get("RESPONSE_CACHE_TIMEOUT", 60)
+                        cache.set(key, (response.get_data(), response.status_code, response.mimetype,
+                                        etag, last_modified), timeout=ttl)
+                    response.headers["X-Cache"] = "MISS"
+                    return response
+            finally:
+                _release_fill_lock(key, lock_entry)
+        return wrapper
+    return decorator
+
+
+def _build_response(cached, status):
+    # Entries cached before ETags were added have no validators
+    body, status_code, mimetype, etag, last_modified = (tuple(cached) + (None, None))[:5]
+    response = current_app.response_class(body, status=status_code, mimetype=mimetype)
+    if etag is not None:
+        set_validators(response, etag, last_modified)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            _count("not_modified")
+    response.headers["X-Cache"] = status
+    return response
+
+
+def invalidate(tenant_id, resource, *entity_ids):
+    """Invalidate the list pages of a resource and the given entities of it."""
+    if not tenant_id:
+        return
+    _bump(_generation_key(tenant_id, resource))
+    for entity_id in entity_ids:
+        if entity_id is not None:
+            _bump(_generation_key(tenant_id, resource, entity_id))
+    _note_write(tenant_id)
+    _count("invalidations")
+
+
+def invalidate_tenant(tenant_id):
+    """Invalidate every cached response of a tenant (bulk loads, counter repairs)."""
+    if not tenant_id:
+        return
+    _bump(_generation_key(tenant_id))
+    _note_write(tenant_id)
+    _count("invalidations")
@@ -1,7 +1,15 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, current_app, request, g
+from counters import reconcile_counters
+from response_cache import invalidate_tenant, response_cache_stats
+from tenant_db import get_db_session
+from common.db_utils import invalidate_tenant_db_url, tenant_db_url_cache_stats
+from common.auth_utils import token_cache_stats, require_auth, require_operator_token
 from .user_routes import user_bp
 from .board_routes import board_bp
 from .thread_routes import thread_bp
+from .post_routes import post_bp
+from .search_routes import search_bp
+from .bulk_routes import bulk_bp
 
 db_bp = Blueprint('db', __name__)
 
@@ -11,7 +19,80 @@ def health_check():
     """Health check for db-service."""
     return jsonify({"status": "ok"}), 200
 
+# Connection pool stats for monitoring
+@db_bp.route('/health/pools', methods=['GET'])
+def pool_stats():
+    """Report per-tenant connection pool usage."""
+    registry = current_app.extensions["tenant_engines"]
+    registry.evict_idle()
+    return jsonify(registry.stats()), 200
+
+# Verified-token cache hit rates
+@db_bp.route('/health/token-cache', methods=['GET'])
+def token_cache_health():
+    """Report hit rates of the verified-token cache (access tokens and signed config values)."""
+    return jsonify(token_cache_stats()), 200
+
+# Token revocation filter freshness and accuracy
+@db_bp.route('/health/revocation', methods=['GET'])
+def revocation_health():
+    """Report the age, size and hit counters of the token revocation filter."""
+    return jsonify(current_app.extensions["revocation_checker"].stats()), 200
+
+# Password hashing pool usage
+@db_bp.route('/health/password-hasher', methods=['GET'])
+def password_hasher_stats():
+    """Report the password hashing pool's capacity, in-flight work and rejections."""
+    return jsonify(current_app.extensions["password_hasher"].stats()), 200
+
+# Read replica health
+@db_bp.route('/health/replicas', methods=['GET'])
+def replica_health():
+    """Report health and replication lag of the tenant read replicas seen so far."""
+    return jsonify(current_app.extensions["replica_monitor"].stats()), 200
+
+# Response cache metrics
+@db_bp.route('/health/response-cache', methods=['GET'])
+def response_cache_metrics():
+    """Report hit/miss counters for the tenant response cache."""
+    return jsonify(response_cache_stats()), 200
+
+# Resolved tenant URL cache
+@db_bp.route('/tenant-cache', methods=['GET'])
+def tenant_cache_stats():
+    """Report hit/miss counters for the tenant URL cache."""
+    return jsonify(tenant_db_url_cache_stats()), 200
+
+@db_bp.route('/tenant-cache', methods=['DELETE'])
+@require_operator_token
+def invalidate_all_tenant_caches():
+    """Drop every cached tenant URL, e.g. after the tenant configs were migrated."""
+    invalidate_tenant_db_url(None)
+    return jsonify({"message": "Tenant URL cache cleared for all tenants"}), 200
+
+@db_bp.route('/tenant-cache/<tenant_id>', methods=['DELETE'])
+@require_auth('admin')
+def invalidate_tenant_cache(tenant_id):
+    """Drop the requesting tenant's cached URLs, e.g. after its config was changed."""
+    if tenant_id != g.claims.get("tenant"):
+        return jsonify({"error": "Tenant admins may only clear their own tenant's entry"}), 403
+    invalidate_tenant_db_url(tenant_id)
+    return jsonify({"message": f"Tenant URL cache cleared for {tenant_id}"}), 200
+
+# Repair drifted board/thread activity counters for the requesting tenant
+@db_bp.route('/maintenance/reconcile-counters', methods=['POST'])
+@require_auth('admin')
+def reconcile_tenant_counters():
+    """Recompute thread/post counts and last activity from the underlying rows."""
+    tenant_id = request.headers.get('X-Tenant-ID')
+    result = reconcile_counters(get_db_session(tenant_id))
+    invalidate_tenant(tenant_id)
+    return jsonify({"message": f"Counters reconciled for {tenant_id}", **result}), 200
+
 # Register all blueprints
 db_bp.register_blueprint(user_bp, url_prefix='/user')
 db_bp.register_blueprint(board_bp, url_prefix='/board')
 db_bp.register_blueprint(thread_bp, url_prefix='/thread')
+db_bp.register_blueprint(post_bp, url_prefix='/post')
+db_bp.register_blueprint(search_bp, url_prefix='/search')
+db_bp.register_blueprint(bulk_bp, url_prefix='/bulk')
@@ -1,27 +1,82 @@
 from flask import Blueprint, request, jsonify
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from marshmallow import ValidationError
 
-from config import Config
+from sqlalchemy import func
+
 from models import Board, Thread
 from schemas import BoardSchema
-from common.db_utils import get_tenant_db_url
+from tenant_db import get_db_session, get_read_session
+from response_cache import cached_response, invalidate, invalidate_tenant
+from etags import row_version, table_version, combine
+from pagination import get_per_page, is_cursor_request, wants_total, keyset_page, cached_count
+from common.auth_utils import require_auth
 from common.error_handlers import get_dynamic_logger
 
 board_bp = Blueprint('board', __name__)
 board_schema = BoardSchema()
 
-def get_db_session(tenant_id):
-    """Get a session for the tenant's specific database."""
-    db_url = get_tenant_db_url(tenant_id, Config.JWT_SECRET_KEY)
-    engine = create_engine(db_url)
-    Session = sessionmaker(bind=engine)
-    return Session()
+THREAD_PREVIEW_LIMIT = 5
+MAX_THREAD_PREVIEW_LIMIT = 20
+MAX_THREADS_PER_PAGE = 100
+
+def get_thread_previews(db_session, board_ids, limit):
+    """
+    Fetch the `limit` most recent threads of every board in one query,
+    using a window function to rank threads within each board.
+    """
+    if not board_ids or limit <= 0:
+        return {}
+
+    rank = func.row_number().over(
+        partition_by=Thread.board_id,
+        order_by=(Thread.last_post_at.desc(), Thread.id.desc())
+    ).label('rank')
+    ranked = (
+        db_session.query(Thread.id, Thread.board_id, Thread.title, Thread.post_count, Thread.last_post_at, rank)
+        .filter(Thread.board_id.in_(board_ids))
+        .subquery()
+    )
+    rows = (
+        db_session.query(ranked.c.id, ranked.c.board_id, ranked.c.title, ranked.c.post_count, ranked.c.last_post_at)
+        .filter(ranked.c.rank <= limit)
+        .order_by(ranked.c.board_id, ranked.c.rank)
+        .all()
+    )
+
+    previews = {}
+    for row in rows:
+        previews.setdefault(row.board_id, []).append(serialize_thread_summary(row))
+    return previews
+
+def serialize_thread_summary(thread):
+    return {
+        "id": thread.id,
+        "title": thread.title,
+        "post_count": thread.post_count,
+        "last_post_at": thread.last_post_at.isoformat()
+    }
+
+def serialize_board(board):
+    return {
+        "id": board.id,
+        "name": board.name,
+        "description": board.description,
+        "thread_count": board.thread_count,
+        "post_count": board.post_count,
+        "last_post_at": board.last_post_at.isoformat()
+    }
+
+def board_list_versions(db_session):
+    # Listings embed previews of each board's threads
+    return combine(table_version(db_session, Board), table_version(db_session, Thread))
+
+def board_versions(db_session, board_id):
+    return combine(row_version(db_session, Board, board_id), table_version(db_session, Thread, Thread.board_id == board_id))
 
 # ------------------------ CRUD Operations ------------------------
 
 @board_bp.route('/', methods=['POST'])
+@require_auth('admin', 'mod')
 def create_board():
     logger = get_dynamic_logger()
     tenant_id = request.headers.get('X-Tenant-ID')
@@ -35,68 +90,111 @@ def create_board():
     board = Board(name=data['name'], description=data.get('description'))
     db_session.add(board)
     db_session.commit()
+    invalidate(tenant_id, 'board')
     logger.info(f"Board created: {board.name}, ID: {board.id}")  # Log creation
     return jsonify({"message": "Board created successfully", "board_id": board.id}), 201
 
 @board_bp.route('/', methods=['GET'])
+@cached_response('board', validator=board_list_versions)
 def get_all_boards():
-    """Retrieve all boards for a tenant with optional pagination and search."""
+    """
+    Retrieve all boards for a tenant with optional pagination and search.
+    Pass `after`/`before` cursors (or pagination=cursor) for keyset pagination;
+    otherwise `page` selects an offset page. sort=activity orders boards by
+    their latest post instead of by id.
+    """
     logger = get_dynamic_logger()
     tenant_id = request.headers.get('X-Tenant-ID')
-    db_session = get_db_session(tenant_id)
+    db_session = get_read_session(tenant_id)
 
     search = request.args.get('search', '')
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 10))
+    per_page = get_per_page(request.args)
+    threads_limit = min(int(request.args.get('threads_limit', THREAD_PREVIEW_LIMIT)), MAX_THREAD_PREVIEW_LIMIT)
+    sort = request.args.get('sort', 'id')
+    if sort not in ('id', 'activity'):
+        return jsonify({"error": "sort must be id or activity"}), 400
+    # Both orderings are backed by an index
+    sort_columns = [Board.last_post_at, Board.id] if sort == 'activity' else [Board.id]
+    descending = sort == 'activity'
 
     query = db_session.query(Board)
     if search:
+        # Served by the pg_trgm GIN index on boards.name
         query = query.filter(Board.name.ilike(f"%{search}%"))
 
-    total = query.count()
-    boards = query.offset((page - 1) * per_page).limit(per_page).all()
-
-    response = {
-        "total": total,
-        "page": page,
-        "per_page": per_page,
-        "boards": []
-    }
+    if is_cursor_request(request.args):
+        boards, next_cursor, prev_cursor = keyset_page(
+            query, sort_columns, per_page,
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            descending=descending
+        )
+        response = {
+            "per_page": per_page,
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
+            "boards": []
+        }
+        if wants_total(request.args):
+            response["total"] = cached_count(query, tenant_id, "boards")
+    else:
+        page = int(request.args.get('page', 1))
+        order = [column.desc() if descending else column for column in sort_columns]
+        boards = query.order_by(*order).offset((page - 1) * per_page).limit(per_page).all()
+        response = {
+            "total": cached_count(query, tenant_id, "boards"),
+            "page": page,
+            "per_page": per_page,
+            "boards": []
+        }
+
+    # Previews for the whole page are fetched in one query; counts are stored on the boards
+    previews = get_thread_previews(db_session, [board.id for board in boards], threads_limit)
 
     for board in boards:
-        threads = db_session.query(Thread).filter_by(board_id=board.id).all()
-        response["boards"].append({
-            "id": board.id,
-            "name": board.name,
-            "description": board.description,
-            "threads": [{"id": thread.id, "title": thread.title} for thread in threads]
-        })
+        board_data = serialize_board(board)
+        board_data["threads"] = previews.get(board.id, [])
+        response["boards"].append(board_data)
 
     logger.info(f"Retrieved {len(boards)} boards for tenant {tenant_id}")  # Log the number of boards fetched
     return jsonify(response), 200
 
 @board_bp.route('/<int:board_id>', methods=['GET'])
+@cached_response('board', id_arg='board_id', validator=board_versions)
 def get_board(board_id):
-    """Retrieve a single board by its ID, including its threads."""
+    """Retrieve a single board by its ID, including a page of its threads."""
     logger = get_dynamic_logger()
     tenant_id = request.headers.get('X-Tenant-ID')
-    db_session = get_db_session(tenant_id)
+    db_session = get_read_session(tenant_id)
+
+    threads_page = int(request.args.get('threads_page', 1))
+    threads_per_page = min(int(request.args.get('threads_per_page', 20)), MAX_THREADS_PER_PAGE)
 
     board = db_session.query(Board).get(board_id)
     if board is None:
         logger.warning(f"Board not found: ID {board_id}, Tenant: {tenant_id}")  # Log if board not found
         return jsonify({"error": "Board not found"}), 404
 
-    threads = db_session.query(Thread).filter_by(board_id=board.id).all()
+    threads = (
+        db_session.query(Thread.id, Thread.title, Thread.post_count, Thread.last_post_at)
+        .filter(Thread.board_id == board.id)
+        .order_by(Thread.last_post_at.desc(), Thread.id.desc())
+        .offset((threads_page - 1) * threads_per_page)
+        .limit(threads_per_page)
+        .all()
+    )
+
     logger.info(f"Retrieved board: {board.name}, ID: {board.id}")  # Log board retrieval
-    return jsonify({
-        "id": board.id,
-        "name": board.name,
-        "description": board.description,
-        "threads": [{"id": thread.id, "title": thread.title} for thread in threads]
-    }), 200
+    response = serialize_board(board)
+    response.update({
+        "threads_page": threads_page,
+        "threads_per_page": threads_per_page,
+        "threads": [serialize_thread_summary(thread) for thread in threads]
+    })
+    return jsonify(response), 200
 
 @board_bp.route('/<int:board_id>', methods=['PUT'])
+@require_auth('admin', 'mod')
 def update_board(board_id):
     """Update an existing board by its ID with Marshmallow validation."""
     logger = get_dynamic_logger()
@@ -116,10 +214,12 @@ def update_board(board_id):
     board.name = data.get('name', board.name)
     board.description = data.get('description', board.description)
     db_session.commit()
+    invalidate(tenant_id, 'board', board_id)
     logger.info(f"Board updated: {board.name}, ID: {board.id}")  # Log board update
     return jsonify({"message": "Board updated successfully"}), 200
 
 @board_bp.route('/<int:board_id>', methods=['DELETE'])
+@require_auth('admin')
 def delete_board(board_id):
     """Delete a board by its ID."""
     logger = get_dynamic_logger()
@@ -133,5 +233,7 @@ def delete_board(board_id):
 
     db_session.delete(board)
     db_session.commit()
+    # The delete cascades to the board's threads and posts
+    invalidate_tenant(tenant_id)
     logger.info(f"Board deleted: ID {board_id}, Tenant: {tenant_id}")  # Log board deletion
     return jsonify({"message": "Board deleted successfully"}), 200
\ No newline at end of file
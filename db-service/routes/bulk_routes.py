@@ -0,0 +1,104 @@
+import gzip
+import io
+
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+
+from bulk import RECORD_TYPES, SECRET_COLUMNS, DEFAULT_CHUNK_SIZE, ImportFailed, import_ndjson, import_csv, export_gzip
+from counters import reconcile_counters
+from response_cache import invalidate_tenant
+from search import reset_memory_index
+from tenant_db import get_db_session
+from common.auth_utils import require_auth
+from common.error_handlers import get_dynamic_logger, bad_request_body, internal_error_body
+
+bulk_bp = Blueprint('bulk', __name__)
+
+MAX_CHUNK_SIZE = 10000
+
+@bulk_bp.route('/import', methods=['POST'])
+@require_auth('admin')
+def bulk_import():
+    """
+    Bulk-load records into the tenant database (tenant admins only, as
+    records carry password hashes and roles as given).
+    The body is NDJSON (one {"type": ..., ...} record per line) or, with
+    format=csv&type=<record type>, CSV with a header row. A gzip
+    Content-Encoding is accepted. Records are written in chunked transactions;
+    if one fails, the chunks before it stay and the error comes with their
+    report. References to parents not in the import are rejected unless
+    attach_existing=true, which attaches rows to existing boards/threads.
+    """
+    logger = get_dynamic_logger()
+    tenant_id = request.headers.get('X-Tenant-ID')
+
+    data_format = request.args.get('format', 'ndjson')
+    record_type = request.args.get('type')
+    chunk_size = min(int(request.args.get('chunk_size', DEFAULT_CHUNK_SIZE)), MAX_CHUNK_SIZE)
+    attach_existing = request.args.get('attach_existing') == 'true'
+    if data_format not in ('ndjson', 'csv'):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+    if data_format == 'csv' and record_type not in RECORD_TYPES:
+        return jsonify({"error": f"CSV imports need type set to one of {', '.join(RECORD_TYPES)}"}), 400
+
+    # Read the body as a stream so large imports are never held in memory
+    stream = request.stream
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        stream = gzip.GzipFile(fileobj=stream)
+    lines = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+    def log_progress(report):
+        logger.info(f"Bulk import for tenant {tenant_id}: {report['total']} rows in {report['chunks']} chunks "
+                    f"({report['rows_per_second']} rows/s)")
+
+    db_session = get_db_session(tenant_id)
+    failure = None
+    try:
+        if data_format == 'csv':
+            report = import_csv(db_session, record_type, lines, chunk_size, log_progress, attach_existing)
+        else:
+            report = import_ndjson(db_session, lines, chunk_size, log_progress, attach_existing)
+    except ImportFailed as e:
+        failure, report = e, e.report
+
+    # Bulk rows bypass the write hooks: recompute the activity counters and
+    # let the non-Postgres search fallback rebuild on next use, also for the
+    # chunks committed before a failure
+    report["counters"] = reconcile_counters(db_session)
+    reset_memory_index(db_session)
+    invalidate_tenant(tenant_id)
+
+    if failure is not None:
+        if isinstance(failure.error, ValueError):
+            logger.warning(f"Bulk import for tenant {tenant_id} stopped: {str(failure)}")
+            return jsonify({**bad_request_body(failure), "report": report}), 400
+        logger.error(f"Bulk import for tenant {tenant_id} failed: {str(failure)}")
+        return jsonify({**internal_error_body(), "report": report}), 500
+
+    return jsonify({"message": "Import completed", "report": report}), 200
+
+@bulk_bp.route('/export', methods=['GET'])
+@require_auth('admin')
+def bulk_export():
+    """
+    Stream a gzip-compressed NDJSON dump of the tenant's users, boards,
+    threads and posts (tenant admins only). Password hashes are left out
+    unless include_password_hashes=true; the `flask bulk export` CLI always
+    includes them.
+    """
+    logger = get_dynamic_logger()
+    tenant_id = request.headers.get('X-Tenant-ID')
+    db_session = get_db_session(tenant_id)
+    omit = () if request.args.get('include_password_hashes') == 'true' else SECRET_COLUMNS
+
+    def log_progress(report):
+        logger.info(f"Bulk export for tenant {tenant_id}: {report['total']} rows in {report['seconds']}s "
+                    f"({report['rows_per_second']} rows/s)")
+
+    return Response(
+        stream_with_context(export_gzip(db_session, log_progress, omit)),
+        mimetype='application/x-ndjson',
+        headers={
+            "Content-Encoding": "gzip",
+            "Content-Disposition": f"attachment; filename={tenant_id}-export.ndjson.gz"
+        }
+    )
@@ -0,0 +1,196 @@
+import json
+
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from marshmallow import ValidationError
+
+from models import Post, Thread
+from schemas import PostSchema
+from tenant_db import get_db_session, get_read_session
+import counters
+from response_cache import cached_response, invalidate
+from etags import row_version, table_version, combine
+from pagination import get_per_page, keyset_page, decode_cursor
+from common.auth_utils import require_auth
+from common.error_handlers import get_dynamic_logger
+
+post_bp = Blueprint('post', __name__)
+post_schema = PostSchema()
+
+STREAM_BATCH_SIZE = 500
+
+def serialize_post(post):
+    return {
+        "id": post.id,
+        "thread_id": post.thread_id,
+        "content": post.content,
+        "created_at": post.created_at.isoformat()
+    }
+
+def invalidate_post_reads(tenant_id, thread_id, board_id):
+    """A new or removed post changes the thread's posts and the thread/board counters."""
+    invalidate(tenant_id, 'thread_posts', thread_id)
+    invalidate(tenant_id, 'thread', thread_id)
+    invalidate(tenant_id, 'board', board_id)
+
+def post_versions(db_session, post_id):
+    return row_version(db_session, Post, post_id)
+
+def thread_posts_versions(db_session, thread_id):
+    return combine(row_version(db_session, Thread, thread_id), table_version(db_session, Post, Post.thread_id == thread_id))
+
+# ------------------------ CRUD Operations ------------------------
+
+@post_bp.route('/', methods=['POST'])
+@require_auth()
+def create_post():
+    """Create a new post in a thread with Marshmallow validation."""
+    logger = get_dynamic_logger()
+    tenant_id = request.headers.get('X-Tenant-ID')
+    try:
+        data = post_schema.load(request.get_json())
+    except ValidationError as err:
+        logger.warning(f"Validation Error: {err.messages}")  # Log validation error
+        return jsonify({"error": err.messages}), 400
+
+    db_session = get_db_session(tenant_id)
+    thread = db_session.query(Thread).get(data['thread_id'])  # Ensure the thread exists
+    if thread is None:
+        logger.warning(f"Thread with ID {data['thread_id']} not found for tenant {tenant_id}.")
+        return jsonify({"error": "Thread not found"}), 404
+
+    post = Post(thread_id=data['thread_id'], content=data['content'])
+    db_session.add(post)
+    db_session.flush()
+    counters.post_created(db_session, post, thread.board_id)
+    db_session.commit()
+    invalidate_post_reads(tenant_id, post.thread_id, thread.board_id)
+    logger.info(f"Post created: ID {post.id} in thread {post.thread_id} for tenant {tenant_id}.")  # Log creation
+    return jsonify({"message": "Post created successfully", "post_id": post.id}), 201
+
+@post_bp.route('/<int:post_id>', methods=['GET'])
+@cached_response('post', id_arg='post_id', validator=post_versions)
+def get_post(post_id):
+    """Retrieve a single post by its ID."""
+    logger = get_dynamic_logger()
+    tenant_id = request.headers.get('X-Tenant-ID')
+    db_session = get_read_session(tenant_id)
+
+    post = db_session.query(Post).get(post_id)
+    if post is None:
+        logger.warning(f"Post with ID {post_id} not found for tenant {tenant_id}.")  # Log post not found
+        return jsonify({"error": "Post not found"}), 404
+
+    return jsonify(serialize_post(post)), 200
+
+@post_bp.route('/<int:post_id>', methods=['PUT'])
+@require_auth('admin', 'mod')
+def update_post(post_id):
+    """Update the content of a post. Posts cannot be moved between threads."""
+    logger = get_dynamic_logger()
+    tenant_id = request.headers.get('X-Tenant-ID')
+    try:
+        data = post_schema.load(request.get_json(), partial=True)
+    except ValidationError as err:
+        logger.warning(f"Validation Error: {err.messages}")  # Log validation error
+        return jsonify({"error": err.messages}), 400
+
+    db_session = get_db_session(tenant_id)
+    post = db_session.query(Post).get(post_id)
+    if post is None:
+        logger.warning(f"Post with ID {post_id} not found for tenant {tenant_id}.")  # Log post not found
+        return jsonify({"error": "Post not found"}), 404
+
+    post.content = data.get('content', post.content)
+    db_session.commit()
+    invalidate(tenant_id, 'post', post_id)
+    invalidate(tenant_id, 'thread_posts', post.thread_id)
+    logger.info(f"Post with ID {post.id} updated for tenant {tenant_id}.")  # Log successful update
+    return jsonify({"message": "Post updated successfully"}), 200
+
+@post_bp.route('/<int:post_id>', methods=['DELETE'])
+@require_auth('admin', 'mod')
+def delete_post(post_id):
+    """Delete a post by its ID."""
+    logger = get_dynamic_logger()
+    tenant_id = request.headers.get('X-Tenant-ID')
+    db_session = get_db_session(tenant_id)
+
+    post = db_session.query(Post).get(post_id)
+    if post is None:
+        logger.warning(f"Post with ID {post_id} not found for tenant {tenant_id}.")  # Log post not found
+        return jsonify({"error": "Post not found"}), 404
+
+    thread_id, board_id = post.thread_id, post.thread.board_id
+    counters.post_deleted(db_session, post, board_id)
+    db_session.delete(post)
+    db_session.commit()
+    invalidate(tenant_id, 'post', post_id)
+    invalidate_post_reads(tenant_id, thread_id, board_id)
+    logger.info(f"Post with ID {post_id} deleted for tenant {tenant_id}.")  # Log successful deletion
+    return jsonify({"message": "Post deleted successfully"}), 200
+
+# ------------------------ Thread reads ------------------------
+
+@post_bp.route('/thread/<int:thread_id>', methods=['GET'])
+@cached_response('thread_posts', id_arg='thread_id', validator=thread_posts_versions)
+def get_thread_posts(thread_id):
+    """
+    Read the posts of a thread in id order.
+    By default returns one keyset page (after/before cursors over (thread_id, id)).
+    With stream=true the whole thread is streamed as NDJSON from a server-side
+    cursor, starting after the optional `after` cursor.
+    """
+    logger = get_dynamic_logger()
+    tenant_id = request.headers.get('X-Tenant-ID')
+    db_session = get_read_session(tenant_id)
+
+    if not db_session.query(Thread.id).filter_by(id=thread_id).first():
+        logger.warning(f"Thread with ID {thread_id} not found for tenant {tenant_id}.")  # Log thread not found
+        return jsonify({"error": "Thread not found"}), 404
+
+    query = db_session.query(Post).filter(Post.thread_id == thread_id)
+
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return stream_thread_posts(db_session, tenant_id, thread_id)
+
+    posts, next_cursor, prev_cursor = keyset_page(
+        query, [Post.thread_id, Post.id], get_per_page(request.args, default=50),
+        after=request.args.get('after'),
+        before=request.args.get('before')
+    )
+    logger.info(f"Retrieved {len(posts)} posts of thread {thread_id} for tenant {tenant_id}.")
+    return jsonify({
+        "thread_id": thread_id,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+        "posts": [serialize_post(post) for post in posts]
+    }), 200
+
+def stream_thread_posts(db_session, tenant_id, thread_id):
+    """Stream a thread's posts as NDJSON without loading the thread into memory."""
+    logger = get_dynamic_logger()
+    # Plain column rows are not kept in the session's identity map
+    query = db_session.query(Post.id, Post.thread_id, Post.content, Post.created_at).filter(Post.thread_id == thread_id)
+
+    # Reuse the keyset filter so clients can resume an interrupted stream
+    after = request.args.get('after')
+    if after:
+        values = decode_cursor(after)
+        if len(values) != 2:
+            raise ValueError("Invalid pagination cursor")
+        query = query.filter(Post.id > values[1])
+
+    rows = (
+        query.order_by(Post.id)
+        .execution_options(stream_results=True)  # Server-side cursor on Postgres
+        .yield_per(STREAM_BATCH_SIZE)
+    )
+
+    def generate():
+        count = 0
+        for post in rows:
+            count += 1
+            yield json.dumps(serialize_post(post)) + "\n"
+        logger.info(f"Streamed {count} posts of thread {thread_id} for tenant {tenant_id}.")
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
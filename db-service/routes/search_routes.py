@@ -0,0 +1,36 @@
+from flask import Blueprint, request, jsonify
+
+from tenant_db import get_read_session
+from pagination import get_per_page
+from search import search
+from common.error_handlers import get_dynamic_logger
+
+search_bp = Blueprint('search', __name__)
+
+@search_bp.route('/', methods=['GET'])
+def search_content():
+    """
+    Ranked full-text search over a tenant's threads, posts or boards.
+    Query args: q (required), type (thread, post or board), per_page, after.
+    """
+    logger = get_dynamic_logger()
+    tenant_id = request.headers.get('X-Tenant-ID')
+
+    query_text = request.args.get('q', '').strip()
+    if not query_text:
+        return jsonify({"error": "Search query 'q' is required"}), 400
+
+    search_type = request.args.get('type', 'thread')
+    per_page = get_per_page(request.args)
+
+    db_session = get_read_session(tenant_id)
+    results, next_cursor = search(db_session, query_text, search_type, per_page, request.args.get('after'))
+
+    logger.info(f"Search for '{query_text}' ({search_type}) returned {len(results)} results for tenant {tenant_id}")
+    return jsonify({
+        "q": query_text,
+        "type": search_type,
+        "per_page": per_page,
+        "next_cursor": next_cursor,
+        "results": results
+    }), 200
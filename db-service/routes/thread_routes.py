@@ -1,28 +1,41 @@
 from flask import Blueprint, request, jsonify
 
-from config import Config
 from models import Thread, Board
 from schemas import ThreadSchema
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from common.db_utils import get_tenant_db_url
+from tenant_db import get_db_session, get_read_session
+from search import thread_search_filter
+import counters
+from response_cache import cached_response, invalidate
+from etags import row_version, table_version
+from pagination import get_per_page, is_cursor_request, wants_total, keyset_page, cached_count
 from marshmallow import ValidationError
 from sqlalchemy.exc import SQLAlchemyError
 import logging
+from common.auth_utils import require_auth
 from common.error_handlers import get_dynamic_logger
 thread_bp = Blueprint('thread', __name__)
 thread_schema = ThreadSchema()
 
-def get_db_session(tenant_id):
-    """Get a session for the tenant's specific database."""
-    db_url = get_tenant_db_url(tenant_id, Config.JWT_SECRET_KEY)
-    engine = create_engine(db_url)
-    Session = sessionmaker(bind=engine)
-    return Session()
+def serialize_thread(thread):
+    return {
+        "id": thread.id,
+        "title": thread.title,
+        "board_id": thread.board_id,
+        "description": thread.description,
+        "post_count": thread.post_count,
+        "last_post_at": thread.last_post_at.isoformat()
+    }
+
+def thread_list_versions(db_session):
+    return table_version(db_session, Thread)
+
+def thread_versions(db_session, thread_id):
+    return row_version(db_session, Thread, thread_id)
 
 # ------------------------ CRUD Operations ------------------------
 
 @thread_bp.route('/', methods=['POST'])
+@require_auth()
 def create_thread():
     """Create a new thread for a tenant's board with Marshmallow validation."""
     logger = get_dynamic_logger()  # Initialize the logger here
@@ -43,7 +56,11 @@ def create_thread():
     # Create the thread with title and description
     thread = Thread(title=data['title'], board_id=data['board_id'], description=data['description'])
     db_session.add(thread)
+    db_session.flush()
+    counters.thread_created(db_session, thread)
     db_session.commit()
+    invalidate(tenant_id, 'thread')
+    invalidate(tenant_id, 'board', thread.board_id)
 
     logger.info(f"Thread created: ID {thread.id}, Title: {thread.title} for tenant {tenant_id}.")  # Log thread creation success
     return jsonify({
@@ -55,8 +72,13 @@ def create_thread():
 
 
 @thread_bp.route('/', methods=['GET'])
+@cached_response('thread', validator=thread_list_versions)
 def get_all_threads():
-    """Retrieve all threads for a tenant with optional pagination and search."""
+    """
+    Retrieve all threads for a tenant with optional pagination and search.
+    board_id limits the listing to one board and sort=activity orders threads
+    by their latest post.
+    """
     logger = get_dynamic_logger()  # Initialize the logger here
 
     tenant_id = request.headers.get('X-Tenant-ID')
@@ -66,38 +88,62 @@ def get_all_threads():
         return jsonify({"error": "Tenant ID is missing"}), 400
 
     try:
-        db_session = get_db_session(tenant_id)
+        db_session = get_read_session(tenant_id)
 
         search = request.args.get('search', '')
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 10))
+        per_page = get_per_page(request.args)
+        sort = request.args.get('sort', 'id')
+        if sort not in ('id', 'activity'):
+            raise ValueError("sort must be id or activity")
+        # Both orderings are backed by an index, with or without a board filter
+        sort_columns = [Thread.last_post_at, Thread.id] if sort == 'activity' else [Thread.id]
+        descending = sort == 'activity'
 
         query = db_session.query(Thread)
+        if request.args.get('board_id'):
+            query = query.filter(Thread.board_id == int(request.args['board_id']))
 
         if search:
-            query = query.filter(Thread.title.ilike(f"%{search}%"))
-
-        total = query.count()
-        threads = query.offset((page - 1) * per_page).limit(per_page).all()
-
-        response = {
-            "total": total,
-            "page": page,
-            "per_page": per_page,
-            "threads": []
-        }
+            # Full-text match on title and description (GIN index on Postgres)
+            query = query.filter(thread_search_filter(db_session, search))
+
+        if is_cursor_request(request.args):
+            threads, next_cursor, prev_cursor = keyset_page(
+                query, sort_columns, per_page,
+                after=request.args.get('after'),
+                before=request.args.get('before'),
+                descending=descending
+            )
+            response = {
+                "per_page": per_page,
+                "next_cursor": next_cursor,
+                "prev_cursor": prev_cursor,
+                "threads": []
+            }
+            if wants_total(request.args):
+                response["total"] = cached_count(query, tenant_id, "threads")
+        else:
+            page = int(request.args.get('page', 1))
+            order = [column.desc() if descending else column for column in sort_columns]
+            threads = query.order_by(*order).offset((page - 1) * per_page).limit(per_page).all()
+            response = {
+                "total": cached_count(query, tenant_id, "threads"),
+                "page": page,
+                "per_page": per_page,
+                "threads": []
+            }
 
         for thread in threads:
-            response["threads"].append({
-                "id": thread.id,
-                "title": thread.title,
-                "board_id": thread.board_id,
-                "description": thread.description
-            })
+            response["threads"].append(serialize_thread(thread))
 
         logger.info(f"Retrieved {len(threads)} threads for tenant {tenant_id}.")  # Log successful retrieval
         return jsonify(response), 200
 
+    except ValueError as e:
+        # Bad pagination arguments or cursor
+        logger.warning(f"Invalid listing arguments: {str(e)}")
+        return jsonify({"error": "Bad Request", "message": str(e)}), 400
+
     except SQLAlchemyError as e:
         # Log the database error
         logger.error(f"Database error occurred: {str(e)}")
@@ -110,27 +156,24 @@ def get_all_threads():
 
 
 @thread_bp.route('/<int:thread_id>', methods=['GET'])
+@cached_response('thread', id_arg='thread_id', validator=thread_versions)
 def get_thread(thread_id):
     """Retrieve a single thread by its ID."""
     logger = get_dynamic_logger()  # Initialize the logger here
 
     tenant_id = request.headers.get('X-Tenant-ID')
-    db_session = get_db_session(tenant_id)
+    db_session = get_read_session(tenant_id)
 
     thread = db_session.query(Thread).get(thread_id)
     if thread is None:
         logger.warning(f"Thread with ID {thread_id} not found for tenant {tenant_id}.")  # Log thread not found
         return jsonify({"error": "Thread not found"}), 404
 
-    return jsonify({
-        "id": thread.id,
-        "title": thread.title,
-        "board_id": thread.board_id,
-        "description": thread.description
-    }), 200
+    return jsonify(serialize_thread(thread)), 200
 
 
 @thread_bp.route('/<int:thread_id>', methods=['PUT'])
+@require_auth('admin', 'mod')
 def update_thread(thread_id):
     """Update an existing thread by its ID with Marshmallow validation."""
     logger = get_dynamic_logger()  # Initialize the logger here
@@ -148,16 +191,22 @@ def update_thread(thread_id):
         logger.warning(f"Thread with ID {thread_id} not found for tenant {tenant_id}.")  # Log thread not found
         return jsonify({"error": "Thread not found"}), 404
 
+    old_board_id = thread.board_id
     thread.title = data.get('title', thread.title)
     thread.board_id = data.get('board_id', thread.board_id)
     thread.description = data.get('description', thread.description)
+    db_session.flush()
+    counters.thread_moved(db_session, thread, old_board_id)
     db_session.commit()
+    invalidate(tenant_id, 'thread', thread_id)
+    invalidate(tenant_id, 'board', old_board_id, thread.board_id)
 
     logger.info(f"Thread with ID {thread.id} updated for tenant {tenant_id}.")  # Log successful update
     return jsonify({"message": "Thread updated successfully"}), 200
 
 
 @thread_bp.route('/<int:thread_id>', methods=['DELETE'])
+@require_auth('admin', 'mod')
 def delete_thread(thread_id):
     """Delete a thread by its ID."""
     logger = get_dynamic_logger()  # Initialize the logger here
@@ -170,8 +219,13 @@ def delete_thread(thread_id):
         logger.warning(f"Thread with ID {thread_id} not found for tenant {tenant_id}.")  # Log thread not found
         return jsonify({"error": "Thread not found"}), 404
 
+    counters.thread_deleted(db_session, thread)
+    board_id = thread.board_id
     db_session.delete(thread)
     db_session.commit()
+    invalidate(tenant_id, 'thread', thread_id)
+    invalidate(tenant_id, 'thread_posts', thread_id)
+    invalidate(tenant_id, 'board', board_id)
 
     logger.info(f"Thread with ID {thread.id} deleted for tenant {tenant_id}.")  # Log successful deletion
     return jsonify({"message": "Thread deleted successfully"}), 200
@@ -1,26 +1,17 @@
 from flask import Blueprint, request, jsonify
 
-from config import Config
 from models import User
 from schemas import UserSchema
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from common.db_utils import get_tenant_db_url
+from tenant_db import get_db_session
 from marshmallow import ValidationError
 from sqlalchemy.exc import SQLAlchemyError
 import logging
 from common.error_handlers import get_dynamic_logger
+from common.password_utils import PasswordHasherBusy
 
 user_bp = Blueprint('user', __name__)
 user_schema = UserSchema()
 
-def get_db_session(tenant_id):
-    """Get a session for the tenant's specific database."""
-    db_url = get_tenant_db_url(tenant_id, Config.JWT_SECRET_KEY)
-    engine = create_engine(db_url)
-    Session = sessionmaker(bind=engine)
-    return Session()
-
 @user_bp.route('/register', methods=['POST'])
 def register_user():
     """Register a new user with Marshmallow validation."""
@@ -53,7 +44,7 @@ def register_user():
             logger.warning(f"Username {username} already exists for tenant {tenant_id}.")  # Log duplicate username
             return jsonify({"error": "Username already exists"}), 409
 
-        # Create the user and the password
+        # Create the user; the password is hashed exactly once, here
         user = User(username=username, email=email, password=password, role='user')
 
         # Add the user to the tenant-specific database
@@ -68,6 +59,10 @@ def register_user():
         logger.error(f"Database error occurred: {str(e)}")
         return jsonify({"error": "Database error", "message": str(e)}), 500
 
+    except PasswordHasherBusy:
+        # Let the app-level handler answer with a fast 503
+        raise
+
     except Exception as e:
         # Log any unexpected errors
         logger.error(f"Unexpected error occurred: {str(e)}")
@@ -89,14 +84,24 @@ def login_user():
             logger.warning(f"Login failed for user {data['email']} in tenant {tenant_id}.")  # Log failed login
             return jsonify({"error": "Invalid email or password"}), 401
 
+        if user.password_needs_rehash():
+            # The work factor changed since this password was stored
+            user.set_password(data['password'])
+            db_session.commit()
+            logger.info(f"Rehashed password for user {user.username} in tenant {tenant_id}.")
+
         logger.info(f"User {user.username} logged in successfully for tenant {tenant_id}.")  # Log successful login
-        return jsonify({"id": user.id, "username": user.username}), 200
+        return jsonify({"id": user.id, "username": user.username, "role": user.role}), 200
 
     except SQLAlchemyError as e:
         # Log database error
         logger.error(f"Database error occurred during login: {str(e)}")
         return jsonify({"error": "Database error", "message": str(e)}), 500
 
+    except PasswordHasherBusy:
+        # Let the app-level handler answer with a fast 503
+        raise
+
     except Exception as e:
         # Log unexpected error
         logger.error(f"Unexpected error occurred during login: {str(e)}")
@@ -13,3 +13,7 @@ class ThreadSchema(Schema):
     title = fields.Str(required=True, validate=validate.Length(max=128))
     board_id = fields.Int(required=True)
     description = fields.Str(required=True, validate=[validate.Length(min=1), validate.Length(max=500)])  # Adding max length for description
+
+class PostSchema(Schema):
+    thread_id = fields.Int(required=True)
+    content = fields.Str(required=True, validate=validate.Length(min=1))
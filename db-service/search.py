@@ -0,0 +1,317 @@
+import html
+import math
+import re
+import threading
+from collections import Counter
+
+from sqlalchemy import Numeric, cast, event, func, literal_column, or_
+from sqlalchemy.orm import Session
+
+from models import Board, Thread, Post
+from pagination import decode_cursor, encode_cursor
+
+SEARCH_CONFIG = 'english'
+SEARCH_TYPES = ('thread', 'post', 'board')
+# ts_headline marks matches with private-use characters rather than tags, so
+# the text can be HTML-escaped afterwards and the marks turned into <mark>
+START_SEL = '\ue000'
+STOP_SEL = '\ue001'
+HEADLINE_OPTIONS = f'StartSel={START_SEL}, StopSel={STOP_SEL}, MaxWords=35, MinWords=15, MaxFragments=2'
+
+# Generated tsvector columns created by the full-text search migration
+THREAD_VECTOR = literal_column('threads.search_vector')
+POST_VECTOR = literal_column('posts.search_vector')
+
+
+def uses_postgres(db_session):
+    return db_session.get_bind().dialect.name == 'postgresql'
+
+
+def search(db_session, query_text, search_type='thread', per_page=10, after=None):
+    """
+    Run a ranked search over threads, posts or boards.
+    Returns (results, next_cursor); results are ordered by rank, then id.
+    """
+    if search_type not in SEARCH_TYPES:
+        raise ValueError(f"type must be one of {', '.join(SEARCH_TYPES)}")
+    if uses_postgres(db_session):
+        return _postgres_search(db_session, query_text, search_type, per_page, after)
+    return get_memory_index(db_session).search(query_text, search_type, per_page, after)
+
+
+def substring_pattern(query_text):
+    """ILIKE pattern matching the query as a literal substring."""
+    escaped = query_text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def _substring_filter(columns, query_text):
+    # Served by the pg_trgm GIN indexes on Postgres
+    pattern = substring_pattern(query_text)
+    return or_(*(column.ilike(pattern, escape='\\') for column in columns))
+
+
+def thread_search_filter(db_session, query_text):
+    """
+    Filter clause matching threads for the `search` argument of thread
+    listings: a substring of the title or description on every backend,
+    and on Postgres also a full-text match.
+    """
+    substring = _substring_filter([Thread.title, Thread.description], query_text)
+    if uses_postgres(db_session):
+        return or_(substring, THREAD_VECTOR.op('@@')(func.websearch_to_tsquery(SEARCH_CONFIG, query_text)))
+    return substring
+
+
+# ------------------------ Postgres backend ------------------------
+
+def _postgres_search(db_session, query_text, search_type, per_page, after):
+    if search_type == 'board':
+        # Board names are short, so rank by trigram similarity (GIN pg_trgm index)
+        rank = cast(func.similarity(Board.name, query_text), Numeric(12, 6))
+        query = db_session.query(
+            Board.id.label('id'),
+            Board.id.label('board_id'),
+            Board.name.label('title'),
+            rank.label('rank'),
+            Board.description.label('highlight'),
+        ).filter(_substring_filter([Board.name], query_text))
+        id_column = Board.id
+    else:
+        ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, query_text)
+        if search_type == 'thread':
+            vector, id_column, text = THREAD_VECTOR, Thread.id, Thread.description
+            columns = [Thread.id.label('id'), Thread.board_id.label('board_id'), Thread.title.label('title')]
+            substring = _substring_filter([Thread.title, Thread.description], query_text)
+        else:
+            vector, id_column, text = POST_VECTOR, Post.id, Post.content
+            columns = [Post.id.label('id'), Post.thread_id.label('thread_id')]
+            substring = _substring_filter([Post.content], query_text)
+        # Rounded to numeric so the rank survives a round trip through the cursor;
+        # substring-only matches (e.g. part of a word) rank 0, after word matches
+        rank = cast(func.ts_rank_cd(vector, ts_query), Numeric(12, 6))
+        query = db_session.query(
+            *columns,
+            rank.label('rank'),
+            # Markers already in the text are dropped so only real matches become <mark>
+            func.ts_headline(SEARCH_CONFIG, func.replace(func.replace(text, START_SEL, ''), STOP_SEL, ''),
+                             ts_query, HEADLINE_OPTIONS).label('highlight'),
+        ).filter(or_(vector.op('@@')(ts_query), substring))
+
+    if after:
+        last_rank, last_id = _decode_search_cursor(after)
+        query = query.filter(or_(rank < last_rank, (rank == last_rank) & (id_column < last_id)))
+
+    rows = query.order_by(rank.desc(), id_column.desc()).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    results = []
+    for row in rows:
+        result = dict(row._mapping)
+        result['type'] = search_type
+        result['rank'] = float(result['rank'])
+        result['highlight'] = render_headline(result['highlight'])
+        results.append(result)
+
+    next_cursor = encode_cursor([rows[-1].rank, rows[-1].id]) if rows and has_more else None
+    return results, next_cursor
+
+
+def _decode_search_cursor(token):
+    values = decode_cursor(token)
+    if len(values) != 2:
+        raise ValueError("Invalid pagination cursor")
+    try:
+        return float(values[0]), int(values[1])
+    except (TypeError, ValueError):
+        raise ValueError("Invalid pagination cursor")
+
+
+# ------------------------ Pure-Python fallback ------------------------
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+TITLE_WEIGHT = 2.0
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+class MemorySearchIndex:
+    """
+    An in-process inverted index with tf-idf ranking, used when the tenant
+    database is not Postgres (e.g. SQLite in local runs and tests).
+    It is built from the database on first use and then kept up to date
+    by the session hooks below as writes are committed.
+    """
+
+    def __init__(self):
+        self._docs = {}
+        self._postings = {}
+        self._lock = threading.Lock()
+
+    def load(self, db_session):
+        for board in db_session.query(Board.id, Board.name, Board.description):
+            self.add('board', board.id, {'board_id': board.id, 'title': board.name},
+                     board.name, board.description)
+        for thread in db_session.query(Thread.id, Thread.board_id, Thread.title, Thread.description):
+            self.add('thread', thread.id, {'board_id': thread.board_id, 'title': thread.title},
+                     thread.title, thread.description)
+        for post in db_session.query(Post.id, Post.thread_id, Post.content):
+            self.add('post', post.id, {'thread_id': post.thread_id}, None, post.content)
+
+    def add(self, doc_type, doc_id, fields, title, body):
+        terms = Counter()
+        for token in tokenize(title):
+            terms[token] += TITLE_WEIGHT
+        for token in tokenize(body):
+            terms[token] += 1
+        with self._lock:
+            self._remove_locked(doc_type, doc_id)
+            self._docs[(doc_type, doc_id)] = {'fields': fields, 'text': body or title or '', 'terms': terms}
+            for term in terms:
+                self._postings.setdefault((doc_type, term), set()).add(doc_id)
+
+    def remove(self, doc_type, doc_id):
+        with self._lock:
+            self._remove_locked(doc_type, doc_id)
+
+    def _remove_locked(self, doc_type, doc_id):
+        doc = self._docs.pop((doc_type, doc_id), None)
+        if doc is None:
+            return
+        for term in doc['terms']:
+            postings = self._postings.get((doc_type, term))
+            if postings is not None:
+                postings.discard(doc_id)
+                if not postings:
+                    del self._postings[(doc_type, term)]
+
+    def search(self, query_text, search_type, per_page, after=None):
+        query_terms = set(tokenize(query_text))
+        if not query_terms:
+            return [], None
+
+        with self._lock:
+            total_docs = sum(1 for doc_type, _ in self._docs if doc_type == search_type) or 1
+            # Every query term must match, like the implicit AND of websearch_to_tsquery
+            matching = None
+            for term in query_terms:
+                postings = self._postings.get((search_type, term), set())
+                matching = set(postings) if matching is None else matching & postings
+            scored = []
+            for doc_id in matching or ():
+                doc = self._docs[(search_type, doc_id)]
+                score = 0.0
+                for term in query_terms:
+                    idf = math.log(1 + total_docs / len(self._postings[(search_type, term)]))
+                    score += (1 + math.log(doc['terms'][term])) * idf
+                scored.append((round(score, 6), doc_id, doc))
+
+        scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        if after:
+            last_rank, last_id = _decode_search_cursor(after)
+            scored = [item for item in scored if (item[0], item[1]) < (last_rank, last_id)]
+
+        page = scored[:per_page]
+        results = []
+        for rank, doc_id, doc in page:
+            result = {'type': search_type, 'id': doc_id, 'rank': rank,
+                      'highlight': highlight(doc['text'], query_terms)}
+            result.update(doc['fields'])
+            results.append(result)
+
+        next_cursor = encode_cursor([page[-1][0], page[-1][1]]) if len(scored) > per_page else None
+        return results, next_cursor
+
+
+def render_headline(headline):
+    """HTML-escape a ts_headline result and turn its match markers into <mark>."""
+    if headline is None:
+        return None
+    return html.escape(headline).replace(START_SEL, '<mark>').replace(STOP_SEL, '</mark>')
+
+
+def highlight(text, terms, max_words=35):
+    """HTML-escape the text, wrap matched words in <mark> and trim it around the first match."""
+    words = (text or '').split()
+    matched = [i for i, word in enumerate(words) if set(tokenize(word)) & terms]
+    start = max(matched[0] - 5, 0) if matched else 0
+    matched = set(matched)
+    snippet = []
+    for i, word in enumerate(words[start:start + max_words], start):
+        word = html.escape(word)
+        snippet.append(f"<mark>{word}</mark>" if i in matched else word)
+    return ' '.join(snippet)
+
+
+_memory_indexes = {}
+_memory_indexes_lock = threading.Lock()
+
+
+def get_memory_index(db_session):
+    """Return the fallback index for the session's database, building it on first use."""
+    key = str(db_session.get_bind().url)
+    with _memory_indexes_lock:
+        index = _memory_indexes.get(key)
+        if index is None:
+            index = MemorySearchIndex()
+            index.load(db_session)
+            _memory_indexes[key] = index
+    return index
+
+
+def reset_memory_index(db_session):
+    """Drop the fallback index so it is rebuilt, e.g. after rows were written with Core inserts."""
+    with _memory_indexes_lock:
+        _memory_indexes.pop(str(db_session.get_bind().url), None)
+
+
+def _index_entry(obj):
+    if isinstance(obj, Thread):
+        return 'thread', {'board_id': obj.board_id, 'title': obj.title}, obj.title, obj.description
+    if isinstance(obj, Post):
+        return 'post', {'thread_id': obj.thread_id}, None, obj.content
+    if isinstance(obj, Board):
+        return 'board', {'board_id': obj.id, 'title': obj.name}, obj.name, obj.description
+    return None
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_index_changes(session, flush_context):
+    """Remember flushed writes so the fallback index can apply them on commit."""
+    if session.bind is None or str(session.bind.url) not in _memory_indexes:
+        return
+    pending = session.info.setdefault('search_index_changes', [])
+    for obj in list(session.new) + list(session.dirty):
+        entry = _index_entry(obj)
+        if entry is not None:
+            pending.append(('add', obj.id) + entry)
+    for obj in session.deleted:
+        entry = _index_entry(obj)
+        if entry is not None:
+            # Children removed by the ORM delete cascade show up here too
+            pending.append(('remove', obj.id, entry[0]))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_index_changes(session):
+    changes = session.info.pop('search_index_changes', None)
+    if not changes:
+        return
+    index = _memory_indexes.get(str(session.bind.url)) if session.bind is not None else None
+    if index is None:
+        return
+    for change in changes:
+        if change[0] == 'add':
+            _, doc_id, doc_type, fields, title, body = change
+            index.add(doc_type, doc_id, fields, title, body)
+        else:
+            _, doc_id, doc_type = change
+            index.remove(doc_type, doc_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_index_changes(session):
+    session.info.pop('search_index_changes', None)
@@ -0,0 +1,220 @@
+import random
+import threading
+import time
+
+from flask import current_app, g
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from common.db_utils import get_tenant_db_url, get_tenant_db_urls
+
+
+class TenantEngineRegistry:
+    """
+    Keeps one SQLAlchemy engine (and therefore one bounded connection pool)
+    per tenant database so requests reuse connections instead of opening a
+    new one every time.
+    """
+
+    def __init__(self, app=None):
+        self._engines = {}
+        self._lock = threading.Lock()
+        self.pool_size = 5
+        self.max_overflow = 10
+        self.pool_recycle = 1800
+        self.pool_timeout = 30
+        self.idle_timeout = 900
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read pool settings from the app config and register session teardown."""
+        self.pool_size = app.config.get("DB_POOL_SIZE", self.pool_size)
+        self.max_overflow = app.config.get("DB_MAX_OVERFLOW", self.max_overflow)
+        self.pool_recycle = app.config.get("DB_POOL_RECYCLE", self.pool_recycle)
+        self.pool_timeout = app.config.get("DB_POOL_TIMEOUT", self.pool_timeout)
+        self.idle_timeout = app.config.get("DB_TENANT_IDLE_TIMEOUT", self.idle_timeout)
+        app.extensions["tenant_engines"] = self
+        app.teardown_appcontext(close_db_sessions)
+
+    def _engine_options(self, db_url):
+        options = {"pool_pre_ping": True}
+        # SQLite (used for local runs) does not take QueuePool sizing arguments
+        if not db_url.startswith("sqlite"):
+            options.update(
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                pool_recycle=self.pool_recycle,
+                pool_timeout=self.pool_timeout,
+            )
+        return options
+
+    def get_engine(self, tenant_id, db_url):
+        """Return the pooled engine for a tenant, creating it on first use."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._engines.get(tenant_id)
+            if entry is not None and entry["url"] != db_url:
+                # The tenant was moved to another database; drop the old pool
+                entry["engine"].dispose()
+                entry = None
+            if entry is None:
+                engine = create_engine(db_url, **self._engine_options(db_url))
+                entry = {
+                    "url": db_url,
+                    "engine": engine,
+                    "session_factory": sessionmaker(bind=engine),
+                    "created_at": now,
+                    "last_used": now,
+                }
+                self._engines[tenant_id] = entry
+            entry["last_used"] = now
+            stale = self._pop_idle(now, keep=tenant_id)
+
+        for idle_entry in stale:
+            idle_entry["engine"].dispose()
+        return entry
+
+    def session(self, tenant_id, db_url):
+        """Open a new session bound to the tenant's pooled engine."""
+        return self.get_engine(tenant_id, db_url)["session_factory"]()
+
+    def _pop_idle(self, now, keep=None):
+        """Remove tenants whose engines have not been used for idle_timeout seconds."""
+        stale = []
+        for tenant_id, entry in list(self._engines.items()):
+            if tenant_id != keep and now - entry["last_used"] > self.idle_timeout:
+                stale.append(self._engines.pop(tenant_id))
+        return stale
+
+    def evict_idle(self):
+        """Dispose of the pools of idle tenants. Returns the number evicted."""
+        with self._lock:
+            stale = self._pop_idle(time.monotonic())
+        for entry in stale:
+            entry["engine"].dispose()
+        return len(stale)
+
+    def dispose(self, tenant_id=None):
+        """Dispose of one tenant's pool, or all pools when no tenant is given."""
+        with self._lock:
+            if tenant_id is None:
+                entries = list(self._engines.values())
+                self._engines.clear()
+            else:
+                entry = self._engines.pop(tenant_id, None)
+                entries = [entry] if entry else []
+        for entry in entries:
+            entry["engine"].dispose()
+
+    def stats(self):
+        """Return pool usage per tenant for monitoring."""
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._engines.items())
+
+        tenants = {}
+        for tenant_id, entry in entries:
+            pool = entry["engine"].pool
+            tenant_stats = {
+                "pool_class": type(pool).__name__,
+                "idle_seconds": round(now - entry["last_used"], 1),
+                "age_seconds": round(now - entry["created_at"], 1),
+            }
+            # Only QueuePool exposes sizing counters
+            if hasattr(pool, "checkedout"):
+                tenant_stats.update(
+                    size=pool.size(),
+                    checked_in=pool.checkedin(),
+                    checked_out=pool.checkedout(),
+                    overflow=pool.overflow(),
+                )
+            tenants[tenant_id] = tenant_stats
+
+        return {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_recycle": self.pool_recycle,
+            "idle_timeout": self.idle_timeout,
+            "tenants": tenants,
+        }
+
+
+def open_tenant_session(tenant_id):
+    """Open a session for a tenant outside of a request (CLI commands, jobs). The caller closes it."""
+    db_url = get_tenant_db_url(tenant_id, current_app.config["JWT_SECRET_KEY"])
+    return current_app.extensions["tenant_engines"].session(tenant_id, db_url)
+
+
+def bind_tenant(tenant_id):
+    """Resolve the tenant's database URLs and bind them to the current request."""
+    g.tenant_id = tenant_id
+    g.tenant_db_urls = get_tenant_db_urls(tenant_id, current_app.config["JWT_SECRET_KEY"])
+
+
+def _tenant_db_urls(tenant_id):
+    if tenant_id == g.get("tenant_id") and "tenant_db_urls" in g:
+        return g.tenant_db_urls
+    return get_tenant_db_urls(tenant_id, current_app.config["JWT_SECRET_KEY"])
+
+
+def get_db_session(tenant_id=None):
+    """
+    Get a session for the tenant's specific database, defaulting to the tenant
+    bound to the current request.
+    The session is shared for the rest of the request and closed at teardown.
+    """
+    tenant_id = tenant_id or g.get("tenant_id")
+    if not tenant_id:
+        raise ValueError("Tenant ID is required")
+
+    sessions = g.setdefault("db_sessions", {})
+    if tenant_id not in sessions:
+        db_url = _tenant_db_urls(tenant_id)["primary"]
+        registry = current_app.extensions["tenant_engines"]
+        sessions[tenant_id] = registry.session(tenant_id, db_url)
+    return sessions[tenant_id]
+
+
+def get_read_session(tenant_id=None):
+    """
+    Get a session for read-only work, routed to a healthy read replica when the
+    tenant has one. Falls back to the primary when no replica is fit (down or
+    lagging) and right after the client wrote, so it reads its own writes.
+    """
+    tenant_id = tenant_id or g.get("tenant_id")
+    if not tenant_id:
+        raise ValueError("Tenant ID is required")
+
+    sessions = g.setdefault("db_sessions", {})
+    session_key = f"{tenant_id}:replica"
+    if session_key in sessions:
+        return sessions[session_key]
+
+    replica_urls = _tenant_db_urls(tenant_id)["replicas"]
+    monitor = current_app.extensions["replica_monitor"]
+    if not replica_urls or monitor.prefers_primary():
+        return get_db_session(tenant_id)
+
+    registry = current_app.extensions["tenant_engines"]
+    replicas = monitor.healthy_replicas(tenant_id, replica_urls, registry)
+    if not replicas:
+        return get_db_session(tenant_id)
+
+    engine_key, db_url = random.choice(replicas)
+    sessions[session_key] = registry.session(engine_key, db_url)
+    return sessions[session_key]
+
+
+def read_from_replica(tenant_id):
+    """Whether this request's reads for a tenant went to a replica rather than the primary."""
+    return f"{tenant_id}:replica" in g.get("db_sessions", {})
+
+
+def close_db_sessions(exception=None):
+    """Return every session opened during the request to its pool."""
+    sessions = g.pop("db_sessions", {})
+    for session in sessions.values():
+        if exception is not None:
+            session.rollback()
+        session.close()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# db-service modules import each other as top-level modules, and the shared
+# `common` package lives at the repository root
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SERVICE_DIR, os.path.dirname(SERVICE_DIR)]
@@ -0,0 +1,136 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import search
+from extensions import db
+from models import Board, Thread, Post
+from search import MemorySearchIndex, highlight, render_headline, START_SEL, STOP_SEL
+
+
+@pytest.fixture
+def db_session():
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine, tables=[Board.__table__, Thread.__table__, Post.__table__])
+    session = Session(engine)
+    yield session
+    session.close()
+    search.reset_memory_index(session)
+    engine.dispose()
+
+
+def test_highlight_marks_matched_words():
+    assert highlight("Lakers win again", {"lakers"}) == "<mark>Lakers</mark> win again"
+
+
+def test_highlight_escapes_html():
+    snippet = highlight('<script>alert("lakers")</script> & <b>lakers</b>', {"lakers"})
+    assert "<script>" not in snippet and "<b>" not in snippet
+    assert snippet == ("<mark>&lt;script&gt;alert(&quot;lakers&quot;)&lt;/script&gt;</mark> &amp; "
+                       "<mark>&lt;b&gt;lakers&lt;/b&gt;</mark>")
+
+
+def test_highlight_trims_around_first_match():
+    words = [f"w{i}" for i in range(50)] + ["celtics"]
+    snippet = highlight(" ".join(words), {"celtics"}, max_words=10)
+    assert snippet.split() == ["w45", "w46", "w47", "w48", "w49", "<mark>celtics</mark>"]
+
+
+def test_render_headline_escapes_text_and_keeps_marks():
+    headline = f'<img src=x onerror=alert(1)> {START_SEL}lakers{STOP_SEL} & co'
+    assert render_headline(headline) == "&lt;img src=x onerror=alert(1)&gt; <mark>lakers</mark> &amp; co"
+    assert render_headline(None) is None
+
+
+def test_memory_index_requires_every_term():
+    index = MemorySearchIndex()
+    index.add("thread", 1, {"board_id": 1, "title": "Lakers"}, "Lakers", "lakers beat the celtics")
+    index.add("thread", 2, {"board_id": 1, "title": "Celtics"}, "Celtics", "celtics in the playoffs")
+
+    results, next_cursor = index.search("lakers celtics", "thread", per_page=10)
+    assert [result["id"] for result in results] == [1]
+    assert next_cursor is None
+    assert index.search("lakers", "post", per_page=10) == ([], None)
+
+
+def test_memory_index_ranks_title_matches_first_and_paginates():
+    index = MemorySearchIndex()
+    index.add("thread", 1, {"board_id": 1, "title": "Draft"}, "Draft", "who will the lakers pick")
+    index.add("thread", 2, {"board_id": 1, "title": "Lakers"}, "Lakers", "trade rumours")
+    index.add("thread", 3, {"board_id": 1, "title": "Other"}, "Other", "nothing about the lakers here")
+
+    first, cursor = index.search("lakers", "thread", per_page=2)
+    assert first[0]["id"] == 2
+    assert cursor is not None
+    rest, cursor = index.search("lakers", "thread", per_page=2, after=cursor)
+    assert len(rest) == 1 and cursor is None
+    assert {result["id"] for result in first + rest} == {1, 2, 3}
+
+
+def test_memory_index_remove():
+    index = MemorySearchIndex()
+    index.add("post", 1, {"thread_id": 1}, None, "lakers")
+    index.remove("post", 1)
+    assert index.search("lakers", "post", per_page=10) == ([], None)
+
+
+def test_search_falls_back_to_memory_index_on_sqlite(db_session):
+    board = Board(name="Basketball", description="NBA talk")
+    db_session.add(board)
+    db_session.flush()
+    db_session.add(Thread(board_id=board.id, title="Playoffs", description="<i>lakers</i> or celtics?"))
+    db_session.commit()
+
+    results, next_cursor = search.search(db_session, "lakers", "thread")
+    assert next_cursor is None
+    assert len(results) == 1
+    assert results[0]["title"] == "Playoffs"
+    assert results[0]["highlight"] == "<mark>&lt;i&gt;lakers&lt;/i&gt;</mark> or celtics?"
+
+
+def test_search_fallback_index_follows_commits(db_session):
+    board = Board(name="Basketball", description="NBA talk")
+    db_session.add(board)
+    db_session.commit()
+    assert search.search(db_session, "lakers", "thread") == ([], None)
+
+    thread = Thread(board_id=board.id, title="Lakers", description="trade rumours")
+    db_session.add(thread)
+    db_session.commit()
+    assert [result["id"] for result in search.search(db_session, "lakers", "thread")[0]] == [thread.id]
+
+    db_session.delete(thread)
+    db_session.commit()
+    assert search.search(db_session, "lakers", "thread") == ([], None)
+
+
+def test_search_rejects_unknown_type(db_session):
+    with pytest.raises(ValueError):
+        search.search(db_session, "lakers", "user")
+
+
+def test_thread_search_filter_matches_literal_substrings(db_session):
+    board = Board(name="Basketball", description="NBA talk")
+    db_session.add(board)
+    db_session.flush()
+    db_session.add_all([
+        Thread(board_id=board.id, title="Lakers", description="100% sure they win"),
+        Thread(board_id=board.id, title="Celtics", description="1000 points"),
+    ])
+    db_session.commit()
+
+    def titles(query_text):
+        query = db_session.query(Thread).filter(search.thread_search_filter(db_session, query_text))
+        return sorted(thread.title for thread in query)
+
+    assert titles("aker") == ["Lakers"]
+    assert titles("100%") == ["Lakers"]
+    assert titles("1_0") == []
+
+
+def test_thread_search_filter_adds_full_text_match_on_postgres(db_session, monkeypatch):
+    from sqlalchemy.dialects import postgresql
+
+    monkeypatch.setattr(search, "uses_postgres", lambda session: True)
+    sql = str(search.thread_search_filter(db_session, "lakers").compile(dialect=postgresql.dialect()))
+    assert "ILIKE" in sql and "websearch_to_tsquery" in sql